@@ -13,9 +13,10 @@ from config import Config
 # Cargar variables de entorno
 load_dotenv()
 
-# Configurar logging
+# Configurar logging (LOG_LEVEL=DEBUG para el detalle de cada solicitud y de Socket.IO)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(),
@@ -46,17 +47,23 @@ try:
     cache.init_app(app)
     logger.info("Cache configurado")
 
-    # Configurar Socket.IO
+    # Configurar Socket.IO; con cola de mensajes, varios workers comparten los clientes
+    socketio_options = {}
+    if app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+        from socketio_queue import create_client_manager
+        socketio_options['client_manager'] = create_client_manager(app.config['SOCKETIO_MESSAGE_QUEUE'])
+        logger.info(f"Cola de mensajes de Socket.IO: {socketio_options['client_manager'].name}")
     socketio = SocketIO(
         app,
         async_mode='gevent',  # Cambiar a gevent ya que estamos usando gevent-websocket
-        logger=True,
-        engineio_logger=True,
+        logger=LOG_LEVEL == 'DEBUG',
+        engineio_logger=LOG_LEVEL == 'DEBUG',
         ping_timeout=60,
         ping_interval=25,
         manage_session=False,  # Evitar conflictos con la gestión de sesiones de Flask
         cors_allowed_origins="*",  # Use string instead of list
-        allow_upgrades=True
+        allow_upgrades=True,
+        **socketio_options
     )
     logger.info("SocketIO configurado")
 
@@ -71,16 +78,28 @@ try:
     init_db(app)
     logger.info("Base de datos inicializada")
 
+    # Métricas por solicitud, consultas SQL y perfilador opcional (ver /metrics)
+    from instrumentation import init_instrumentation
+    init_instrumentation(app)
+    logger.info("Instrumentación configurada")
+
+    # Retraso del bucle de eventos de gevent (ver offload y /api/metrics/event_loop)
+    from offload import start_loop_monitor
+    start_loop_monitor()
+
     # Inicializar login manager
     login_manager = LoginManager()
     login_manager.init_app(app)
     login_manager.login_view = 'login'
     logger.info("Login manager configurado")
 
+    # current_user es una copia en caché (TTL/LRU) del usuario: sin consulta por solicitud
+    from user_cache import load_cached_user, register_user_cache_events
+    register_user_cache_events()
+
     @login_manager.user_loader
     def load_user(user_id):
-        from models import User
-        return User.query.get(int(user_id))
+        return load_cached_user(user_id)
 
     # Endpoint de health check
     @app.route('/health')
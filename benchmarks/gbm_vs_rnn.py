@@ -0,0 +1,179 @@
+"""
+Benchmark: modelo GBM (LightGBM) vs. RNN-LSTM (create_rnn_model)
+---------------------------------------------------------------
+
+Ambos modelos se evalúan sobre la misma grilla horaria (estación × hora) y el
+mismo corte temporal de validación:
+- GBM: variables de tabular_models.build_features (rezagos >= 168 horas)
+- RNN: ventanas de las 24 horas previas con las 5 variables de MODEL_CONFIG
+  [hora, día_semana, mes, incidentes, tipo], una muestra aleatoria de celdas
+
+Se reporta tiempo de entrenamiento, throughput de inferencia (celdas/seg) al
+predecir la semana completa de todas las estaciones (149 × 168) y AUC.
+
+Uso (desde la raíz del proyecto, con DATABASE_URL configurada):
+    python -m benchmarks.gbm_vs_rnn --rnn-samples 20000 --rnn-epochs 10
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+RESULTS_PATH = 'benchmarks/results/gbm_vs_rnn.json'
+
+
+def _auc(y_true, y_score):
+    from sklearn.metrics import roc_auc_score
+    try:
+        return float(roc_auc_score(y_true, y_score))
+    except ValueError:
+        return None
+
+
+def _type_grid(incidents, start, n_stations, n_hours):
+    """Índice del tipo dominante por celda, codificado como LabelEncoder (orden alfabético)."""
+    from prediction_service import VALID_INCIDENT_TYPES
+    from stations import station_index
+    import pandas as pd
+
+    types = sorted(VALID_INCIDENT_TYPES)
+    per_type = np.zeros((n_stations, n_hours, len(types)), dtype=np.float32)
+    station_idx = incidents['nearest_station'].map(station_index())
+    hour_idx = (incidents['timestamp'].dt.floor('h') - start) / pd.Timedelta(hours=1)
+    type_idx = incidents['incident_type'].map({t: i for i, t in enumerate(types)})
+    valid = station_idx.notna() & type_idx.notna()
+    np.add.at(per_type, (station_idx[valid].astype(int).values,
+                         hour_idx[valid].astype(int).values,
+                         type_idx[valid].astype(int).values), 1)
+    return per_type.argmax(axis=2).astype(np.float32)
+
+
+def _rnn_windows(counts, type_grid, start, cells, sequence_length):
+    """Ventanas (n, sequence_length, 5) que terminan justo antes de cada celda (estación, hora)."""
+    import pandas as pd
+
+    stations, hours = cells
+    offsets = hours[:, None] - sequence_length + np.arange(sequence_length)[None, :]
+    times = pd.DatetimeIndex(start + pd.to_timedelta(offsets.ravel(), unit='h'))
+    windows = np.empty((len(hours), sequence_length, 5), dtype=np.float32)
+    windows[:, :, 0] = times.hour.values.reshape(offsets.shape)
+    windows[:, :, 1] = times.dayofweek.values.reshape(offsets.shape)
+    windows[:, :, 2] = times.month.values.reshape(offsets.shape)
+    windows[:, :, 3] = counts[stations[:, None], offsets]
+    windows[:, :, 4] = type_grid[stations[:, None], offsets]
+    return windows
+
+
+def run_benchmark(rnn_samples=20000, rnn_epochs=10, seed=42):
+    import lightgbm as lgb
+    from ml_models import MODEL_CONFIG, create_rnn_model
+    from tabular_models import (FEATURE_COLUMNS, GBM_CONFIG, _time_ordered_split,
+                                build_features, build_hourly_counts, load_incident_frame)
+
+    incidents = load_incident_frame()
+    if incidents.empty:
+        raise RuntimeError("No hay incidentes en la base de datos para el benchmark")
+
+    start = incidents['timestamp'].min().floor('h').to_pydatetime()
+    end = incidents['timestamp'].max().floor('h').to_pydatetime()
+    counts = build_hourly_counts(incidents, start, end)
+    n_stations, n_hours = counts.shape
+    sequence_length = MODEL_CONFIG['sequence_length']
+    target_hours = np.arange(max(168, sequence_length), n_hours)
+    split_hour = int(len(target_hours) * (1 - GBM_CONFIG['validation_split']))
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'incidents': int(len(incidents)),
+        'grid': {'stations': n_stations, 'hours': n_hours},
+    }
+
+    # --- GBM ---
+    X = build_features(counts, start, target_hours)
+    y = (counts[:, target_hours] > 0).astype(np.float32).reshape(-1)
+    X_train, y_train, X_val, y_val = _time_ordered_split(
+        X, y, len(target_hours), GBM_CONFIG['validation_split'])
+
+    t0 = time.perf_counter()
+    train_set = lgb.Dataset(X_train, y_train, feature_name=FEATURE_COLUMNS,
+                            categorical_feature=['station_idx'])
+    booster = lgb.train(GBM_CONFIG['params'], train_set,
+                        num_boost_round=GBM_CONFIG['num_boost_round'],
+                        valid_sets=[lgb.Dataset(X_val, y_val, reference=train_set)],
+                        callbacks=[lgb.early_stopping(GBM_CONFIG['early_stopping_rounds'], verbose=False)])
+    gbm_train = time.perf_counter() - t0
+
+    week = build_features(counts, start, np.arange(n_hours - 1, n_hours - 1 + 168))
+    t0 = time.perf_counter()
+    booster.predict(week)
+    gbm_infer = time.perf_counter() - t0
+    results['gbm'] = {
+        'train_rows': int(len(X_train)),
+        'train_seconds': round(gbm_train, 3),
+        'inference_cells': int(len(week)),
+        'inference_seconds': round(gbm_infer, 4),
+        'inference_cells_per_sec': round(len(week) / gbm_infer, 1),
+        'val_auc': _auc(y_val, booster.predict(X_val))
+    }
+    logging.info(f"GBM: {results['gbm']}")
+
+    # --- RNN ---
+    rng = np.random.default_rng(seed)
+    type_grid = _type_grid(incidents, start, n_stations, n_hours)
+    train_hours, val_hours = target_hours[:split_hour], target_hours[split_hour:]
+
+    def sample_cells(hours, n):
+        return (rng.integers(0, n_stations, n), rng.choice(hours, n))
+
+    n_val = max(1, int(rnn_samples * GBM_CONFIG['validation_split']))
+    train_cells = sample_cells(train_hours, rnn_samples - n_val)
+    val_cells = sample_cells(val_hours, n_val)
+    Xr_train = _rnn_windows(counts, type_grid, start, train_cells, sequence_length)
+    Xr_val = _rnn_windows(counts, type_grid, start, val_cells, sequence_length)
+    yr_train = (counts[train_cells] > 0).astype(np.float32)
+    yr_val = (counts[val_cells] > 0).astype(np.float32)
+
+    model = create_rnn_model()
+    t0 = time.perf_counter()
+    model.fit(Xr_train, yr_train, batch_size=MODEL_CONFIG['batch_size'], epochs=rnn_epochs, verbose=0)
+    rnn_train = time.perf_counter() - t0
+
+    all_cells = (np.repeat(np.arange(n_stations), 168),
+                 np.tile(np.clip(np.arange(n_hours - 168, n_hours), sequence_length, None), n_stations))
+    week_windows = _rnn_windows(counts, type_grid, start, all_cells, sequence_length)
+    model.predict(week_windows[:256], verbose=0)  # Calentamiento
+    t0 = time.perf_counter()
+    model.predict(week_windows, batch_size=1024, verbose=0)
+    rnn_infer = time.perf_counter() - t0
+    results['rnn'] = {
+        'train_rows': int(len(Xr_train)),
+        'epochs': rnn_epochs,
+        'train_seconds': round(rnn_train, 3),
+        'inference_cells': int(len(week_windows)),
+        'inference_seconds': round(rnn_infer, 4),
+        'inference_cells_per_sec': round(len(week_windows) / rnn_infer, 1),
+        'val_auc': _auc(yr_val, model.predict(Xr_val, batch_size=1024, verbose=0).ravel())
+    }
+    logging.info(f"RNN: {results['rnn']}")
+
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, 'w') as f:
+        json.dump(results, f, indent=2)
+    logging.info(f"Resultados guardados en {RESULTS_PATH}")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Benchmark GBM vs RNN")
+    parser.add_argument('--rnn-samples', type=int, default=20000)
+    parser.add_argument('--rnn-epochs', type=int, default=10)
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        run_benchmark(rnn_samples=args.rnn_samples, rnn_epochs=args.rnn_epochs)
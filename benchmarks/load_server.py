@@ -0,0 +1,62 @@
+"""
+Servidor para las pruebas de carga
+----------------------------------
+
+Arranca la aplicación igual que main.py (monkey patch de gevent, psycopg2
+cooperativo, socketio.run) y agrega un único endpoint de benchmark:
+
+    POST /_benchmark/predictions_updated
+
+que emite 'predictions_updated' a todos los clientes con el mismo contenido
+que update_predictions_periodically (caché de predicciones + troncal), más la
+marca 'emitted_at' (time.time() del servidor) para medir la latencia de
+entrega. La generación de predicciones no se incluye en la medición.
+
+Uso (lo lanza benchmarks.load_test; desde la raíz del proyecto):
+    python -m benchmarks.load_server --port 5055
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import logging
+import time
+from datetime import datetime
+
+from database import make_psycopg2_green
+
+make_psycopg2_green()
+
+from flask import jsonify  # noqa: E402
+
+from app import app, socketio  # noqa: E402
+
+
+@app.route('/_benchmark/predictions_updated', methods=['POST'])
+def benchmark_predictions_updated():
+    from prediction_service import get_cached_predictions
+    from stations import load_stations
+
+    predictions = get_cached_predictions()
+    station_to_troncal = {station['nombre']: station['troncal'] for station in load_stations()}
+    for prediction in predictions:
+        prediction['troncal'] = station_to_troncal.get(prediction['station'], 'N/A')
+
+    emitted_at = time.time()
+    socketio.emit('predictions_updated', {
+        'timestamp': datetime.now().isoformat(),
+        'prediction_count': len(predictions),
+        'predictions': predictions,
+        'update_type': 'benchmark',
+        'emitted_at': emitted_at
+    }, namespace='/')
+    return jsonify({'prediction_count': len(predictions),
+                    'emit_ms': round((time.time() - emitted_at) * 1000, 3)})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de la aplicación para pruebas de carga")
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+    logging.info(f"Servidor de benchmark en puerto {args.port}")
+    socketio.run(app, host='127.0.0.1', port=args.port, debug=False, use_reloader=False, log_output=False)
@@ -0,0 +1,509 @@
+"""
+Pruebas de carga HTTP y Socket.IO de extremo a extremo
+-----------------------------------------------------
+
+Arranca la aplicación (benchmarks.load_server) sobre una base de datos con
+incidentes sintéticos (synthetic_data.py) y ejecuta, para cada nivel de
+concurrencia, carga sostenida durante --duration segundos sobre:
+
+- GET  /api/predictions
+- GET  /api/statistics
+- GET  /incidents
+- GET  /api/notifications
+- POST /report_incident (formulario con token CSRF)
+
+Por escenario y concurrencia se registra throughput, latencias p50/p95/p99,
+errores y el pico de memoria (RSS) del servidor. Para Socket.IO se conectan
+N clientes y se mide la latencia de entrega de 'predictions_updated' (desde la
+emisión en el servidor hasta la recepción en cada cliente).
+
+Los resultados se comparan con la línea base guardada (--save-baseline para
+crearla o actualizarla). Una caída de throughput o un aumento de p95/p99 o de
+memoria mayor a --tolerance se reporta como regresión y el proceso termina
+con error.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.load_test --seed-rows 100000 --save-baseline
+    python -m benchmarks.load_test --database-url postgresql://... --seed-rows 0
+    python -m benchmarks.load_test --url http://localhost:5000 --scenarios predictions,statistics
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import requests
+
+from bogota_clock import bogota_now
+
+RESULTS_PATH = 'benchmarks/results/load_test.json'
+BASELINE_PATH = 'benchmarks/baselines/load_test.json'
+DEFAULT_DATABASE = 'benchmarks/results/load_test.db'
+
+LOAD_TEST_CONFIG = {
+    'concurrency': [1, 8, 32],
+    'duration_seconds': 10,
+    'warmup_seconds': 1.0,       # Carga sin medir antes de cada escenario
+    'request_timeout_seconds': 60,
+    'seed_rows': 100_000,
+    # Rango y semilla fijos: la misma base sintética en cada corrida y en la línea base
+    'seed_start': '2024-01-01',
+    'seed_end': '2025-01-01',
+    'seed': 42,
+    'socket_clients': [10, 50],
+    'socket_rounds': 3,
+    'socket_timeout_seconds': 60,
+    'tolerance': 0.2,            # Variación relativa permitida frente a la línea base
+    'memory_sample_seconds': 0.25,
+    'username': 'loadtest',
+    'password': 'loadtest-password'
+}
+
+_CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+# --- Escenarios HTTP ---
+
+def _predictions(session, base_url, context):
+    return session.get(f"{base_url}/api/predictions", timeout=context['timeout'])
+
+
+def _statistics(session, base_url, context):
+    return session.get(f"{base_url}/api/statistics", timeout=context['timeout'])
+
+
+def _incidents(session, base_url, context):
+    return session.get(f"{base_url}/incidents", timeout=context['timeout'],
+                       params={'station': random.choice(context['stations'])['nombre']})
+
+
+def _notifications(session, base_url, context):
+    return session.get(f"{base_url}/api/notifications", timeout=context['timeout'])
+
+
+def _report_incident(session, base_url, context):
+    station = random.choice(context['stations'])
+    # El servidor valida la fecha del reporte contra la hora de Bogotá
+    now = bogota_now()
+    response = session.post(f"{base_url}/report_incident", allow_redirects=False,
+                            timeout=context['timeout'], data={
+        'csrf_token': context['csrf_token'],
+        'incident_type': random.choice(context['incident_types']),
+        'description': 'load test',
+        'incident_date': now.strftime('%Y-%m-%d'),
+        'incident_time': now.strftime('%H:%M'),
+        'station': station['nombre'],
+        'nearest_station': station['nombre'],
+        'latitude': station['latitude'],
+        'longitude': station['longitude']
+    })
+    # Éxito: redirección a /home; cualquier otra redirección es un error del formulario
+    if response.status_code == 302 and not response.headers.get('Location', '').endswith('/home'):
+        response.status_code = 422
+    return response
+
+
+SCENARIOS = {
+    'predictions': _predictions,
+    'statistics': _statistics,
+    'incidents': _incidents,
+    'notifications': _notifications,
+    'report_incident': _report_incident
+}
+
+
+# --- Servidor y memoria ---
+
+def read_rss_mb(pid):
+    """RSS actual y pico (VmHWM) del proceso en MB según /proc (solo Linux)."""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, value = line.split(':', 1)
+                    values[key] = int(value.split()[0]) / 1024
+    except OSError:
+        return None, None
+    return values.get('VmRSS'), values.get('VmHWM')
+
+
+class MemorySampler:
+    """Muestrea el RSS del servidor en segundo plano y guarda el pico del intervalo."""
+
+    def __init__(self, pid, interval):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.pid is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss, _ = read_rss_mb(self.pid)
+            if rss is not None:
+                self.peak_mb = rss if self.peak_mb is None else max(self.peak_mb, rss)
+            self._stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def seed_database(database_url, rows, config=LOAD_TEST_CONFIG):
+    """Reemplaza los incidentes de la base de benchmark por `rows` incidentes sintéticos."""
+    logging.info(f"Generando {rows} incidentes sintéticos en {database_url}")
+    env = dict(os.environ, DATABASE_URL=database_url)
+    subprocess.run([sys.executable, 'synthetic_data.py', '--rows', str(rows), '--output', 'db',
+                    '--start', config['seed_start'], '--end', config['seed_end'],
+                    '--seed', str(config['seed']), '--replace'],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def start_server(database_url, port, log_path):
+    env = dict(os.environ, DATABASE_URL=database_url)
+    log_file = open(log_path, 'w')
+    process = subprocess.Popen([sys.executable, '-m', 'benchmarks.load_server', '--port', str(port)],
+                               env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (ver {log_path})")
+        try:
+            if requests.get(f"{base_url}/health", timeout=2).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"El servidor no respondió en 120 s (ver {log_path})")
+
+
+def _csrf_token(session, url):
+    match = _CSRF_RE.search(session.get(url).text)
+    if not match:
+        raise RuntimeError(f"No se encontró el token CSRF en {url}")
+    return match.group(1)
+
+
+def login(base_url, username, password):
+    """Registra (si no existe) e inicia sesión con el usuario de carga; devuelve la sesión."""
+    session = requests.Session()
+    session.post(f"{base_url}/register", data={
+        'csrf_token': _csrf_token(session, f"{base_url}/register"),
+        'username': username, 'email': f"{username}@example.com",
+        'password': password, 'password2': password
+    }, allow_redirects=False)
+    response = session.post(f"{base_url}/login", data={
+        'csrf_token': _csrf_token(session, f"{base_url}/login"),
+        'username': username, 'password': password
+    }, allow_redirects=False)
+    if response.status_code != 302 or not response.headers.get('Location', '').endswith('/home'):
+        raise RuntimeError(f"No se pudo iniciar sesión como {username}")
+    return session
+
+
+# --- Carga HTTP ---
+
+def _summarize(latencies_ms, errors, elapsed, peak_mb):
+    latencies = np.array(latencies_ms, dtype=np.float64)
+    summary = {
+        'requests': int(len(latencies)),
+        'errors': int(errors),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'rss_peak_mb': round(peak_mb, 1) if peak_mb is not None else None
+    }
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary.update({'p50_ms': round(p50, 2), 'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2),
+                        'max_ms': round(float(latencies.max()), 2)})
+    return summary
+
+
+def run_scenario(name, base_url, base_session, context, concurrency, duration, config, server_pid=None):
+    """Carga sostenida de un escenario con `concurrency` clientes durante `duration` segundos."""
+    scenario = SCENARIOS[name]
+    latencies_ms = []
+    errors = [0]
+    lock = threading.Lock()
+    # (inicio, fin) de la ventana medida; antes de fijarla la carga es de calentamiento
+    window = [None, None]
+    cookies = base_session.cookies
+
+    def worker():
+        session = requests.Session()
+        session.cookies.update(cookies)
+        local_latencies, local_errors = [], 0
+        while window[1] is None or time.perf_counter() < window[1]:
+            start = time.perf_counter()
+            try:
+                ok = scenario(session, base_url, context).status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            # Cada solicitud parte de la sesión inicial (sin mensajes flash acumulados)
+            session.cookies.clear()
+            session.cookies.update(cookies)
+            if window[0] is None or start < window[0]:
+                continue
+            if ok:
+                local_latencies.append(elapsed)
+            else:
+                local_errors += 1
+        with lock:
+            latencies_ms.extend(local_latencies)
+            errors[0] += local_errors
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(worker) for _ in range(concurrency)]
+        time.sleep(config['warmup_seconds'])
+        with MemorySampler(server_pid, config['memory_sample_seconds']) as sampler:
+            started = time.perf_counter()
+            window[:] = [started, started + duration]
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - started
+    summary = _summarize(latencies_ms, errors[0], elapsed, sampler.peak_mb)
+    logging.info(f"{name} x{concurrency}: {summary}")
+    return summary
+
+
+# --- Socket.IO ---
+
+def run_socketio(base_url, base_session, n_clients, rounds, timeout):
+    """
+    Conecta `n_clients` clientes y mide la entrega de 'predictions_updated'
+    emitido por /_benchmark/predictions_updated (servidor y clientes en el mismo host).
+    """
+    import socketio
+
+    received = []
+    lock = threading.Lock()
+    all_received = threading.Event()
+    expected = [0]
+
+    def on_update(data):
+        now = time.time()
+        with lock:
+            received.append((now - data.get('emitted_at', now)) * 1000)
+            if len(received) >= expected[0]:
+                all_received.set()
+
+    clients = []
+    connect_start = time.perf_counter()
+    try:
+        for _ in range(n_clients):
+            client = socketio.Client(reconnection=False)
+            client.on('predictions_updated', on_update)
+            client.connect(base_url, wait_timeout=timeout)
+            clients.append(client)
+        connect_seconds = time.perf_counter() - connect_start
+
+        delivery_ms, missing, payload_count = [], 0, None
+        for _ in range(rounds):
+            with lock:
+                received.clear()
+                expected[0] = n_clients
+                all_received.clear()
+            response = base_session.post(f"{base_url}/_benchmark/predictions_updated", timeout=timeout)
+            if response.status_code == 404:
+                logging.warning("El servidor no expone /_benchmark/predictions_updated "
+                                "(arrancarlo con benchmarks.load_server); se omite Socket.IO")
+                return None
+            response.raise_for_status()
+            payload_count = response.json()['prediction_count']
+            all_received.wait(timeout)
+            with lock:
+                delivery_ms.extend(received)
+                missing += n_clients - len(received)
+    finally:
+        for client in clients:
+            client.disconnect()
+
+    latencies = np.array(delivery_ms, dtype=np.float64)
+    summary = {
+        'clients': n_clients,
+        'rounds': rounds,
+        'predictions_per_message': payload_count,
+        'connect_seconds': round(connect_seconds, 3),
+        'delivered': int(len(latencies)),
+        'missing': int(missing)
+    }
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary.update({'p50_ms': round(p50, 2), 'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2),
+                        'max_ms': round(float(latencies.max()), 2)})
+    logging.info(f"predictions_updated x{n_clients}: {summary}")
+    return summary
+
+
+# --- Línea base ---
+
+# Métrica -> True si un valor mayor es peor
+_COMPARED_METRICS = {
+    'throughput_rps': False,
+    'p95_ms': True,
+    'p99_ms': True,
+    'rss_peak_mb': True
+}
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Returns:
+        list: Descripción de cada métrica que empeoró más de `tolerance`
+    """
+    regressions = []
+    for section in ('http', 'socketio'):
+        for name, levels in results.get(section, {}).items():
+            for level, current in (levels or {}).items():
+                reference = baseline.get(section, {}).get(name, {}).get(level)
+                if not reference or not current:
+                    continue
+                for metric, higher_is_worse in _COMPARED_METRICS.items():
+                    new, old = current.get(metric), reference.get(metric)
+                    if new is None or not old:
+                        continue
+                    change = (new - old) / old
+                    if (change > tolerance) if higher_is_worse else (change < -tolerance):
+                        regressions.append(f"{section}.{name}[{level}].{metric}: {old} -> {new} "
+                                           f"({change:+.0%})")
+                if current.get('errors', 0) > reference.get('errors', 0):
+                    regressions.append(f"{section}.{name}[{level}].errors: "
+                                       f"{reference.get('errors', 0)} -> {current['errors']}")
+    return regressions
+
+
+def run_load_test(base_url=None, database_url=None, seed_rows=None, port=5055,
+                  scenarios=None, concurrency=None, duration=None, socket_clients=None,
+                  config=LOAD_TEST_CONFIG):
+    from stations import load_stations
+    from rollups import incident_types
+
+    process = None
+    server_pid = None
+    if base_url is None:
+        os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+        if database_url is None:
+            database_url = f"sqlite:///{os.path.abspath(DEFAULT_DATABASE)}"
+            seed_rows = config['seed_rows'] if seed_rows is None else seed_rows
+        if seed_rows:
+            seed_database(database_url, seed_rows, config)
+        process, base_url = start_server(database_url, port, 'benchmarks/results/load_server.log')
+        server_pid = process.pid
+
+    scenarios = scenarios or list(SCENARIOS)
+    concurrency = concurrency or config['concurrency']
+    duration = duration or config['duration_seconds']
+    socket_clients = config['socket_clients'] if socket_clients is None else socket_clients
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'base_url': base_url,
+        'database': (database_url or '').split('@')[-1],
+        'seed_rows': seed_rows,
+        'duration_seconds': duration,
+        'http': {},
+        'socketio': {}
+    }
+    try:
+        session = login(base_url, config['username'], config['password'])
+        context = {
+            'stations': load_stations(),
+            'incident_types': incident_types(),
+            'csrf_token': _csrf_token(session, f"{base_url}/report_incident"),
+            'timeout': config['request_timeout_seconds']
+        }
+        # El caché de predicciones se genera una vez fuera de la medición
+        session.get(f"{base_url}/api/predictions", timeout=config['request_timeout_seconds'])
+
+        for name in scenarios:
+            results['http'][name] = {}
+            for level in concurrency:
+                results['http'][name][str(level)] = run_scenario(
+                    name, base_url, session, context, level, duration, config, server_pid)
+
+        for n_clients in socket_clients:
+            summary = run_socketio(base_url, session, n_clients, config['socket_rounds'],
+                                   config['socket_timeout_seconds'])
+            if summary is None:
+                break
+            results['socketio'].setdefault('predictions_updated', {})[str(n_clients)] = summary
+
+        if server_pid is not None:
+            rss, hwm = read_rss_mb(server_pid)
+            results['server_memory'] = {'rss_mb': round(rss, 1) if rss else None,
+                                        'peak_rss_mb': round(hwm, 1) if hwm else None}
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, 'w') as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description="Pruebas de carga HTTP y Socket.IO")
+    parser.add_argument('--url', help="Servidor ya iniciado (por defecto se arranca benchmarks.load_server)")
+    parser.add_argument('--database-url', help=f"Base de datos del servidor (por defecto {DEFAULT_DATABASE})")
+    parser.add_argument('--seed-rows', type=int, default=None,
+                        help="Incidentes sintéticos a generar (reemplaza los existentes). "
+                             f"Por defecto {LOAD_TEST_CONFIG['seed_rows']} solo con la base por defecto")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=_int_list, default=None, help="Ej.: 1,8,32")
+    parser.add_argument('--duration', type=float, default=None, help="Segundos por escenario y nivel")
+    parser.add_argument('--socket-clients', type=_int_list, default=None, help="Ej.: 10,50 (vacío para omitir)")
+    parser.add_argument('--tolerance', type=float, default=LOAD_TEST_CONFIG['tolerance'])
+    parser.add_argument('--save-baseline', action='store_true',
+                        help=f"Guardar los resultados como línea base en {BASELINE_PATH}")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios.split(',')) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Escenarios desconocidos: {sorted(unknown)}")
+
+    results = run_load_test(base_url=args.url, database_url=args.database_url, seed_rows=args.seed_rows,
+                            port=args.port, scenarios=args.scenarios.split(','),
+                            concurrency=args.concurrency, duration=args.duration,
+                            socket_clients=args.socket_clients)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Línea base guardada en {BASELINE_PATH}")
+    elif os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit("Regresiones frente a la línea base:\n  " + "\n  ".join(regressions))
+        print(f"Sin regresiones frente a {BASELINE_PATH} (tolerancia {args.tolerance:.0%})")
+    else:
+        print(f"No hay línea base en {BASELINE_PATH}; usar --save-baseline para crearla")
@@ -0,0 +1,335 @@
+"""
+Micro-benchmarks de las rutas críticas de ML
+-------------------------------------------
+
+Mide, con rondas calibradas al estilo de pytest-benchmark (calentamiento,
+mínimo de rondas y presupuesto de tiempo por función), las funciones de
+preparación de datos, el caché de predicciones y la inferencia:
+
+- ml_models.prepare_data / prepare_sequence_data
+- prediction_service.prepare_prediction_data / enhanced_fallback_prediction
+- prediction_service.generate_prediction_cache(24 y 168 horas) / get_cached_predictions
+- Inferencia del artefacto RNN (rnn_inference) con un lote de 1 y lotes mayores
+
+Las funciones que dependen de la historia se miden con varios tamaños de base
+de datos (incidentes de synthetic_data.py en una base SQLite propia) para
+obtener curvas de escalamiento; el exponente es la pendiente log-log de la
+mediana frente al tamaño (1 = lineal). El reporte se guarda en
+benchmarks/results/ml_hot_paths.json y, si matplotlib está instalado, las
+curvas en benchmarks/results/ml_hot_paths.png.
+
+predictions_cache.json, el caché compartido (prediction_store) y el estado de
+características en vivo (live_features) se respaldan antes de medir y se
+restauran al terminar.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.ml_hot_paths --sizes 1000,10000,100000
+    python -m benchmarks.ml_hot_paths --baseline benchmarks/results/ml_hot_paths.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+RESULTS_PATH = 'benchmarks/results/ml_hot_paths.json'
+PLOT_PATH = 'benchmarks/results/ml_hot_paths.png'
+DEFAULT_DATABASE = 'benchmarks/results/ml_hot_paths.db'
+PREDICTIONS_CACHE_PATH = 'predictions_cache.json'
+
+MICRO_BENCHMARK_CONFIG = {
+    'sizes': [1_000, 10_000, 100_000],
+    'history_days': 90,              # Rango de fechas de los incidentes sintéticos
+    'warmup_rounds': 1,
+    'min_rounds': 5,
+    'max_time_seconds': 2.0,         # Presupuesto por función (se respeta min_rounds)
+    'max_sequence_rows': 20_000,     # prepare_sequence_data recorre fila a fila
+    'inference_batches': [1, 149, 149 * 24],
+    'tolerance': 0.25                # Aumento de la mediana permitido frente a la línea base
+}
+
+
+def benchmark(function, config=MICRO_BENCHMARK_CONFIG):
+    """
+    Ejecuta `function` con calentamiento y rondas repetidas.
+
+    Returns:
+        dict: Estadísticas en milisegundos (min, max, mean, stddev, median, iqr),
+            rondas y operaciones por segundo
+    """
+    for _ in range(config['warmup_rounds']):
+        function()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < config['min_rounds'] or time.perf_counter() - started < config['max_time_seconds']:
+        t0 = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings = np.array(timings)
+    q1, median, q3 = np.percentile(timings, [25, 50, 75])
+    return {
+        'rounds': int(len(timings)),
+        'min_ms': round(float(timings.min()), 4),
+        'max_ms': round(float(timings.max()), 4),
+        'mean_ms': round(float(timings.mean()), 4),
+        'stddev_ms': round(float(timings.std(ddof=1)) if len(timings) > 1 else 0.0, 4),
+        'median_ms': round(float(median), 4),
+        'iqr_ms': round(float(q3 - q1), 4),
+        'ops': round(1000.0 / float(timings.mean()), 2) if timings.mean() else None
+    }
+
+
+def scaling_exponent(points):
+    """Pendiente log-log de la mediana frente al tamaño (None con menos de dos puntos)."""
+    points = [(size, ms) for size, ms in points if size > 0 and ms > 0]
+    if len(points) < 2:
+        return None
+    x = np.log([size for size, _ in points])
+    y = np.log([ms for _, ms in points])
+    return round(float(np.polyfit(x, y, 1)[0]), 3)
+
+
+def seed_incidents(rows, history_days):
+    """Reemplaza los incidentes de la base de benchmark por `rows` incidentes que terminan ahora."""
+    from datetime import timedelta
+    from synthetic_data import SyntheticIncidentModel, write_database
+
+    end = datetime.now().replace(minute=0, second=0, microsecond=0)
+    model = SyntheticIncidentModel(end - timedelta(days=history_days), end)
+    write_database(model, rows, chunk_size=rows, replace=True)
+
+
+def _busiest_station():
+    from sqlalchemy import func
+    from database import db
+    from models import Incident
+
+    row = db.session.query(Incident.nearest_station, func.count(Incident.id)) \
+        .group_by(Incident.nearest_station).order_by(func.count(Incident.id).desc()).first()
+    return row[0] if row else None
+
+
+def _reset_process_caches():
+    """Descarta el estado derivado de la base anterior (motor bayesiano, índices en memoria)."""
+    import live_features
+    import prediction_resolver
+    import prediction_store
+    import risk_engine
+    import rollups
+
+    risk_engine._engine = None
+    rollups._snapshot_cache.clear()
+    if os.path.exists(rollups.ROLLUP_SNAPSHOT_CONFIG['path']):
+        os.remove(rollups.ROLLUP_SNAPSHOT_CONFIG['path'])
+    prediction_resolver._memory_index.clear()
+    prediction_store._views.clear()
+    live_features._state = None
+    if os.path.exists(live_features.LIVE_FEATURES_CONFIG['snapshot_path']):
+        os.remove(live_features.LIVE_FEATURES_CONFIG['snapshot_path'])
+
+
+def run_size(rows, config):
+    """Mide las funciones que dependen de la historia con `rows` incidentes."""
+    from ml_models import MODEL_CONFIG, prepare_data, prepare_sequence_data
+    from prediction_service import (enhanced_fallback_prediction, generate_prediction_cache,
+                                    get_cached_predictions, prepare_prediction_data)
+
+    seed_incidents(rows, config['history_days'])
+    _reset_process_caches()
+    station = _busiest_station()
+    now = datetime.now()
+    results = {}
+
+    results['prepare_data'] = benchmark(prepare_data, config)
+
+    data = prepare_data()
+    if len(data) <= config['max_sequence_rows']:
+        results['prepare_sequence_data'] = benchmark(
+            lambda: prepare_sequence_data(data, MODEL_CONFIG['sequence_length']), config)
+    else:
+        results['prepare_sequence_data'] = {'skipped': f"más de {config['max_sequence_rows']} filas"}
+
+    results['prepare_prediction_data'] = benchmark(lambda: prepare_prediction_data(station, now.hour), config)
+    # Con poca historia reciente la función retorna None antes de armar la secuencia
+    results['prepare_prediction_data']['returned_sequence'] = prepare_prediction_data(station, now.hour) is not None
+    results['enhanced_fallback_prediction'] = benchmark(
+        lambda: enhanced_fallback_prediction(station, now), config)
+    results['generate_prediction_cache_24h'] = benchmark(lambda: generate_prediction_cache(hours_ahead=24), config)
+    results['generate_prediction_cache_168h'] = benchmark(lambda: generate_prediction_cache(hours_ahead=168), config)
+    # Lee el caché de 168 horas que dejó la medición anterior
+    results['get_cached_predictions'] = benchmark(get_cached_predictions, config)
+
+    for name, stats in results.items():
+        print(f"[{rows}] {name}: {stats.get('median_ms', stats)} ms")
+    return results
+
+
+def run_inference(config):
+    """Inferencia del artefacto RNN exportado con distintos tamaños de lote."""
+    from ml_models import MODEL_CONFIG
+    from rnn_inference import load_inference_model
+
+    model = load_inference_model()
+    if model is None:
+        return {'skipped': 'no hay artefacto de inferencia en models/'}
+    rng = np.random.default_rng(0)
+    shape = (MODEL_CONFIG['sequence_length'], MODEL_CONFIG['n_features'])
+    results = {'model_format': model.model_format}
+    for batch in config['inference_batches']:
+        x = rng.random((batch,) + shape, dtype=np.float32)
+        stats = benchmark(lambda: model.predict(x), config)
+        stats['samples_per_second'] = round(batch * 1000.0 / stats['mean_ms'], 1)
+        results[str(batch)] = stats
+        print(f"inference x{batch}: {stats['median_ms']} ms")
+    # Lote vs. una llamada por muestra para el mismo número de muestras
+    batch = config['inference_batches'][-1]
+    x = rng.random((batch,) + shape, dtype=np.float32)
+    stats = benchmark(lambda: [model.predict(x[i:i + 1]) for i in range(batch)], config)
+    stats['samples_per_second'] = round(batch * 1000.0 / stats['mean_ms'], 1)
+    results[f'{batch}_single_calls'] = stats
+    return results
+
+
+def scaling_curves(by_size):
+    """{función: {'points': [[tamaño, mediana_ms], ...], 'exponent': pendiente}}"""
+    curves = {}
+    for size, results in sorted(by_size.items(), key=lambda item: int(item[0])):
+        for name, stats in results.items():
+            if 'median_ms' in stats:
+                curves.setdefault(name, {'points': []})['points'].append([int(size), stats['median_ms']])
+    for curve in curves.values():
+        curve['exponent'] = scaling_exponent(curve['points'])
+    return curves
+
+
+def plot_curves(curves, path=PLOT_PATH):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        logging.info("matplotlib no está instalado; se omite el gráfico de escalamiento")
+        return None
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for name, curve in curves.items():
+        sizes, medians = zip(*curve['points'])
+        ax.plot(sizes, medians, marker='o', label=f"{name} (k={curve['exponent']})")
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel('Incidentes')
+    ax.set_ylabel('Mediana (ms)')
+    ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Returns:
+        list: Funciones cuya mediana aumentó más de `tolerance` frente a la línea base
+    """
+    def medians(report):
+        flat = {f"sizes[{size}].{name}": stats for size, by_name in report.get('sizes', {}).items()
+                for name, stats in by_name.items()}
+        flat.update({f"inference[{name}]": stats for name, stats in report.get('inference', {}).items()})
+        return {label: stats['median_ms'] for label, stats in flat.items()
+                if isinstance(stats, dict) and stats.get('median_ms')}
+
+    reference = medians(baseline)
+    regressions = []
+    for label, new in medians(results).items():
+        old = reference.get(label)
+        if old and (new - old) / old > tolerance:
+            regressions.append(f"{label}: {old} -> {new} ms ({(new - old) / old:+.0%})")
+    return regressions
+
+
+def run_benchmark(sizes=None, config=MICRO_BENCHMARK_CONFIG):
+    from app import app
+    from database import create_tables
+
+    create_tables(app)
+    # Se mide el código, no el logging de la aplicación
+    logging.getLogger().setLevel(logging.ERROR)
+    sizes = sizes or config['sizes']
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'config': {key: value for key, value in config.items() if key != 'tolerance'},
+        'sizes': {}
+    }
+
+    from live_features import LIVE_FEATURES_CONFIG
+    from prediction_store import PREDICTION_STORE_CONFIG
+
+    cache_backup = {}
+    for path in (PREDICTIONS_CACHE_PATH, PREDICTION_STORE_CONFIG['path'], LIVE_FEATURES_CONFIG['snapshot_path']):
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                cache_backup[path] = f.read()
+        else:
+            cache_backup[path] = None
+    try:
+        with app.app_context():
+            for rows in sizes:
+                results['sizes'][str(rows)] = run_size(rows, config)
+            results['inference'] = run_inference(config)
+    finally:
+        for path, content in cache_backup.items():
+            if content is not None:
+                with open(path, 'wb') as f:
+                    f.write(content)
+            elif os.path.exists(path):
+                os.remove(path)
+
+    results['scaling'] = scaling_curves(results['sizes'])
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, 'w') as f:
+        json.dump(results, f, indent=2)
+    results['plot'] = plot_curves(results['scaling'])
+    return results
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de las rutas críticas de ML")
+    parser.add_argument('--sizes', type=_int_list, default=None, help="Incidentes por corrida, ej.: 1000,10000")
+    parser.add_argument('--database-url', default=None,
+                        help=f"Base de datos a usar (sus incidentes se reemplazan; por defecto {DEFAULT_DATABASE})")
+    parser.add_argument('--max-time', type=float, default=None, help="Segundos por función")
+    parser.add_argument('--baseline', help="Reporte anterior con el que comparar las medianas")
+    parser.add_argument('--tolerance', type=float, default=MICRO_BENCHMARK_CONFIG['tolerance'])
+    args = parser.parse_args()
+
+    # La base se fija antes de importar la aplicación
+    os.makedirs(os.path.dirname(DEFAULT_DATABASE), exist_ok=True)
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.abspath(DEFAULT_DATABASE)}"
+    config = dict(MICRO_BENCHMARK_CONFIG)
+    if args.max_time is not None:
+        config['max_time_seconds'] = args.max_time
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run_benchmark(args.sizes, config)
+    for name, curve in results['scaling'].items():
+        print(f"{name}: exponente {curve['exponent']} {curve['points']}")
+
+    if baseline is not None:
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit("Regresiones frente a la línea base:\n  " + "\n  ".join(regressions))
+        print(f"Sin regresiones frente a {args.baseline} (tolerancia {args.tolerance:.0%})")
@@ -0,0 +1,197 @@
+"""
+Capacidad de conexiones Socket.IO por worker
+-------------------------------------------
+
+Arranca --workers procesos de benchmarks.load_server (gevent) en puertos
+consecutivos, compartiendo la cola de mensajes SOCKETIO_MESSAGE_QUEUE, y abre
+--connections clientes websocket repartidos entre ellos (asyncio + aiohttp,
+por lotes de --ramp-batch). Luego publica un evento con el emisor de solo
+escritura (socketio_queue.emit_event) desde este proceso y mide:
+
+- Conexiones exitosas y fallidas, latencia de conexión p50/p95/p99
+- Memoria (RSS) por worker antes y después, y KB por conexión
+- Entrega del evento publicado por la cola: clientes alcanzados por worker y
+  latencia p50/p95/p99 (mismo host: se compara time.time())
+
+Con muchos clientes el límite de descriptores de archivo (ulimit -n) aplica
+tanto a este proceso como a los workers; el script sube el límite blando al
+máximo permitido antes de arrancarlos. Para decenas de miles de conexiones
+conviene lanzar varias instancias del script contra distintos puertos (--port).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.socket_capacity --workers 4 --connections 20000
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 python -m benchmarks.socket_capacity --workers 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+RESULTS_PATH = 'benchmarks/results/socket_capacity.json'
+DEFAULT_QUEUE = 'benchmarks/results/socketio_queue.db'
+DEFAULT_DATABASE = 'benchmarks/results/load_test.db'
+
+SOCKET_CAPACITY_CONFIG = {
+    'workers': 2,
+    'connections': 2000,
+    'ramp_batch': 250,
+    'connect_timeout_seconds': 30,
+    'delivery_timeout_seconds': 30,
+    'port': 5100
+}
+
+
+def _raise_file_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        return hard
+    except (ImportError, ValueError, OSError):
+        return None
+
+
+def _percentiles(values_ms):
+    if not values_ms:
+        return {}
+    p50, p95, p99 = np.percentile(np.array(values_ms, dtype=np.float64), [50, 95, 99])
+    return {'p50_ms': round(p50, 2), 'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2),
+            'max_ms': round(float(max(values_ms)), 2)}
+
+
+async def _connect_all(urls, connections, ramp_batch, timeout, received):
+    import socketio
+
+    clients, connect_ms, failures = [], [], 0
+
+    async def connect(index):
+        url = urls[index % len(urls)]
+        client = socketio.AsyncClient(reconnection=False)
+
+        @client.on('capacity_probe')
+        async def on_probe(data):
+            received.append((url, (time.time() - data['sent_at']) * 1000))
+
+        start = time.perf_counter()
+        await client.connect(url, transports=['websocket'], wait_timeout=timeout)
+        connect_ms.append((time.perf_counter() - start) * 1000)
+        return client
+
+    for offset in range(0, connections, ramp_batch):
+        batch = range(offset, min(offset + ramp_batch, connections))
+        results = await asyncio.gather(*(connect(i) for i in batch), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                failures += 1
+            else:
+                clients.append(result)
+        logging.info(f"Conectados {len(clients)}/{connections} (fallidos: {failures})")
+    return clients, connect_ms, failures
+
+
+async def _run_clients(urls, connections, config, workers):
+    from socketio_queue import emit_event
+    from benchmarks.load_test import read_rss_mb
+
+    received = []
+    rss_before = {url: read_rss_mb(pid)[0] for url, pid in workers.items()}
+    clients, connect_ms, failures = await _connect_all(
+        urls, connections, config['ramp_batch'], config['connect_timeout_seconds'], received)
+    # Los workers terminan de registrar las conexiones antes de medir memoria
+    await asyncio.sleep(2)
+    rss_after = {url: read_rss_mb(pid)[0] for url, pid in workers.items()}
+
+    emit_event('capacity_probe', {'sent_at': time.time()})
+    deadline = time.time() + config['delivery_timeout_seconds']
+    while len(received) < len(clients) and time.time() < deadline:
+        await asyncio.sleep(0.1)
+
+    await asyncio.gather(*(client.disconnect() for client in clients), return_exceptions=True)
+
+    per_worker = {}
+    for i, url in enumerate(urls):
+        latencies = [ms for target, ms in received if target == url]
+        before, after = rss_before.get(url), rss_after.get(url)
+        per_worker[url] = {
+            'assigned': len(range(i, connections, len(urls))),
+            'delivered': len(latencies),
+            'rss_before_mb': round(before, 1) if before else None,
+            'rss_after_mb': round(after, 1) if after else None,
+            **_percentiles(latencies)
+        }
+    connected_total = len(clients)
+    rss_delta = sum((w['rss_after_mb'] or 0) - (w['rss_before_mb'] or 0) for w in per_worker.values())
+    return {
+        'connections_requested': connections,
+        'connected': connected_total,
+        'failed': failures,
+        'connect': _percentiles(connect_ms),
+        'delivered': len(received),
+        'delivery': _percentiles([ms for _, ms in received]),
+        'kb_per_connection': round(rss_delta * 1024 / connected_total, 1) if connected_total else None,
+        'workers': per_worker
+    }
+
+
+def run_capacity(n_workers, connections, queue_url=None, database_url=None, config=SOCKET_CAPACITY_CONFIG):
+    from benchmarks.load_test import start_server
+
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    queue_url = queue_url or os.environ.get('SOCKETIO_MESSAGE_QUEUE') \
+        or f"sqlite:///{os.path.abspath(DEFAULT_QUEUE)}"
+    database_url = database_url or os.environ.get('DATABASE_URL') \
+        or f"sqlite:///{os.path.abspath(DEFAULT_DATABASE)}"
+    # Los workers heredan la cola; este proceso publica por ella con emit_event
+    os.environ['SOCKETIO_MESSAGE_QUEUE'] = queue_url
+    file_limit = _raise_file_limit()
+
+    processes, workers = [], {}
+    try:
+        for i in range(n_workers):
+            process, url = start_server(database_url, config['port'] + i,
+                                        f'benchmarks/results/socket_worker_{i}.log')
+            processes.append(process)
+            workers[url] = process.pid
+        results = asyncio.run(_run_clients(list(workers), connections, config, workers))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+
+    results.update({
+        'timestamp': datetime.now().isoformat(),
+        'queue': queue_url.split('@')[-1],
+        'n_workers': n_workers,
+        'file_limit': file_limit
+    })
+    with open(RESULTS_PATH, 'w') as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Capacidad de conexiones Socket.IO por worker")
+    parser.add_argument('--workers', type=int, default=SOCKET_CAPACITY_CONFIG['workers'])
+    parser.add_argument('--connections', type=int, default=SOCKET_CAPACITY_CONFIG['connections'])
+    parser.add_argument('--ramp-batch', type=int, default=SOCKET_CAPACITY_CONFIG['ramp_batch'])
+    parser.add_argument('--port', type=int, default=SOCKET_CAPACITY_CONFIG['port'])
+    parser.add_argument('--queue', help=f"URL de la cola (por defecto SOCKETIO_MESSAGE_QUEUE o {DEFAULT_QUEUE})")
+    parser.add_argument('--database-url', help=f"Base de datos de los workers (por defecto {DEFAULT_DATABASE})")
+    args = parser.parse_args()
+
+    config = dict(SOCKET_CAPACITY_CONFIG, ramp_batch=args.ramp_batch, port=args.port)
+    results = run_capacity(args.workers, args.connections, args.queue, args.database_url, config)
+    print(json.dumps({key: results[key] for key in ('connected', 'failed', 'delivered', 'connect',
+                                                    'delivery', 'kb_per_connection')}, indent=2))
+    if results['delivered'] < results['connected']:
+        sys.exit(f"{results['connected'] - results['delivered']} clientes no recibieron el evento publicado")
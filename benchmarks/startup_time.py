@@ -0,0 +1,85 @@
+"""
+Benchmark de arranque de los workers web
+---------------------------------------
+
+Mide, en procesos Python nuevos, el tiempo de `import main` (monkey patch de
+gevent + creación de la app Flask + registro de rutas) y verifica que el
+arranque no cargue el stack pesado de ML (TensorFlow, pandas, scikit-learn,
+LightGBM). También mide por separado la importación de los módulos de
+servicio y de entrenamiento.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.startup_time --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+RESULTS_PATH = 'benchmarks/results/startup_time.json'
+HEAVY_MODULES = ('tensorflow', 'pandas', 'sklearn', 'lightgbm')
+
+TARGETS = {
+    'main': 'import main',
+    'prediction_service': 'import prediction_service',
+    'ml_models': 'import ml_models',
+    'retrain_scheduler': 'import retrain_scheduler'
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed,
+                  'heavy_loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(statement, runs):
+    """Ejecuta `statement` en `runs` procesos nuevos y devuelve los tiempos."""
+    timings = []
+    heavy_loaded = set()
+    env = dict(os.environ)
+    # Sin base de datos real: la app no se conecta al importar
+    env.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', _PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True, env=env, check=True
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        timings.append(result['seconds'])
+        heavy_loaded.update(result['heavy_loaded'])
+    return {
+        'runs': runs,
+        'median_seconds': round(statistics.median(timings), 4),
+        'min_seconds': round(min(timings), 4),
+        'max_seconds': round(max(timings), 4),
+        'heavy_modules_loaded': sorted(heavy_loaded)
+    }
+
+
+def run_benchmark(runs=5):
+    results = {'timestamp': datetime.now().isoformat(), 'python': sys.version.split()[0]}
+    for name, statement in TARGETS.items():
+        results[name] = measure(statement, runs)
+        print(f"{name}: {results[name]}")
+
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, 'w') as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de arranque de los workers web")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    results = run_benchmark(args.runs)
+    if results['main']['heavy_modules_loaded']:
+        sys.exit(f"El arranque cargó módulos pesados: {results['main']['heavy_modules_loaded']}")
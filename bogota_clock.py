@@ -0,0 +1,32 @@
+"""
+Reloj de Bogotá
+---------------
+
+Los incidentes se guardan con la hora local de Bogotá sin zona horaria (el
+formulario de reporte y la importación masiva) y las predicciones se generan
+con esa misma hora. Todo lo que compara un timestamp de incidente con el reloj
+(ventanas recientes, detector de focos, buffer del RNN, validación de fechas
+futuras) usa estas funciones en lugar de datetime.now() o
+datetime.fromtimestamp(): en un servidor en UTC los incidentes recientes
+aparecerían cinco horas más viejos.
+"""
+from datetime import datetime
+
+import pytz
+
+BOGOTA_TZ = pytz.timezone('America/Bogota')
+
+
+def bogota_now():
+    """Hora actual de Bogotá, sin zona (como los timestamps de Incident)."""
+    return datetime.now(BOGOTA_TZ).replace(tzinfo=None)
+
+
+def bogota_epoch(timestamp):
+    """Segundos Unix de una hora local de Bogotá sin zona, comparables con time.time()."""
+    return BOGOTA_TZ.localize(timestamp).timestamp()
+
+
+def from_bogota_epoch(epoch):
+    """Hora local de Bogotá, sin zona, de unos segundos Unix."""
+    return datetime.fromtimestamp(epoch, BOGOTA_TZ).replace(tzinfo=None)
@@ -4,17 +4,78 @@ from dotenv import load_dotenv
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
 
+# Tamaño del pool de conexiones por rol de proceso (DB_ROLE):
+# - web: muchos greenlets concurrentes bajo gevent
+# - scheduler: trabajos secuenciales del programador
+# - training: consultas largas y pocas conexiones por proceso de entrenamiento
+DB_POOL_SETTINGS = {
+    'web': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10},
+    'scheduler': {'pool_size': 2, 'max_overflow': 3, 'pool_timeout': 30},
+    'training': {'pool_size': 2, 'max_overflow': 0, 'pool_timeout': 60}
+}
+
+
+def engine_options(role=None, database_url=None):
+    """
+    Opciones del engine de SQLAlchemy para un rol de proceso.
+
+    Los valores de DB_POOL_SETTINGS se pueden sobrescribir con DB_POOL_SIZE,
+    DB_MAX_OVERFLOW y DB_POOL_TIMEOUT. SQLite en memoria no usa QueuePool y
+    solo recibe las opciones básicas.
+    """
+    role = role or os.environ.get('DB_ROLE', 'web')
+    database_url = database_url or os.environ.get('DATABASE_URL') or ''
+    options = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True
+    }
+    if database_url.startswith('sqlite') and (':memory:' in database_url or database_url.rstrip('/') == 'sqlite:'):
+        return options
+
+    settings = dict(DB_POOL_SETTINGS.get(role, DB_POOL_SETTINGS['web']))
+    for key, env_name in (('pool_size', 'DB_POOL_SIZE'), ('max_overflow', 'DB_MAX_OVERFLOW'),
+                          ('pool_timeout', 'DB_POOL_TIMEOUT')):
+        if os.environ.get(env_name):
+            settings[key] = int(os.environ[env_name])
+    options.update(settings)
+
+    from database import InstrumentedQueuePool
+    options['poolclass'] = InstrumentedQueuePool
+    return options
+
+
 class Config:
     # Configuración de la base de datos
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        "pool_recycle": 300,
-        "pool_pre_ping": True
-    }
+    DB_ROLE = os.environ.get('DB_ROLE', 'web')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(DB_ROLE, SQLALCHEMY_DATABASE_URI)
+
+    # Réplica de lectura para estadísticas, mapa, notificaciones y entrenamiento
+    SQLALCHEMY_BINDS = {'replica': os.environ['DATABASE_REPLICA_URL']} if os.environ.get('DATABASE_REPLICA_URL') else {}
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 30))
+    REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', 5))
     
+    # Cola de mensajes de Socket.IO compartida por los workers web y los procesos
+    # que emiten eventos (redis://..., amqp://... o sqlite:///ruta.db; ver socketio_queue.py)
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+
     # Configuración de seguridad
     SECRET_KEY = os.environ.get('FLASK_SECRET_KEY', 'transmi2025')
+
+    # Importación masiva (/api/incidents/bulk): solo estos usuarios (socios y
+    # administradores, separados por comas) y cuerpos de hasta BULK_INGEST_MAX_BYTES
+    BULK_INGEST_USERS = [name.strip() for name in os.environ.get('BULK_INGEST_USERS', '').split(',') if name.strip()]
+    BULK_INGEST_MAX_BYTES = int(os.environ.get('BULK_INGEST_MAX_BYTES', 1024 * 1024 * 1024))
+
+    # Métricas internas (/metrics, /api/metrics/*): además de los usuarios
+    # autenticados, el recolector puede usar Authorization: Bearer METRICS_TOKEN
+    # o conectarse desde una IP de METRICS_ALLOWED_IPS (separadas por comas)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
+
+    # Modelo usado para el caché de predicciones: 'gbm' (LightGBM), 'bayes' (risk_engine) o 'fallback'
+    PREDICTION_MODEL_VERSION = os.environ.get('PREDICTION_MODEL_VERSION', 'gbm')
     
     # Configuración de sesión
     SESSION_COOKIE_SECURE = False
@@ -1,8 +1,149 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+
+def make_psycopg2_green():
+    """
+    Hace cooperativo a psycopg2 bajo gevent: mientras una consulta espera al
+    servidor, el greenlet cede el control en lugar de bloquear todo el proceso
+    (equivalente a psycogreen.gevent.patch_psycopg).
+
+    Returns:
+        bool: True si se instaló el callback de espera
+    """
+    try:
+        import psycopg2
+        from psycopg2 import extensions
+        from gevent.socket import wait_read, wait_write
+    except ImportError:
+        logger.info("psycopg2 o gevent no disponibles; conexiones de base de datos sin modo cooperativo")
+        return False
+
+    def gevent_wait_callback(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                break
+            elif state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+    extensions.set_wait_callback(gevent_wait_callback)
+    logger.info("psycopg2 configurado en modo cooperativo con gevent")
+    return True
+
+
+# Límites superiores (ms) del histograma de espera al obtener una conexión
+CHECKOUT_WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class PoolMetrics:
+    """Espera al obtener conexiones del pool, desbordes y timeouts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.bucket_counts = [0] * (len(CHECKOUT_WAIT_BUCKETS_MS) + 1)
+            self.checkouts = 0
+            self.wait_ms_sum = 0.0
+            self.wait_ms_max = 0.0
+            self.overflow_events = 0
+            self.timeouts = 0
+
+    def record_checkout(self, wait_ms, overflowed):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_ms_sum += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+            self.bucket_counts[_bucket_index(wait_ms)] += 1
+            if overflowed:
+                self.overflow_events += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'checkout_wait_ms_sum': round(self.wait_ms_sum, 3),
+                'checkout_wait_ms_max': round(self.wait_ms_max, 3),
+                'checkout_wait_ms_avg': round(self.wait_ms_sum / self.checkouts, 3) if self.checkouts else 0.0,
+                'checkout_wait_buckets_ms': dict(zip([str(b) for b in CHECKOUT_WAIT_BUCKETS_MS] + ['+Inf'],
+                                                     self.bucket_counts)),
+                'overflow_events': self.overflow_events,
+                'timeouts': self.timeouts
+            }
+
+
+def _bucket_index(wait_ms):
+    for i, bound in enumerate(CHECKOUT_WAIT_BUCKETS_MS):
+        if wait_ms <= bound:
+            return i
+    return len(CHECKOUT_WAIT_BUCKETS_MS)
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que registra el tiempo de espera de cada checkout y los desbordes."""
+
+    _reentry = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get se llama a sí mismo al reintentar; solo se mide la llamada externa
+        if getattr(self._reentry, 'active', False):
+            return super()._do_get()
+
+        overflow_before = self._overflow
+        start = time.perf_counter()
+        self._reentry.active = True
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record_timeout()
+            raise
+        finally:
+            self._reentry.active = False
+        # _overflow parte de -pool_size; solo es desborde por encima de cero
+        pool_metrics.record_checkout((time.perf_counter() - start) * 1000,
+                                     self._overflow > overflow_before and self._overflow > 0)
+        return connection
+
+
+def pool_status(engine=None):
+    """
+    Estado actual del pool de conexiones y métricas acumuladas.
+    Debe llamarse dentro del contexto de la aplicación Flask si no se pasa engine.
+    """
+    pool = (engine or db.engine).pool
+    status = {'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+            'timeout_seconds': pool.timeout()
+        })
+    status.update(pool_metrics.snapshot())
+    return status
+
 # Inicializar SQLAlchemy sin usar DeclarativeBase
 db = SQLAlchemy()
 
@@ -25,6 +166,123 @@ def create_tables(app):
 
 from contextlib import contextmanager
 
+REPLICA_BIND = 'replica'
+
+
+class ReplicaRouter:
+    """
+    Decide si las lecturas analíticas van a la réplica (bind 'replica' de
+    SQLALCHEMY_BINDS) o a la primaria. La réplica se usa solo si responde y su
+    retraso de replicación es menor que REPLICA_MAX_LAG_SECONDS; el resultado
+    de la verificación se reutiliza durante REPLICA_LAG_CHECK_SECONDS.
+
+    En PostgreSQL el retraso es 0 si la réplica ya aplicó todo el WAL recibido
+    y, mientras la reproducción va atrás, now() - pg_last_xact_replay_timestamp()
+    (sin escrituras en la primaria ese valor crece aunque la réplica esté al
+    día). En otros motores (p. ej. dos archivos SQLite en pruebas) se compara el
+    id más reciente de incident en ambas bases (el timestamp lo pone el usuario
+    y no sigue el orden de inserción); el retraso es el tiempo transcurrido
+    desde que se vio a la réplica atrasada por primera vez.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._healthy = False
+        self.lag_seconds = None
+        self.last_error = None
+        self._behind_since = None
+        self.reads = {'replica': 0, 'primary': 0}
+
+    @staticmethod
+    def replica_engine():
+        try:
+            return db.engines[REPLICA_BIND]
+        except KeyError:
+            return None
+
+    def measure_lag(self, replica_engine):
+        from sqlalchemy import text
+
+        with replica_engine.connect() as connection:
+            if replica_engine.dialect.name == 'postgresql':
+                lag = connection.execute(text(
+                    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+                    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE COALESCE(EXTRACT(EPOCH FROM (now() - pg_last_xact_replay_timestamp())), 0) "
+                    "END")).scalar()
+                return float(lag or 0)
+            replica_latest = connection.execute(text("SELECT MAX(id) FROM incident")).scalar()
+        with db.engine.connect() as connection:
+            primary_latest = connection.execute(text("SELECT MAX(id) FROM incident")).scalar()
+        if primary_latest is None or (replica_latest is not None and replica_latest >= primary_latest):
+            self._behind_since = None
+            return 0.0
+        now = time.monotonic()
+        if self._behind_since is None:
+            self._behind_since = now
+        return now - self._behind_since
+
+    def healthy_replica(self):
+        """Engine de la réplica si está configurada y al día; None para usar la primaria."""
+        from flask import current_app
+
+        engine = self.replica_engine()
+        if engine is None:
+            return None
+        config = current_app.config
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= config.get('REPLICA_LAG_CHECK_SECONDS', 5):
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= config.get('REPLICA_LAG_CHECK_SECONDS', 5):
+                    try:
+                        self.lag_seconds = self.measure_lag(engine)
+                        self._healthy = self.lag_seconds <= config.get('REPLICA_MAX_LAG_SECONDS', 30)
+                        self.last_error = None
+                        if not self._healthy:
+                            logger.warning(f"Réplica con retraso de {self.lag_seconds:.1f}s; lecturas a la primaria")
+                    except Exception as e:
+                        self._healthy = False
+                        self.last_error = str(e)
+                        logger.warning(f"Réplica no disponible, lecturas a la primaria: {str(e)}")
+                    self._checked_at = now
+        return engine if self._healthy else None
+
+    def status(self):
+        return {
+            'configured': self.replica_engine() is not None,
+            'healthy': self._healthy,
+            'lag_seconds': self.lag_seconds,
+            'last_error': self.last_error,
+            'reads': dict(self.reads)
+        }
+
+
+replica_router = ReplicaRouter()
+
+
+@contextmanager
+def read_session():
+    """
+    Sesión para consultas de solo lectura (estadísticas, mapa, notificaciones,
+    entrenamiento). Usa la réplica si está disponible y al día; si no, la sesión
+    de la primaria. No se debe escribir con esta sesión.
+    """
+    from sqlalchemy.orm import Session
+
+    engine = replica_router.healthy_replica()
+    if engine is None:
+        replica_router.reads['primary'] += 1
+        yield db.session
+        return
+
+    replica_router.reads['replica'] += 1
+    session = Session(bind=engine)
+    try:
+        yield session
+    finally:
+        session.close()
+
 @contextmanager
 def transaction_context():
     try:
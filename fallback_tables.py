@@ -0,0 +1,242 @@
+"""
+Tabla precalculada de riesgo para el sistema de fallback
+-------------------------------------------------------
+
+enhanced_fallback_prediction consulta un arreglo de NumPy indexado por
+(estación, día de la semana, hora) en lugar de generar números aleatorios, de
+modo que la misma estación y hora siempre reciben el mismo riesgo y tipo, y
+las respuestas se pueden cachear y comparar entre ejecuciones.
+
+- Sin historia, la tabla reproduce el perfil horario del fallback original
+  (punto medio de cada rango, ajustado por día hábil/fin de semana).
+- Con historia (agregados de rollups), el perfil se escala por la tasa de
+  incidentes de cada estación frente al promedio de la ciudad en esa franja,
+  y el tipo de incidente combina los conteos observados con los pesos por hora.
+
+La tabla se guarda en models/fallback_risk_table.npz, se carga una vez por
+proceso (y por versión del archivo) y se reconstruye periódicamente desde
+retrain_scheduler.
+"""
+import json
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+
+from instrumentation import record_cache
+from stations import station_index, station_names
+
+FALLBACK_TABLE_CONFIG = {
+    'path': 'models/fallback_risk_table.npz',
+    'prior_strength': 2.0,     # Pseudo-conteos hacia el promedio de la ciudad
+    'min_risk': 0.1,
+    'max_risk': 0.95,
+    'rebuild_hours': 6
+}
+
+# Riesgo base por franja horaria (punto medio de los rangos del fallback original)
+_HOUR_BAND_RISK = {'morning_peak': 0.75, 'evening_peak': 0.825, 'night': 0.65, 'valley': 0.45}
+
+# Pesos del tipo de incidente más probable por franja horaria
+_HOUR_BAND_TYPE_WEIGHTS = {
+    'morning_peak': {
+        'Cosquilleo': 0.3, 'Hurto': 0.25, 'Hurto a mano armada': 0.1, 'Acoso': 0.15,
+        'Sospechoso': 0.1, 'Ataque': 0.05, 'Apertura de puertas': 0.05
+    },
+    'evening_peak': {
+        'Hurto': 0.3, 'Cosquilleo': 0.25, 'Hurto a mano armada': 0.15, 'Acoso': 0.1,
+        'Sospechoso': 0.1, 'Ataque': 0.05, 'Apertura de puertas': 0.05
+    },
+    'night': {
+        'Hurto a mano armada': 0.3, 'Ataque': 0.2, 'Hurto': 0.2, 'Sospechoso': 0.15,
+        'Acoso': 0.1, 'Cosquilleo': 0.03, 'Apertura de puertas': 0.02
+    },
+    'valley': {
+        'Hurto': 0.25, 'Cosquilleo': 0.2, 'Sospechoso': 0.15, 'Acoso': 0.15,
+        'Hurto a mano armada': 0.1, 'Ataque': 0.1, 'Apertura de puertas': 0.05
+    }
+}
+
+
+def _risk_band(hour):
+    if 5 <= hour <= 9:
+        return 'morning_peak'
+    if 16 <= hour <= 20:
+        return 'evening_peak'
+    if 22 <= hour or hour <= 4:
+        return 'night'
+    return 'valley'
+
+
+def _type_band(hour):
+    # Los pesos de tipo usan la hora pico de la mañana desde las 6
+    if 6 <= hour <= 9:
+        return 'morning_peak'
+    return 'valley' if hour == 5 else _risk_band(hour)
+
+
+def heuristic_profile(types):
+    """
+    Perfil determinista del fallback original.
+
+    Returns:
+        tuple: (riesgo (7, 24), pesos de tipo (24, n_tipos))
+    """
+    hourly = np.array([_HOUR_BAND_RISK[_risk_band(h)] for h in range(24)], dtype=np.float32)
+    day_factor = np.where(np.arange(7) < 5, 1.2, 0.8).astype(np.float32)
+    risk = np.clip(day_factor[:, None] * hourly[None, :],
+                   FALLBACK_TABLE_CONFIG['min_risk'], FALLBACK_TABLE_CONFIG['max_risk'])
+    type_weights = np.array([[_HOUR_BAND_TYPE_WEIGHTS[_type_band(h)].get(t, 0.0) for t in types]
+                             for h in range(24)], dtype=np.float32)
+    return risk, type_weights
+
+
+def build_fallback_table(counts=None, weeks=1.0, types=None):
+    """
+    Construye la tabla de fallback a partir de los agregados de incidentes.
+
+    Args:
+        counts (numpy.ndarray): Conteos (n_estaciones, 7, 24, n_tipos) de
+            rollups, o None para usar solo el perfil horario
+        weeks (float): Semanas observadas en los conteos
+        types (list): Tipos de incidente del último eje
+
+    Returns:
+        dict: Arreglos risk (n_estaciones, 7, 24) float32, type_idx
+            (n_estaciones, 7, 24) int8, city_risk/city_type_idx (7, 24) y metadatos
+    """
+    if types is None:
+        from rollups import incident_types
+        types = incident_types()
+    n_stations = len(station_index())
+    base_risk, type_weights = heuristic_profile(types)
+    prior = FALLBACK_TABLE_CONFIG['prior_strength']
+
+    if counts is None or counts.sum() == 0:
+        risk = np.broadcast_to(base_risk, (n_stations, 7, 24)).copy()
+        scores = np.broadcast_to(type_weights[None, None, :, :], (n_stations, 7, 24, len(types)))
+        city_scores = np.broadcast_to(type_weights[None, :, :], (7, 24, len(types)))
+        source = 'heuristic'
+    else:
+        slot_counts = counts.sum(axis=3).astype(np.float32) / weeks
+        city_mean = slot_counts.mean(axis=0, keepdims=True)
+        # Relación entre la tasa de la estación y la de la ciudad en la misma franja,
+        # suavizada con pseudo-conteos para estaciones con poca historia
+        lift = (slot_counts + prior) / (city_mean + prior)
+        risk = base_risk[None, :, :] * lift
+        scores = counts + prior * type_weights[None, None, :, :]
+        city_scores = counts.sum(axis=0) + prior * type_weights[None, :, :]
+        source = 'history'
+
+    risk = np.clip(risk, FALLBACK_TABLE_CONFIG['min_risk'],
+                   FALLBACK_TABLE_CONFIG['max_risk']).astype(np.float32)
+    return {
+        'risk': risk,
+        'type_idx': np.argmax(scores, axis=-1).astype(np.int8),
+        'city_risk': base_risk.astype(np.float32),
+        'city_type_idx': np.argmax(city_scores, axis=-1).astype(np.int8),
+        'stations': np.array(station_names()),
+        'types': np.array(types),
+        'metadata': np.array(json.dumps({
+            'source': source,
+            'weeks': round(float(weeks), 2),
+            'built_at': datetime.now().isoformat()
+        }))
+    }
+
+
+def save_fallback_table(table, path=None):
+    """Guarda la tabla de forma atómica (archivo temporal + rename)."""
+    path = path or FALLBACK_TABLE_CONFIG['path']
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **table)
+    os.replace(tmp_path, path)
+    return path
+
+
+def rebuild_fallback_table():
+    """
+    Recalcula los agregados de incidentes, los publica (rollups.refresh_rollup_snapshot,
+    de donde cargan el motor bayesiano y los mapas de calor) y publica la tabla.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Returns:
+        dict: Metadatos de la tabla, o None si falla
+    """
+    try:
+        from rollups import refresh_rollup_snapshot
+
+        snapshot = refresh_rollup_snapshot()
+        table = build_fallback_table(snapshot.counts, snapshot.weeks, snapshot.types)
+        path = save_fallback_table(table)
+        metadata = json.loads(str(table['metadata']))
+        logging.info(f"Tabla de fallback reconstruida en {path}: {metadata}")
+        return metadata
+    except Exception as e:
+        logging.error(f"Error reconstruyendo tabla de fallback: {str(e)}", exc_info=True)
+        return None
+
+
+class FallbackTable:
+    """Tabla de riesgo cargada en memoria; cada consulta es un índice de arreglo."""
+
+    def __init__(self, arrays):
+        self.risk = arrays['risk']
+        self.type_idx = arrays['type_idx']
+        self.city_risk = arrays['city_risk']
+        self.city_type_idx = arrays['city_type_idx']
+        self.types = [str(t) for t in arrays['types']]
+        self.metadata = json.loads(str(arrays['metadata']))
+        self.station_idx = {str(name): i for i, name in enumerate(arrays['stations'])}
+
+    def lookup(self, station, day_of_week, hour):
+        """
+        Returns:
+            tuple: (risk_score, incident_type). Estaciones desconocidas usan el perfil de la ciudad.
+        """
+        idx = self.station_idx.get(station)
+        if idx is None:
+            return (float(self.city_risk[day_of_week, hour]),
+                    self.types[self.city_type_idx[day_of_week, hour]])
+        return (float(self.risk[idx, day_of_week, hour]),
+                self.types[self.type_idx[idx, day_of_week, hour]])
+
+
+_table_cache = {}
+
+
+def load_fallback_table():
+    """
+    Carga la tabla guardada (una vez por proceso y por versión del archivo).
+    Si no existe o no se puede leer, usa la tabla del perfil horario.
+
+    Returns:
+        FallbackTable
+    """
+    path = FALLBACK_TABLE_CONFIG['path']
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    cached = _table_cache.get(path)
+    if cached and cached[0] == mtime:
+        record_cache('fallback_table', True)
+        return cached[1]
+
+    record_cache('fallback_table', False)
+    table = None
+    if mtime is not None:
+        try:
+            with np.load(path) as data:
+                table = FallbackTable({key: data[key] for key in data.files})
+            if table.station_idx.keys() != station_index().keys():
+                logging.warning("La tabla de fallback no coincide con las estaciones actuales, usando perfil horario")
+                table = None
+        except Exception as e:
+            logging.error(f"Error cargando tabla de fallback {path}: {str(e)}")
+            table = None
+    if table is None:
+        table = FallbackTable(build_fallback_table())
+
+    _table_cache[path] = (mtime, table)
+    return table
@@ -2,7 +2,7 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, SelectField
 from wtforms.fields import DateField, TimeField
 from wtforms.validators import DataRequired, Email, EqualTo, ValidationError
-from datetime import datetime
+from bogota_clock import bogota_now
 from models import User
 
 class LoginForm(FlaskForm):
@@ -39,15 +39,15 @@ class IncidentReportForm(FlaskForm):
         ('Acoso', 'Acoso')
     ], validators=[DataRequired()])
     description = TextAreaField('Descripción')
-    incident_date = DateField('Fecha del incidente', validators=[DataRequired()], default=datetime.now)
-    incident_time = TimeField('Hora del incidente', validators=[DataRequired()], default=datetime.now)
+    incident_date = DateField('Fecha del incidente', validators=[DataRequired()], default=bogota_now)
+    incident_time = TimeField('Hora del incidente', validators=[DataRequired()], default=bogota_now)
     station = SelectField('Estación', validators=[DataRequired()], choices=[])
 
     def __init__(self, *args, **kwargs):
         super(IncidentReportForm, self).__init__(*args, **kwargs)
         # Set current date and time as defaults
         if not self.incident_date.data:
-            self.incident_date.data = datetime.now()
+            self.incident_date.data = bogota_now()
         if not self.incident_time.data:
-            self.incident_time.data = datetime.now()
+            self.incident_time.data = bogota_now()
     submit = SubmitField('Reportar incidente')
\ No newline at end of file
@@ -110,6 +110,7 @@ def populate_real_incident_data():
 
         print("Generando 1000 incidentes distribuidos...")
         total_incidents = 0
+        rows = []
 
         # Distribuir incidentes por semanas para mejor distribución
         weeks = [
@@ -183,16 +184,15 @@ def populate_real_incident_data():
                     elif incident_type == "Acoso":
                         description += " - Acoso verbal/físico reportado"
 
-                    incident = Incident(
-                        incident_type=incident_type,
-                        description=description,
-                        latitude=incident_lat,
-                        longitude=incident_lon,
-                        timestamp=timestamp,
-                        user_id=user.id,
-                        nearest_station=station_name
-                    )
-                    db.session.add(incident)
+                    rows.append({
+                        'incident_type': incident_type,
+                        'description': description,
+                        'latitude': incident_lat,
+                        'longitude': incident_lon,
+                        'timestamp': timestamp,
+                        'user_id': user.id,
+                        'nearest_station': station_name
+                    })
                     total_incidents += 1
 
                 if total_incidents >= 1000:
@@ -201,6 +201,8 @@ def populate_real_incident_data():
             if total_incidents >= 1000:
                 break
 
+        # Una sola inserción masiva (executemany) en lugar de un add por incidente
+        db.session.execute(Incident.__table__.insert(), rows)
         db.session.commit()
         print(f"Se han generado {total_incidents} incidentes distribuidos entre las estaciones.")
 
@@ -0,0 +1,408 @@
+"""
+Mapas de calor precalculados de incidentes y riesgo predicho
+-----------------------------------------------------------
+
+El mapa no necesita dibujar un marcador por incidente: un trabajo del
+programador de tareas rasteriza sobre el recuadro de Bogotá, a varias
+resoluciones, dos capas a partir de los agregados (rollups) por estación:
+
+- incidents: densidad de incidentes (por km² y por semana) con un kernel
+  gaussiano de ancho bandwidth_m centrado en cada estación
+- risk: riesgo predicho por el motor bayesiano, suavizado con el mismo kernel
+  (promedio ponderado de las estaciones cercanas; vacío lejos de ellas)
+
+Cada capa tiene 32 cortes de tiempo: total, hora del día (0-23) y día de la
+semana (lunes=0). Como el kernel es lineal, cada raster es pesos_por_estación
+@ K, con K una matriz dispersa (estaciones x celdas) calculada una vez por
+resolución. Al reconstruir solo se recalculan los cortes cuyos pesos cambiaron
+desde la última publicación; si ninguno cambió el archivo no se reescribe, y
+si los agregados publicados (rollups) no cambiaron no se recalcula nada.
+
+Los rasters se guardan como float16 en models/heatmaps/heatmap_<m>m.npz
+(comprimidos, temporal + rename). Los workers los cargan una vez por versión
+del archivo y sirven teselas PNG XYZ (render_tile) con un caché LRU: ninguna
+solicitud del mapa de calor consulta la tabla de incidentes.
+"""
+import io
+import json
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from instrumentation import record_cache
+
+HEATMAP_CONFIG = {
+    'directory': 'models/heatmaps',
+    'bounds': (4.45, 4.85, -74.25, -73.98),   # lat_min, lat_max, lon_min, lon_max
+    'resolutions_m': (400, 200, 100),
+    'bandwidth_m': 350,
+    'cutoff_sigmas': 3,
+    'min_kernel_weight': 0.05,      # Fracción del peso máximo debajo de la cual el riesgo queda vacío
+    'tile_size': 256,
+    'tile_cache_size': 1024,
+    'rebuild_minutes': 60
+}
+
+LAYERS = ('incidents', 'risk')
+N_SLICES = 1 + 24 + 7
+
+_METERS_PER_DEGREE_LAT = 110540.0
+_METERS_PER_DEGREE_LON = 111320.0 * math.cos(math.radians(4.65))
+
+
+def slice_index(hour=None, weekday=None):
+    """Corte de tiempo: hora del día si se indica, si no día de la semana, si no el total."""
+    if hour is not None:
+        if not 0 <= hour < 24:
+            raise ValueError(f"Hora fuera de rango: {hour}")
+        return 1 + hour
+    if weekday is not None:
+        if not 0 <= weekday < 7:
+            raise ValueError(f"Día de la semana fuera de rango: {weekday}")
+        return 25 + weekday
+    return 0
+
+
+def _slice_weights(values):
+    """
+    Pesos por corte a partir de un arreglo (n_estaciones, 7, 24).
+
+    Returns:
+        numpy.ndarray: (N_SLICES, n_estaciones)
+    """
+    return np.concatenate([
+        values.sum(axis=(1, 2))[None],
+        values.sum(axis=1).T,
+        values.sum(axis=2).T
+    ]).astype(np.float64)
+
+
+def heatmap_path(resolution):
+    return os.path.join(HEATMAP_CONFIG['directory'], f'heatmap_{resolution}m.npz')
+
+
+class HeatmapGrid:
+    """Celdas de una resolución y el kernel disperso (estaciones x celdas)."""
+
+    def __init__(self, resolution, coordinates):
+        from scipy.sparse import csr_matrix
+
+        lat_min, lat_max, lon_min, lon_max = HEATMAP_CONFIG['bounds']
+        self.resolution = resolution
+        self.dlat = resolution / _METERS_PER_DEGREE_LAT
+        self.dlon = resolution / _METERS_PER_DEGREE_LON
+        self.shape = (int(math.ceil((lat_max - lat_min) / self.dlat)),
+                      int(math.ceil((lon_max - lon_min) / self.dlon)))
+
+        sigma = HEATMAP_CONFIG['bandwidth_m']
+        reach = int(math.ceil(HEATMAP_CONFIG['cutoff_sigmas'] * sigma / resolution))
+        offset_i, offset_j = np.meshgrid(np.arange(-reach, reach + 1), np.arange(-reach, reach + 1), indexing='ij')
+        rows, cols, values = [], [], []
+        for station_i, (lat, lon) in enumerate(coordinates):
+            center_i = int((lat - lat_min) / self.dlat)
+            center_j = int((lon - lon_min) / self.dlon)
+            cell_i = center_i + offset_i
+            cell_j = center_j + offset_j
+            inside = (cell_i >= 0) & (cell_i < self.shape[0]) & (cell_j >= 0) & (cell_j < self.shape[1])
+            cell_i, cell_j = cell_i[inside], cell_j[inside]
+            dy = (lat_min + (cell_i + 0.5) * self.dlat - lat) * _METERS_PER_DEGREE_LAT
+            dx = (lon_min + (cell_j + 0.5) * self.dlon - lon) * _METERS_PER_DEGREE_LON
+            # Densidad por km²: kernel gaussiano normalizado
+            weight = np.exp(-(dx ** 2 + dy ** 2) / (2 * sigma ** 2)) / (2 * math.pi * (sigma / 1000.0) ** 2)
+            rows.append(np.full(len(weight), station_i))
+            cols.append(cell_i * self.shape[1] + cell_j)
+            values.append(weight)
+        n_cells = self.shape[0] * self.shape[1]
+        self.kernel = csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                 shape=(len(coordinates), n_cells))
+        # Peso total del kernel en cada celda, para el promedio ponderado del riesgo
+        self.coverage = np.asarray(self.kernel.sum(axis=0)).ravel()
+
+    def density(self, weights):
+        """Rasters (cortes, alto, ancho) de pesos (cortes, estaciones) @ K."""
+        return np.asarray(self.kernel.T.dot(weights.T).T).reshape((len(weights),) + self.shape)
+
+    def smooth(self, weights):
+        """Promedio de los valores por estación ponderado por el kernel; NaN lejos de las estaciones."""
+        numerator = self.density(weights)
+        coverage = self.coverage.reshape(self.shape)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            smoothed = numerator / coverage
+        smoothed[:, coverage < HEATMAP_CONFIG['min_kernel_weight'] * coverage.max()] = np.nan
+        return smoothed
+
+
+def _read_heatmap_file(path):
+    try:
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.error(f"Error leyendo mapa de calor {path}: {str(e)}")
+        return None
+
+
+def update_heatmap_file(resolution, coordinates, stations, weights, metadata):
+    """
+    Actualiza los rasters de una resolución recalculando solo los cortes
+    cuyos pesos cambiaron desde la versión guardada.
+
+    Args:
+        weights (dict): Capa -> pesos (N_SLICES, n_estaciones)
+
+    Returns:
+        int: Cortes recalculados (0 si los rasters no cambiaron)
+    """
+    path = heatmap_path(resolution)
+    previous = _read_heatmap_file(path)
+    grid_metadata = {}
+    if previous is not None:
+        grid_metadata = json.loads(str(previous['metadata']))
+        if (previous['stations'].tolist() != list(stations)
+                or grid_metadata.get('bounds') != list(HEATMAP_CONFIG['bounds'])
+                or grid_metadata.get('bandwidth_m') != HEATMAP_CONFIG['bandwidth_m']):
+            previous = None
+
+    grid = None
+    arrays = {'stations': np.array(stations)}
+    rebuilt = 0
+    for layer in LAYERS:
+        new_weights = weights[layer]
+        if previous is not None and f'{layer}_weights' in previous:
+            # Diferencias menores que la precisión de float16 no cambian el raster publicado
+            changed = np.flatnonzero(~np.isclose(previous[f'{layer}_weights'], new_weights,
+                                                 rtol=1e-3, atol=1e-6).all(axis=1))
+            rasters = previous[layer].astype(np.float32)
+        else:
+            changed = np.arange(N_SLICES)
+            rasters = None
+        if len(changed):
+            if grid is None:
+                grid = HeatmapGrid(resolution, coordinates)
+            if rasters is None:
+                rasters = np.zeros((N_SLICES,) + grid.shape, dtype=np.float32)
+            compute = grid.density if layer == 'incidents' else grid.smooth
+            rasters[changed] = compute(new_weights[changed])
+            rebuilt += len(changed)
+        arrays[layer] = rasters.astype(np.float16)
+        arrays[f'{layer}_weights'] = new_weights
+
+    # Sin cortes nuevos solo se reescribe si cambiaron los metadatos (versión de los agregados)
+    if rebuilt == 0 and all(grid_metadata.get(key) == value for key, value in metadata.items()):
+        return 0
+    lat_min, lat_max, lon_min, lon_max = HEATMAP_CONFIG['bounds']
+    arrays['metadata'] = np.array(json.dumps(dict(
+        metadata, resolution=resolution, bounds=[lat_min, lat_max, lon_min, lon_max],
+        bandwidth_m=HEATMAP_CONFIG['bandwidth_m'],
+        dlat=grid.dlat if grid is not None else grid_metadata['dlat'],
+        dlon=grid.dlon if grid is not None else grid_metadata['dlon'],
+        built_at=datetime.now().isoformat())))
+
+    os.makedirs(HEATMAP_CONFIG['directory'], exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+    return rebuilt
+
+
+def _published_rollups(resolution):
+    """Versión de los agregados (built_at) con que se publicó una resolución, o None."""
+    try:
+        with np.load(heatmap_path(resolution)) as data:
+            return json.loads(str(data['metadata'])).get('rollups_built_at')
+    except Exception:
+        return None
+
+
+def rebuild_heatmaps():
+    """
+    Recalcula los mapas de calor desde los agregados publicados
+    (rollups.load_rollup_snapshot; el motor bayesiano de la capa de riesgo se
+    ajusta sobre ellos) y publica las resoluciones que cambiaron. Si los
+    agregados no cambiaron desde la última publicación no se recalcula nada.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Returns:
+        dict: Cortes recalculados por resolución, o None si falla
+    """
+    try:
+        from risk_engine import BayesRiskEngine
+        from rollups import load_rollup_snapshot, refresh_rollup_snapshot
+        from stations import load_stations
+
+        snapshot = load_rollup_snapshot() or refresh_rollup_snapshot()
+        resolutions = HEATMAP_CONFIG['resolutions_m']
+        if all(_published_rollups(resolution) == snapshot.built_at for resolution in resolutions):
+            logging.info("Agregados sin cambios desde la última publicación; mapas de calor vigentes")
+            return {resolution: 0 for resolution in resolutions}
+
+        engine = BayesRiskEngine(snapshot.counts, snapshot.start, snapshot.end, snapshot.types)
+        stations = load_stations()
+        names = [station['nombre'] for station in stations]
+        coordinates = [(station['latitude'], station['longitude']) for station in stations]
+
+        per_week = engine.counts.sum(axis=3) / engine.weeks
+        risk = engine.risk.astype(np.float64)
+        weights = {
+            'incidents': _slice_weights(per_week),
+            # Promedio del riesgo horario en cada corte
+            'risk': _slice_weights(risk) / _slice_weights(np.ones_like(risk))
+        }
+        metadata = {'weeks': round(float(engine.weeks), 2), 'rollups_built_at': snapshot.built_at}
+
+        rebuilt = {}
+        for resolution in resolutions:
+            rebuilt[resolution] = update_heatmap_file(resolution, coordinates, names, weights, metadata)
+        logging.info(f"Mapas de calor actualizados (cortes recalculados por resolución): {rebuilt}")
+        return rebuilt
+    except Exception as e:
+        logging.error(f"Error reconstruyendo mapas de calor: {str(e)}", exc_info=True)
+        return None
+
+
+class Heatmap:
+    """Rasters de una resolución cargados en memoria."""
+
+    def __init__(self, arrays):
+        self.metadata = json.loads(str(arrays['metadata']))
+        self.resolution = self.metadata['resolution']
+        self.lat_min, _, self.lon_min, _ = self.metadata['bounds']
+        self.dlat = self.metadata['dlat']
+        self.dlon = self.metadata['dlon']
+        self.layers = {layer: arrays[layer] for layer in LAYERS}
+        # Escala de color de la densidad: máximo del grupo de cortes (total, horas o días)
+        groups = (slice(0, 1), slice(1, 25), slice(25, N_SLICES))
+        self.scale = np.empty(N_SLICES, dtype=np.float32)
+        for group in groups:
+            self.scale[group] = max(float(np.nanmax(self.layers['incidents'][group])), 1e-9)
+
+    def sample(self, layer, slice_i, lat, lon):
+        """Interpolación bilineal del raster en la malla lat (filas) x lon (columnas); NaN fuera del recuadro."""
+        raster = self.layers[layer][slice_i]
+        fi = (lat - self.lat_min) / self.dlat - 0.5
+        fj = (lon - self.lon_min) / self.dlon - 0.5
+        i0 = np.clip(np.floor(fi).astype(np.int64), 0, raster.shape[0] - 2)
+        j0 = np.clip(np.floor(fj).astype(np.int64), 0, raster.shape[1] - 2)
+        wi = np.clip(fi - i0, 0.0, 1.0)[:, None]
+        wj = np.clip(fj - j0, 0.0, 1.0)[None, :]
+        rows, cols = i0[:, None], j0[None, :]
+        values = ((1 - wi) * (1 - wj) * raster[rows, cols] + (1 - wi) * wj * raster[rows, cols + 1]
+                  + wi * (1 - wj) * raster[rows + 1, cols] + wi * wj * raster[rows + 1, cols + 1])
+        outside = ((fi < -0.5) | (fi > raster.shape[0] - 0.5))[:, None] | \
+            ((fj < -0.5) | (fj > raster.shape[1] - 0.5))[None, :]
+        values = values.astype(np.float32)
+        values[outside] = np.nan
+        return values
+
+
+_heatmap_cache = {}
+
+
+def load_heatmap(resolution):
+    """
+    Rasters de una resolución (una vez por proceso y por versión del archivo).
+
+    Returns:
+        Heatmap o None si no se han generado
+    """
+    path = heatmap_path(resolution)
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    cached = _heatmap_cache.get(path)
+    if cached and cached[0] == mtime:
+        record_cache('heatmap', True)
+        return cached[1]
+
+    record_cache('heatmap', False)
+    if mtime is None:
+        return None
+    arrays = _read_heatmap_file(path)
+    if arrays is None:
+        return None
+    heatmap = Heatmap(arrays)
+    _heatmap_cache[path] = (mtime, heatmap)
+    return heatmap
+
+
+def _tile_coordinates(z, x, y):
+    """Latitud (filas) y longitud (columnas) del centro de cada píxel de una tesela XYZ."""
+    size = HEATMAP_CONFIG['tile_size']
+    n = 2 ** z
+    pixels = (np.arange(size) + 0.5) / size
+    lon = (x + pixels) / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + pixels) / n))))
+    return lat, lon
+
+
+def _resolution_for_zoom(z, lat):
+    """La resolución más gruesa que no es más gruesa que el píxel de la tesela."""
+    pixel_m = 156543.03 * math.cos(math.radians(lat)) / 2 ** z
+    resolutions = sorted(HEATMAP_CONFIG['resolutions_m'])
+    candidates = [r for r in resolutions if r <= pixel_m]
+    return candidates[-1] if candidates else resolutions[0]
+
+
+def _colormap():
+    """Tabla RGBA de 256 entradas: transparente -> amarillo -> rojo."""
+    t = np.linspace(0.0, 1.0, 256)
+    lut = np.empty((256, 4), dtype=np.uint8)
+    lut[:, 0] = 255
+    lut[:, 1] = np.clip(255 * (1.6 - 1.6 * t), 0, 255)
+    lut[:, 2] = np.clip(80 * (1 - 4 * t), 0, 255)
+    lut[:, 3] = np.clip(230 * np.sqrt(t), 0, 230)
+    lut[0, 3] = 0
+    return lut
+
+
+_COLORMAP = _colormap()
+_tiles = OrderedDict()
+_tiles_lock = threading.Lock()
+
+
+def render_tile(layer, z, x, y, hour=None, weekday=None):
+    """
+    Tesela PNG XYZ de una capa y un corte de tiempo.
+
+    Returns:
+        bytes o None si la capa no existe o no hay mapas de calor generados
+    """
+    if layer not in LAYERS:
+        return None
+    slice_i = slice_index(hour, weekday)
+    lat, lon = _tile_coordinates(z, x, y)
+    resolution = _resolution_for_zoom(z, float(lat.mean()))
+    heatmap = load_heatmap(resolution)
+    if heatmap is None:
+        return None
+
+    key = (layer, slice_i, z, x, y, resolution, heatmap.metadata['built_at'])
+    with _tiles_lock:
+        tile = _tiles.get(key)
+        if tile is not None:
+            _tiles.move_to_end(key)
+            record_cache('heatmap_tile', True)
+            return tile
+    record_cache('heatmap_tile', False)
+
+    from PIL import Image
+
+    values = heatmap.sample(layer, slice_i, lat, lon)
+    if layer == 'incidents':
+        # Raíz cuadrada: las zonas de baja densidad siguen siendo visibles
+        values = np.sqrt(np.clip(values / heatmap.scale[slice_i], 0.0, 1.0))
+    levels = np.nan_to_num(np.clip(values, 0.0, 1.0) * 255, nan=0.0).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(_COLORMAP[levels]).save(buffer, format='PNG', optimize=False)
+    tile = buffer.getvalue()
+
+    with _tiles_lock:
+        _tiles[key] = tile
+        while len(_tiles) > HEATMAP_CONFIG['tile_cache_size']:
+            _tiles.popitem(last=False)
+    return tile
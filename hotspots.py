@@ -0,0 +1,322 @@
+"""
+Detección de focos de incidentes en tiempo real
+----------------------------------------------
+
+Cada incidente guardado actualiza, por estación y por troncal, un conteo con
+decaimiento exponencial (EWMA de la tasa de llegadas con constante de tiempo
+HOTSPOT_CONFIG['window_seconds']):
+
+    nivel = nivel * exp(-dt / ventana) + 1
+
+Con llegadas Poisson de tasa histórica lambda (tasa por hora del motor
+bayesiano para el día y la hora actuales) el nivel esperado es
+mu = lambda * ventana. La sorpresa de observar un nivel c > mu es la
+divergencia de Poisson
+
+    sorpresa = c * ln(c / mu) - (c - mu)
+
+que acota la cola: P(N >= c) <= exp(-sorpresa) (cota de Chernoff). Un foco se
+declara cuando c >= min_count y la sorpresa supera surprise_threshold; se emite
+prediction_alert a las salas de Socket.IO de la estación, de su troncal y de
+todas las alertas, con un periodo de silencio por estación o troncal.
+
+Cada actualización es O(tipos) sobre arreglos en memoria, sin consultas. El
+detector se construye con las tasas del motor bayesiano (cargado de los
+agregados publicados, sin recorrer la tabla de incidentes) y los incidentes de
+las últimas horas, en segundo plano y solo cuando llega el primer incidente al
+worker (nada al importar ni al arrancar); se reconstruye igual cada
+reconcile_seconds: con varios workers cada uno ve los reportes que recibe y la
+reconstrucción incorpora los demás. Un reporte nunca espera la construcción;
+mientras el detector no exista, los incidentes no se evalúan.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from bogota_clock import bogota_now
+from instrumentation import HOTSPOT_ALERTS
+from offload import BackgroundRefresh
+
+HOTSPOT_CONFIG = {
+    'window_seconds': float(os.environ.get('HOTSPOT_WINDOW_SECONDS', 1800)),
+    'min_count': 3.0,             # Nivel mínimo para alertar (evita alertas por un solo reporte)
+    'surprise_threshold': float(os.environ.get('HOTSPOT_SURPRISE_THRESHOLD', 6.9)),  # p <= 0.001
+    'cooldown_seconds': 1800,     # Silencio después de alertar por la misma estación o troncal
+    'seed_windows': 5,            # Historia reciente cargada al construir (en ventanas)
+    'reconcile_seconds': 600,
+    'retry_seconds': 60           # Espera tras una construcción fallida
+}
+
+ALL_ALERTS_ROOM = 'alerts:all'
+
+
+def station_room(station):
+    return f'alerts:station:{station}'
+
+
+def troncal_room(troncal):
+    return f'alerts:troncal:{troncal}'
+
+
+def subscription_rooms(alert_filter):
+    """
+    Salas de alertas para el filtro de predictions.js
+    ({type: 'all'|'troncales'|'estaciones', troncales: [...], estaciones: [...]}).
+    Sin selección se reciben todas, igual que el filtro del cliente.
+    """
+    alert_filter = alert_filter or {}
+    filter_type = alert_filter.get('type', 'all')
+    if filter_type == 'troncales' and alert_filter.get('troncales'):
+        return [troncal_room(name) for name in alert_filter['troncales']]
+    if filter_type == 'estaciones' and alert_filter.get('estaciones'):
+        return [station_room(name) for name in alert_filter['estaciones']]
+    return [ALL_ALERTS_ROOM]
+
+
+def poisson_surprise(observed, expected):
+    """Divergencia de Poisson de observar `observed` con media `expected` (0 si no es exceso)."""
+    if observed <= expected:
+        return 0.0
+    return observed * math.log(observed / expected) - (observed - expected)
+
+
+class HotspotDetector:
+    """
+    Niveles EWMA por estación y por troncal comparados con la tasa histórica.
+
+    Args:
+        stations (list): Nombres de estación en el orden de load_stations()
+        troncales (list): Troncal de cada estación
+        types (list): Tipos de incidente
+        baseline (numpy.ndarray): Incidentes esperados por hora (n_estaciones, 7, 24)
+    """
+
+    def __init__(self, stations, troncales, types, baseline, config=HOTSPOT_CONFIG):
+        self.config = config
+        self.stations = list(stations)
+        self.types = list(types)
+        self.station_idx = {name: i for i, name in enumerate(self.stations)}
+        self.type_idx = {name: i for i, name in enumerate(self.types)}
+        self.troncal_names, troncal_idx = np.unique(troncales, return_inverse=True)
+        n_stations = len(self.stations)
+        # Claves: estaciones 0..n-1 y troncales n..n+k-1
+        self.troncal_key = n_stations + troncal_idx
+        n_keys = n_stations + len(self.troncal_names)
+
+        self.baseline = np.zeros((n_keys, 7, 24), dtype=np.float64)
+        self.baseline[:n_stations] = baseline
+        np.add.at(self.baseline, self.troncal_key, baseline)
+
+        self.levels = np.zeros((n_keys, len(self.types)), dtype=np.float64)
+        self.updated = np.zeros(n_keys, dtype=np.float64)
+        self.last_alert = np.full(n_keys, -np.inf)
+        self.built_at = time.time()
+        self._lock = threading.Lock()
+
+    def _key_name(self, key):
+        if key < len(self.stations):
+            return 'station', self.stations[key]
+        return 'troncal', str(self.troncal_names[key - len(self.stations)])
+
+    def _update(self, key, type_i, age, now):
+        """Decae el nivel de la clave hasta now y suma un incidente de hace age segundos."""
+        window = self.config['window_seconds']
+        self.levels[key] *= math.exp(-(now - self.updated[key]) / window)
+        self.levels[key, type_i] += math.exp(-age / window)
+        self.updated[key] = now
+
+    def _check(self, key, now, now_dt):
+        level = float(self.levels[key].sum())
+        if level < self.config['min_count'] or now - self.last_alert[key] < self.config['cooldown_seconds']:
+            return None
+        window = self.config['window_seconds']
+        expected = float(self.baseline[key, now_dt.weekday(), now_dt.hour]) * window / 3600
+        surprise = poisson_surprise(level, max(expected, 1e-6))
+        if surprise < self.config['surprise_threshold']:
+            return None
+
+        self.last_alert[key] = now
+        scope, name = self._key_name(key)
+        if scope == 'station':
+            station, troncal = name, str(self.troncal_names[self.troncal_key[key] - len(self.stations)])
+        else:
+            station, troncal = None, name
+        return {
+            'scope': scope,
+            'station': station,
+            'troncal': troncal,
+            'incident_type': self.types[int(np.argmax(self.levels[key]))],
+            'predicted_time': now_dt.isoformat(),
+            # P(al menos un incidente en la próxima hora) al ritmo observado
+            'risk_score': round(1.0 - math.exp(-level * 3600 / window), 4),
+            'observed': round(level, 2),
+            'expected': round(expected, 3),
+            'surprise': round(surprise, 1),
+            'window_minutes': round(window / 60)
+        }
+
+    def observe(self, station, timestamp, incident_type, alert=True):
+        """
+        Incorpora un incidente y evalúa su estación y su troncal.
+
+        Returns:
+            list: Alertas nuevas (vacía si no hay foco o la estación no se reconoce)
+        """
+        station_i = self.station_idx.get(station)
+        type_i = self.type_idx.get(incident_type)
+        if station_i is None or type_i is None:
+            return []
+        now_dt = bogota_now()
+        age = max(0.0, (now_dt - timestamp).total_seconds())
+        if age > self.config['seed_windows'] * self.config['window_seconds']:
+            return []
+
+        now = time.time()
+        alerts = []
+        with self._lock:
+            for key in (station_i, self.troncal_key[station_i]):
+                self._update(key, type_i, age, now)
+                if alert:
+                    found = self._check(key, now, now_dt)
+                    if found is not None:
+                        alerts.append(found)
+        return alerts
+
+    def observe_frame(self, incidents):
+        """Incorpora un lote (DataFrame con timestamp, nearest_station, incident_type); solo evalúa lo reciente."""
+        since = bogota_now() - timedelta(seconds=self.config['seed_windows'] * self.config['window_seconds'])
+        recent = incidents[incidents['timestamp'] >= since]
+        alerts = []
+        for station, incident_type, timestamp in zip(recent['nearest_station'], recent['incident_type'],
+                                                     recent['timestamp']):
+            alerts.extend(self.observe(station, timestamp.to_pydatetime(), incident_type))
+        return alerts
+
+    def levels_by_key(self):
+        """Niveles actuales (decaídos a este instante) distintos de cero, por estación y troncal."""
+        now = time.time()
+        with self._lock:
+            decay = np.exp(-(now - self.updated) / self.config['window_seconds'])
+            totals = self.levels.sum(axis=1) * decay
+        return {self._key_name(key): round(float(totals[key]), 3) for key in np.flatnonzero(totals > 1e-3)}
+
+
+def build_hotspot_detector():
+    """
+    Detector con la tasa histórica del motor bayesiano compartido (construido
+    desde los agregados publicados, ver risk_engine.build_risk_engine) y los
+    incidentes recientes (una consulta).
+    """
+    from database import read_session
+    from models import Incident
+    from risk_engine import get_risk_engine
+    from rollups import incident_types
+    from stations import load_stations
+
+    engine = get_risk_engine()
+    if engine is None:
+        raise RuntimeError("motor bayesiano no disponible")
+    stations = load_stations()
+    detector = HotspotDetector([station['nombre'] for station in stations],
+                               [station['troncal'] for station in stations],
+                               incident_types(), engine.hourly_rates())
+
+    since = bogota_now() - timedelta(seconds=HOTSPOT_CONFIG['seed_windows'] * HOTSPOT_CONFIG['window_seconds'])
+    with read_session() as session:
+        recent = session.query(Incident.nearest_station, Incident.incident_type, Incident.timestamp) \
+            .filter(Incident.timestamp >= since).order_by(Incident.timestamp).all()
+    for station, incident_type, timestamp in recent:
+        detector.observe(station, timestamp, incident_type, alert=False)
+    return detector
+
+
+_detector = None
+
+
+def _detector_stale():
+    detector = _detector
+    return detector is None or time.time() - detector.built_at >= HOTSPOT_CONFIG['reconcile_seconds']
+
+
+def _rebuild_detector():
+    """Reconstruye el detector del proceso conservando los periodos de silencio."""
+    global _detector
+    detector = build_hotspot_detector()
+    previous = _detector
+    if previous is not None and detector.last_alert.shape == previous.last_alert.shape:
+        detector.last_alert = np.maximum(detector.last_alert, previous.last_alert)
+    _detector = detector
+
+
+_detector_refresh = BackgroundRefresh('detector de focos', _rebuild_detector, _detector_stale,
+                                      HOTSPOT_CONFIG['retry_seconds'])
+
+
+def get_hotspot_detector():
+    """
+    Detector del proceso. La primera consulta (el primer incidente que recibe el
+    worker) inicia la construcción en segundo plano y se reconstruye cada
+    HOTSPOT_CONFIG['reconcile_seconds'] de la misma forma (offload.BackgroundRefresh);
+    mientras tanto se usa el anterior.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Returns:
+        HotspotDetector o None si todavía no se ha construido
+    """
+    if _detector_stale():
+        _detector_refresh.trigger()
+    return _detector
+
+
+def emit_alerts(alerts):
+    """Emite prediction_alert a las salas de la estación, de su troncal y de todas las alertas."""
+    from socketio_queue import emit_event
+
+    for alert in alerts:
+        rooms = [troncal_room(alert['troncal']), ALL_ALERTS_ROOM]
+        if alert['scope'] == 'station':
+            rooms.insert(0, station_room(alert['station']))
+        logging.warning(f"Foco de incidentes en {alert['scope']} {alert['station'] or alert['troncal']}: "
+                        f"{alert['observed']} observados vs {alert['expected']} esperados "
+                        f"(sorpresa {alert['surprise']})")
+        HOTSPOT_ALERTS.inc(scope=alert['scope'])
+        emit_event('prediction_alert', alert, room=rooms)
+
+
+def record_incident(incident):
+    """Evalúa un incidente recién guardado (solo si el detector ya está cargado) y emite sus alertas."""
+    detector = get_hotspot_detector()
+    if detector is None:
+        return
+    try:
+        emit_alerts(detector.observe(incident.nearest_station, incident.timestamp, incident.incident_type))
+    except Exception as e:
+        logging.error(f"Error evaluando focos de incidentes: {str(e)}")
+
+
+def observe_incident_batch(incidents):
+    """
+    Evalúa un lote de incidentes importados (solo si el detector ya está cargado)
+    sin emitir; incident_ingest lo ejecuta en el threadpool.
+
+    Returns:
+        list: Alertas nuevas
+    """
+    detector = get_hotspot_detector()
+    if detector is None:
+        return []
+    try:
+        return detector.observe_frame(incidents)
+    except Exception as e:
+        logging.error(f"Error evaluando focos de incidentes del lote: {str(e)}")
+        return []
+
+
+def record_incident_batch(incidents):
+    """Evalúa un lote de incidentes importados y emite sus alertas."""
+    emit_alerts(observe_incident_batch(incidents))
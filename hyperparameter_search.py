@@ -0,0 +1,312 @@
+"""
+Búsqueda de Hiperparámetros para el Modelo RNN
+---------------------------------------------
+
+Este módulo maneja:
+1. Muestreo aleatorio de configuraciones alrededor de MODEL_CONFIG
+2. Entrenamiento en paralelo (un proceso por prueba) sobre secuencias cacheadas
+3. Poda temprana mediante successive halving: cada ronda multiplica las épocas
+   por `eta` y solo conserva la mejor fracción 1/eta de las configuraciones
+4. Registro de AUC, throughput de entrenamiento (muestras/seg) y latencia de
+   inferencia de cada prueba
+5. Emisión de la mejor configuración como artefacto versionado en models/search/
+
+La selección equilibra precisión y latencia de servicio: las configuraciones
+que superan `latency_budget_ms` se penalizan en proporción al exceso.
+
+Uso:
+    python hyperparameter_search.py --trials 27 --workers 4
+"""
+
+import argparse
+import glob
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+from ml_models import (MODEL_CONFIG, _configure_worker_threads, create_rnn_model,
+                       prepare_data, prepare_sequence_data)
+
+logging.basicConfig(level=logging.INFO)
+
+# Espacio de búsqueda: listas son categóricas, tuplas (min, max, escala) son continuas
+SEARCH_SPACE = {
+    'lstm_units': [8, 16, 32, 64],
+    'dropout_rate': (0.1, 0.5, 'linear'),
+    'learning_rate': (1e-4, 1e-2, 'log'),
+    'batch_size': [16, 32, 64, 128],
+    'l2_lambda': (1e-4, 5e-2, 'log')
+}
+
+SEARCH_CONFIG = {
+    'n_trials': 27,
+    'eta': 3,                     # Factor de reducción de successive halving
+    'min_epochs': 2,              # Épocas de la primera ronda
+    'max_epochs': MODEL_CONFIG['epochs'],
+    'latency_budget_ms': 5.0,     # Latencia máxima deseada para una predicción
+    'latency_penalty': 0.1,       # AUC descontado por cada presupuesto excedido
+    'latency_repeats': 50,
+    'validation_split': 0.2,
+    'cache_path': 'models/search_cache.npz',
+    'output_dir': 'models/search',
+    'seed': 42
+}
+
+
+def sample_configurations(n_trials, seed=None):
+    """
+    Muestrea configuraciones del espacio de búsqueda.
+    La primera configuración es siempre MODEL_CONFIG como referencia.
+    """
+    rng = random.Random(seed)
+    configs = [{key: MODEL_CONFIG[key] for key in SEARCH_SPACE}]
+
+    while len(configs) < n_trials:
+        config = {}
+        for key, space in SEARCH_SPACE.items():
+            if isinstance(space, list):
+                config[key] = rng.choice(space)
+            else:
+                low, high, scale = space
+                if scale == 'log':
+                    value = math.exp(rng.uniform(math.log(low), math.log(high)))
+                else:
+                    value = rng.uniform(low, high)
+                config[key] = float(f"{value:.3g}")
+        configs.append(config)
+
+    return configs
+
+
+def load_windowed_data(refresh=False):
+    """
+    Carga las secuencias de entrenamiento desde el caché en disco.
+    Si no existe (o refresh=True), las genera desde la base de datos y las guarda,
+    de modo que todas las pruebas reutilicen la misma ventana de datos.
+
+    Returns:
+        str: Ruta del archivo .npz con X e y, o None si no hay datos suficientes
+    """
+    cache_path = SEARCH_CONFIG['cache_path']
+    if os.path.exists(cache_path) and not refresh:
+        logging.info(f"Usando secuencias cacheadas de {cache_path}")
+        return cache_path
+
+    from app import app
+    with app.app_context():
+        data = prepare_data()
+    if len(data) < MODEL_CONFIG['sequence_length']:
+        logging.error(f"Insufficient data for hyperparameter search: {len(data)} samples")
+        return None
+
+    X, y = prepare_sequence_data(data, MODEL_CONFIG['sequence_length'])
+    if len(X) == 0:
+        logging.error("No sequences could be generated for hyperparameter search")
+        return None
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    np.savez_compressed(cache_path, X=X.astype(np.float32), y=y.astype(np.float32))
+    logging.info(f"Secuencias guardadas en {cache_path}: X={X.shape}")
+    return cache_path
+
+
+def _measure_inference_latency(model, sample, repeats):
+    """Mide la latencia mediana (ms) de una predicción individual."""
+    model(sample, training=False)  # Calentamiento
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model(sample, training=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def _evaluate_trial(trial_id, config, epochs, cache_path):
+    """
+    Entrena y evalúa una configuración. Se ejecuta en un proceso trabajador.
+
+    Returns:
+        dict: Resultado de la prueba con AUC, throughput y latencia
+    """
+    from sklearn.metrics import roc_auc_score
+
+    data = np.load(cache_path)
+    X, y = data['X'], data['y']
+    split = int(len(X) * (1 - SEARCH_CONFIG['validation_split']))
+    X_train, X_val = X[:split], X[split:]
+    y_train, y_val = y[:split], y[split:]
+
+    model = create_rnn_model(config)
+    if model is None:
+        return {'trial_id': trial_id, 'config': config, 'epochs': epochs, 'error': 'model creation failed'}
+
+    start = time.perf_counter()
+    model.fit(X_train, y_train, batch_size=config['batch_size'], epochs=epochs, verbose=0)
+    train_seconds = time.perf_counter() - start
+
+    y_pred = model.predict(X_val, batch_size=256, verbose=0).ravel()
+    try:
+        auc = float(roc_auc_score(y_val, y_pred))
+    except ValueError:
+        # Una sola clase en validación: el AUC no está definido
+        auc = 0.5
+
+    return {
+        'trial_id': trial_id,
+        'config': config,
+        'epochs': epochs,
+        'auc': auc,
+        'train_seconds': round(train_seconds, 3),
+        'throughput_samples_per_sec': round(len(X_train) * epochs / train_seconds, 1),
+        'inference_latency_ms': round(
+            _measure_inference_latency(model, X_val[:1], SEARCH_CONFIG['latency_repeats']), 3),
+        'parameters': int(model.count_params())
+    }
+
+
+def trial_score(result):
+    """
+    Puntaje de selección: AUC penalizado si la latencia supera el presupuesto.
+    """
+    if 'error' in result:
+        return float('-inf')
+    budget = SEARCH_CONFIG['latency_budget_ms']
+    excess = max(0.0, result['inference_latency_ms'] - budget) / budget
+    return result['auc'] - SEARCH_CONFIG['latency_penalty'] * excess
+
+
+def _next_version(output_dir):
+    versions = []
+    for path in glob.glob(os.path.join(output_dir, 'best_config_v*.json')):
+        try:
+            versions.append(int(os.path.basename(path)[len('best_config_v'):-len('.json')]))
+        except ValueError:
+            continue
+    return max(versions, default=0) + 1
+
+
+def write_best_config(best, trials):
+    """
+    Guarda la mejor configuración como artefacto versionado.
+
+    Returns:
+        str: Ruta del artefacto generado
+    """
+    output_dir = SEARCH_CONFIG['output_dir']
+    os.makedirs(output_dir, exist_ok=True)
+    version = _next_version(output_dir)
+    path = os.path.join(output_dir, f'best_config_v{version:03d}.json')
+
+    artifact = {
+        'version': version,
+        'timestamp': datetime.now().isoformat(),
+        'model_config': {**MODEL_CONFIG, **best['config']},
+        'metrics': {key: best[key] for key in
+                    ('auc', 'epochs', 'throughput_samples_per_sec', 'inference_latency_ms', 'parameters')},
+        'score': trial_score(best),
+        'search': {key: SEARCH_CONFIG[key] for key in
+                   ('n_trials', 'eta', 'min_epochs', 'max_epochs', 'latency_budget_ms', 'latency_penalty')},
+        'trials': trials
+    }
+    with open(path, 'w') as f:
+        json.dump(artifact, f, indent=2)
+
+    logging.info(f"Mejor configuración guardada en {path}")
+    return path
+
+
+def run_search(n_trials=None, n_workers=None, refresh_data=False):
+    """
+    Ejecuta la búsqueda con successive halving.
+
+    Args:
+        n_trials (int): Configuraciones iniciales
+        n_workers (int): Procesos en paralelo
+        refresh_data (bool): Regenerar el caché de secuencias
+
+    Returns:
+        str: Ruta del artefacto con la mejor configuración, o None si falla
+    """
+    try:
+        n_trials = n_trials or SEARCH_CONFIG['n_trials']
+        cache_path = load_windowed_data(refresh=refresh_data)
+        if cache_path is None:
+            return None
+
+        cpu_count = os.cpu_count() or 1
+        n_workers = max(1, min(n_workers or cpu_count, cpu_count))
+        threads_per_worker = max(1, cpu_count // n_workers)
+        eta = SEARCH_CONFIG['eta']
+
+        survivors = list(enumerate(sample_configurations(n_trials, SEARCH_CONFIG['seed'])))
+        epochs = SEARCH_CONFIG['min_epochs']
+        all_trials = []
+        rung = 0
+
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_configure_worker_threads,
+                                 initargs=(threads_per_worker,)) as executor:
+            while survivors:
+                logging.info(f"Ronda {rung}: {len(survivors)} configuraciones, {epochs} épocas")
+                futures = [executor.submit(_evaluate_trial, trial_id, config, epochs, cache_path)
+                           for trial_id, config in survivors]
+
+                results = []
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except Exception as trial_error:
+                        logging.error(f"Trial failed: {str(trial_error)}")
+                        continue
+                    result['rung'] = rung
+                    results.append(result)
+                    if 'error' not in result:
+                        logging.info(f"Trial {result['trial_id']} - AUC: {result['auc']:.4f}, "
+                                     f"{result['throughput_samples_per_sec']} samples/s, "
+                                     f"{result['inference_latency_ms']} ms")
+
+                all_trials.extend(results)
+                results.sort(key=trial_score, reverse=True)
+
+                if epochs >= SEARCH_CONFIG['max_epochs'] or len(results) <= 1:
+                    break
+
+                keep = max(1, len(results) // eta)
+                survivors = [(r['trial_id'], r['config']) for r in results[:keep] if 'error' not in r]
+                epochs = min(epochs * eta, SEARCH_CONFIG['max_epochs'])
+                rung += 1
+
+        # Solo se comparan pruebas de la última ronda (mismo presupuesto de épocas)
+        final = [r for r in all_trials if r['rung'] == rung and 'error' not in r]
+        if not final:
+            logging.error("No trial completed successfully")
+            return None
+
+        best = max(final, key=trial_score)
+        logging.info(f"Mejor configuración: {best['config']} (AUC {best['auc']:.4f}, "
+                     f"{best['inference_latency_ms']} ms)")
+        return write_best_config(best, all_trials)
+
+    except Exception as e:
+        logging.error(f"Error en la búsqueda de hiperparámetros: {str(e)}", exc_info=True)
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Búsqueda de hiperparámetros del modelo RNN")
+    parser.add_argument('--trials', type=int, default=SEARCH_CONFIG['n_trials'])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--refresh-data', action='store_true',
+                        help="Regenerar el caché de secuencias desde la base de datos")
+    args = parser.parse_args()
+    os.environ.setdefault('DB_ROLE', 'training')
+    run_search(n_trials=args.trials, n_workers=args.workers, refresh_data=args.refresh_data)
@@ -0,0 +1,363 @@
+"""
+Importación masiva de incidentes
+-------------------------------
+
+Acepta lotes NDJSON (un objeto JSON por línea) o CSV con las columnas:
+
+    incident_type, timestamp, nearest_station, latitude, longitude, description
+
+`nearest_station` o el par latitude/longitude es obligatorio; lo que falte se
+completa con el registro de estaciones (stations.py). El archivo se procesa en
+bloques de INGEST_CONFIG['chunk_size'] filas:
+
+1. Validación vectorizada con pandas (tipos, fechas, coordenadas)
+2. Resolución de estaciones por nombre normalizado o por la estación más cercana
+3. Inserción con COPY en PostgreSQL o executemany en otros motores
+4. Actualización de agregados y notificación una sola vez por bloque
+
+Bajo gevent el trabajo de cada bloque corre en el threadpool de offload.py.
+
+Uso (desde la raíz del proyecto):
+    python incident_ingest.py incidentes.ndjson --user-id 1
+    python incident_ingest.py incidentes.csv --format csv --chunk-size 100000
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import time
+import unicodedata
+from datetime import timedelta
+
+import numpy as np
+
+from bogota_clock import BOGOTA_TZ, bogota_now
+from database import db
+from models import Incident
+from offload import run_cpu_bound
+from stations import load_stations, station_index
+
+INGEST_CONFIG = {
+    'chunk_size': 50000,
+    'parse_rows': 5000,           # Filas por llamada al parser dentro de un bloque
+    'max_future_minutes': 10,     # Tolerancia para relojes adelantados
+    'max_station_distance_km': 2.0,  # Coordenadas más lejos de toda estación se rechazan
+    'max_rejected_examples': 20,
+    'spool_block_bytes': 1 << 20  # Bloques al copiar el cuerpo de la solicitud a disco
+}
+
+INCIDENT_COLUMNS = ['incident_type', 'description', 'latitude', 'longitude',
+                    'timestamp', 'user_id', 'nearest_station']
+
+_EARTH_RADIUS_KM = 6371.0
+
+
+def _normalize_name(name):
+    """Nombre en minúsculas, sin tildes ni espacios repetidos."""
+    text = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(text.lower().split())
+
+
+def _normalized_station_index():
+    return {_normalize_name(name): name for name in station_index()}
+
+
+def nearest_stations(latitudes, longitudes):
+    """
+    Estación más cercana a cada coordenada (aproximación equirrectangular).
+
+    Returns:
+        tuple: (índices en load_stations(), distancias en km)
+    """
+    stations = load_stations()
+    station_lat = np.radians([s['latitude'] for s in stations])
+    station_lon = np.radians([s['longitude'] for s in stations])
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))[:, None]
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))[:, None]
+
+    x = (lon - station_lon[None, :]) * np.cos((lat + station_lat[None, :]) / 2)
+    y = lat - station_lat[None, :]
+    distances = np.sqrt(x ** 2 + y ** 2)
+    idx = distances.argmin(axis=1)
+    return idx, distances[np.arange(len(idx)), idx] * _EARTH_RADIUS_KM
+
+
+def read_chunks(source, fmt='ndjson', chunk_size=None):
+    """
+    Lee un archivo o flujo por bloques.
+
+    Args:
+        source: Ruta o flujo de texto/bytes
+        fmt (str): 'ndjson' o 'csv'
+
+    Yields:
+        pandas.DataFrame: Bloques de chunk_size filas
+    """
+    import pandas as pd
+
+    chunk_size = chunk_size or INGEST_CONFIG['chunk_size']
+    # El parser de C no cede el GIL: se parsea en partes pequeñas para que el
+    # bucle de eventos avance mientras un bloque se lee en el threadpool
+    parse_rows = min(chunk_size, INGEST_CONFIG['parse_rows'])
+    if fmt == 'csv':
+        reader = pd.read_csv(source, chunksize=parse_rows, dtype={'nearest_station': str,
+                                                                   'incident_type': str,
+                                                                   'description': str})
+    elif fmt == 'ndjson':
+        reader = pd.read_json(source, lines=True, chunksize=parse_rows, dtype=False,
+                              convert_dates=False)
+    else:
+        raise ValueError(f"Formato no soportado: {fmt}")
+    parts, rows = [], 0
+    for part in reader:
+        parts.append(part)
+        rows += len(part)
+        if rows >= chunk_size:
+            yield pd.concat(parts, ignore_index=True)
+            parts, rows = [], 0
+    if parts:
+        yield pd.concat(parts, ignore_index=True)
+
+
+def validate_batch(frame, user_id):
+    """
+    Valida y normaliza un bloque de incidentes.
+
+    Returns:
+        tuple: (DataFrame con INCIDENT_COLUMNS listo para insertar,
+            dict de rechazos por motivo, lista de ejemplos de filas rechazadas)
+    """
+    import pandas as pd
+    from prediction_service import VALID_INCIDENT_TYPES
+
+    frame = frame.reset_index(drop=True)
+    n = len(frame)
+    reasons = pd.Series(pd.NA, index=frame.index, dtype='object')
+
+    def reject(mask, reason):
+        mask = mask & reasons.isna()
+        reasons[mask] = reason
+
+    def column(name):
+        return frame[name] if name in frame.columns else pd.Series([None] * n, index=frame.index)
+
+    incident_type = column('incident_type').astype('string').str.strip()
+    reject(~incident_type.isin(VALID_INCIDENT_TYPES).fillna(False).astype(bool), 'invalid_incident_type')
+
+    # Las horas con zona se convierten a Bogotá; las horas sin zona ya son hora de Bogotá
+    raw_timestamps = column('timestamp').astype('string').str.strip()
+    aware = raw_timestamps.str.contains(r'(?:Z|[+-]\d{2}:?\d{2})$', regex=True).fillna(False).astype(bool)
+    timestamps = pd.Series(pd.NaT, index=frame.index, dtype='datetime64[ns]')
+    if (~aware).any():
+        timestamps[~aware] = pd.to_datetime(raw_timestamps[~aware], errors='coerce', format='ISO8601')
+    if aware.any():
+        timestamps[aware] = (pd.to_datetime(raw_timestamps[aware], errors='coerce', format='ISO8601', utc=True)
+                             .dt.tz_convert(BOGOTA_TZ).dt.tz_localize(None))
+    reject(timestamps.isna(), 'invalid_timestamp')
+    max_timestamp = bogota_now() + timedelta(minutes=INGEST_CONFIG['max_future_minutes'])
+    reject(timestamps > max_timestamp, 'future_timestamp')
+
+    latitude = pd.to_numeric(column('latitude'), errors='coerce')
+    longitude = pd.to_numeric(column('longitude'), errors='coerce')
+    has_coords = latitude.between(-90, 90) & longitude.between(-180, 180)
+
+    # Estación por nombre (normalizado) y, si no se reconoce, por coordenadas
+    names = column('nearest_station').astype('string')
+    normalized_index = _normalized_station_index()
+    lookup = {name: normalized_index.get(_normalize_name(name)) for name in names.dropna().unique()}
+    station = names.map(lookup).astype(object)
+    by_coords = station.isna() & has_coords
+    if by_coords.any():
+        idx, distance = nearest_stations(latitude[by_coords], longitude[by_coords])
+        resolved = pd.Series(np.array([s['nombre'] for s in load_stations()], dtype=object)[idx],
+                             index=latitude[by_coords].index)
+        resolved[distance > INGEST_CONFIG['max_station_distance_km']] = None
+        station[by_coords] = resolved
+    reject(station.isna(), 'unknown_station')
+
+    # Coordenadas faltantes: las de la estación
+    latitude = latitude.where(has_coords, station.map({s['nombre']: s['latitude'] for s in load_stations()}))
+    longitude = longitude.where(has_coords, station.map({s['nombre']: s['longitude'] for s in load_stations()}))
+
+    valid = reasons.isna()
+    rejected = reasons[~valid].value_counts().to_dict()
+    examples = [{'row': int(i), 'reason': reasons[i]}
+                for i in reasons[~valid].index[:INGEST_CONFIG['max_rejected_examples']]]
+
+    description = column('description').astype('string')
+    clean = pd.DataFrame({
+        'incident_type': incident_type[valid].astype(str),
+        'description': description[valid].astype(object).where(description[valid].notna(), None),
+        'latitude': latitude[valid].astype(float),
+        'longitude': longitude[valid].astype(float),
+        'timestamp': timestamps[valid],
+        'user_id': user_id,
+        'nearest_station': station[valid].astype(str)
+    }, columns=INCIDENT_COLUMNS)
+    return clean, rejected, examples
+
+
+def insert_batch(frame):
+    """
+    Inserta un bloque validado en una sola transacción: COPY en PostgreSQL,
+    executemany (insertmanyvalues de SQLAlchemy) en otros motores.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Returns:
+        int: Filas insertadas
+    """
+    if frame.empty:
+        return 0
+    try:
+        if db.engine.dialect.name == 'postgresql':
+            buffer = io.StringIO()
+            frame.to_csv(buffer, index=False, header=False, columns=INCIDENT_COLUMNS,
+                         date_format='%Y-%m-%d %H:%M:%S.%f', quoting=csv.QUOTE_MINIMAL)
+            buffer.seek(0)
+            cursor = db.session.connection().connection.cursor()
+            cursor.copy_expert(
+                f"COPY {Incident.__tablename__} ({', '.join(INCIDENT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer)
+        else:
+            # Registros armados por columnas (mucho más rápido que to_dict('records'))
+            columns = [frame[name].astype(object).where(frame[name].notna(), None).tolist()
+                       for name in INCIDENT_COLUMNS if name != 'timestamp']
+            columns.insert(INCIDENT_COLUMNS.index('timestamp'), list(frame['timestamp'].dt.to_pydatetime()))
+            records = [dict(zip(INCIDENT_COLUMNS, row)) for row in zip(*columns)]
+            db.session.execute(Incident.__table__.insert(), records)
+        db.session.commit()
+        return len(frame)
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _record_batch(frame):
+    """
+    Agregados en memoria del bloque (motor bayesiano, estadísticas en streaming,
+    características en vivo y detector de focos). Es trabajo de CPU y se ejecuta
+    con run_cpu_bound; las alertas se devuelven para emitirlas desde el greenlet.
+
+    Returns:
+        list: Alertas de focos nuevas
+    """
+    import hotspots
+    import incident_stream
+    import live_features
+    from risk_engine import record_incident_batch
+
+    record_incident_batch(frame)
+    incident_stream.record_incident_batch(frame)
+    live_features.record_incident_batch(frame)
+    return hotspots.observe_incident_batch(frame)
+
+
+def after_batch(frame):
+    """
+    Efectos posteriores, una sola vez por bloque: agregados del motor bayesiano,
+    de las estadísticas en streaming y de las características en vivo del RNN,
+    detección de focos y una notificación resumen a los clientes conectados.
+    """
+    import hotspots
+
+    hotspots.emit_alerts(run_cpu_bound(_record_batch, frame))
+    by_type = frame['incident_type'].value_counts().to_dict()
+    summary = {
+        'count': int(len(frame)),
+        'by_type': {k: int(v) for k, v in by_type.items()},
+        'from': frame['timestamp'].min().isoformat(),
+        'to': frame['timestamp'].max().isoformat()
+    }
+    logging.info(f"Lote de incidentes importado: {summary}")
+    try:
+        from socketio_queue import emit_event
+        emit_event('incidents_imported', summary)
+    except Exception as e:
+        logging.warning(f"No se pudo notificar el lote importado: {str(e)}")
+    return summary
+
+
+def ingest_chunks(chunks, user_id, dry_run=False, summary=None):
+    """
+    Valida, inserta y notifica cada bloque. Cada bloque se confirma por separado:
+    si uno falla, los anteriores ya quedaron insertados.
+    La lectura, la validación, la inserción y los agregados de cada bloque se
+    ejecutan con offload.run_cpu_bound (en línea sin gevent): `chunks` no debe
+    leer de un socket de gevent (ver api_incidents_bulk en routes.py).
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Args:
+        summary (dict): Resumen a completar en el lugar; permite saber cuántas
+            filas se insertaron antes de un error
+
+    Returns:
+        dict: Resumen con filas leídas, insertadas, rechazos por motivo y duración
+    """
+    start = time.perf_counter()
+    summary = summary if summary is not None else {}
+    summary.update({'read': 0, 'inserted': 0, 'rejected': {}, 'rejected_examples': [], 'batches': 0})
+    chunks = iter(chunks)
+    while True:
+        chunk = run_cpu_bound(next, chunks, None)
+        if chunk is None:
+            break
+        offset = summary['read']
+        clean, rejected, examples = run_cpu_bound(validate_batch, chunk, user_id)
+        summary['read'] += len(chunk)
+        summary['batches'] += 1
+        for reason, count in rejected.items():
+            summary['rejected'][reason] = summary['rejected'].get(reason, 0) + int(count)
+        room = INGEST_CONFIG['max_rejected_examples'] - len(summary['rejected_examples'])
+        summary['rejected_examples'].extend(
+            dict(example, row=example['row'] + offset) for example in examples[:max(room, 0)])
+
+        if dry_run or clean.empty:
+            continue
+        summary['inserted'] += run_cpu_bound(insert_batch, clean)
+        after_batch(clean)
+        logging.info(f"Bloque {summary['batches']}: {len(clean)} insertados, "
+                     f"{len(chunk) - len(clean)} rechazados")
+
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    summary['rows_per_second'] = round(summary['read'] / summary['seconds'], 1) if summary['seconds'] else None
+    return summary
+
+
+def ingest_file(path, fmt=None, user_id=None, chunk_size=None, dry_run=False):
+    """
+    Importa un archivo NDJSON o CSV. El formato se deduce de la extensión si no se indica.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+    """
+    if fmt is None:
+        fmt = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+    if user_id is None:
+        from models import User
+        user = User.query.order_by(User.id).first()
+        if user is None:
+            raise ValueError("No hay usuarios; indique --user-id de un usuario existente")
+        user_id = user.id
+    return ingest_chunks(read_chunks(path, fmt, chunk_size), user_id, dry_run=dry_run)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Importación masiva de incidentes (NDJSON/CSV)")
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default=None)
+    parser.add_argument('--user-id', type=int, default=None,
+                        help="Usuario al que se atribuyen los incidentes (por defecto el primero)")
+    parser.add_argument('--chunk-size', type=int, default=INGEST_CONFIG['chunk_size'])
+    parser.add_argument('--dry-run', action='store_true', help="Solo validar, sin insertar")
+    parser.add_argument('--skip-rebuild', action='store_true',
+                        help="No reconstruir la tabla de fallback al terminar")
+    args = parser.parse_args()
+
+    os.environ.setdefault('DB_ROLE', 'scheduler')
+    from app import app
+    with app.app_context():
+        result = ingest_file(args.path, args.format, args.user_id, args.chunk_size, args.dry_run)
+        logging.info(f"Importación terminada: {result}")
+        if result['inserted'] and not args.skip_rebuild:
+            from fallback_tables import rebuild_fallback_table
+            rebuild_fallback_table()
@@ -0,0 +1,360 @@
+"""
+Estadísticas de incidentes en streaming
+--------------------------------------
+
+Tablero en vivo sin GROUP BY por solicitud: el proceso mantiene en memoria
+estructuras que se actualizan con cada incidente guardado (record_incident,
+record_incident_batch) y se reconcilian con la base de datos cada
+INCIDENT_STREAM_CONFIG['reconcile_seconds'] en segundo plano (también recogen
+así lo que guardaron otros workers). Mientras no se han construido,
+get_incident_statistics consulta la base de datos.
+
+- SpaceSaving: top-K con memoria acotada por estación, tipo, hora y
+  (estación, tipo). Mientras el número de claves distintas no supera la
+  capacidad (ningún desalojo) los conteos son exactos, y get_incident_statistics
+  responde el tablero sin filtros de fecha desde aquí.
+- CountMinSketch: frecuencia aproximada (nunca por debajo de la real) de
+  combinaciones arbitrarias, p. ej. (estación, hora) o (estación, tipo, hora).
+- SlidingWindowCounter: conteos de la última hora, día y semana por fecha
+  del incidente, en buckets circulares con totales acumulados (resolución de
+  un bucket: 1 minuto para la hora, 1 hora para el día y la semana); cada
+  consulta es independiente del número de incidentes.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+import numpy as np
+
+from bogota_clock import bogota_epoch, bogota_now, from_bogota_epoch
+from offload import BackgroundRefresh
+
+INCIDENT_STREAM_CONFIG = {
+    'reconcile_seconds': 600,
+    'retry_seconds': 60,       # Espera tras una reconciliación fallida
+    'capacity': {'station': 512, 'type': 64, 'hour': 24, 'station_type': 4096},
+    'sketch_width': 16384,     # Error <= e / width * total con probabilidad 1 - e^-depth
+    'sketch_depth': 4,
+    # Ventana: (duración, tamaño del bucket) en segundos
+    'windows': {'hour': (3600, 60), 'day': (86400, 3600), 'week': (7 * 86400, 3600)},
+    'leaderboard_size': 10
+}
+
+# Columnas de top_stations, como en la consulta agrupada de get_incident_statistics
+STATISTICS_TYPES = ['Hurto', 'Acoso', 'Cosquilleo', 'Ataque',
+                    'Apertura de puertas', 'Hurto a mano armada', 'Sospechoso']
+
+
+class SpaceSaving:
+    """
+    Top-K de Metwally et al.: `capacity` contadores; una clave nueva con la
+    tabla llena reemplaza a la de menor conteo y hereda ese conteo como error.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.evictions = 0
+        self._ranked = None
+
+    def add(self, key, count=1):
+        if key in self.counts:
+            self.counts[key] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = count
+            self.errors[key] = 0
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(victim)
+            del self.errors[victim]
+            self.counts[key] = floor + count
+            self.errors[key] = floor
+            self.evictions += 1
+        self._ranked = None
+
+    @property
+    def exact(self):
+        return self.evictions == 0
+
+    def top(self, n=None):
+        """Claves de mayor a menor conteo (empates por clave): [(clave, conteo, error)]."""
+        if self._ranked is None:
+            self._ranked = sorted(self.counts.items(), key=lambda item: (-item[1], str(item[0])))
+        ranked = self._ranked if n is None else self._ranked[:n]
+        return [(key, count, self.errors[key]) for key, count in ranked]
+
+
+class CountMinSketch:
+    """Conteos aproximados en una matriz depth x width; la estimación es el mínimo de las filas."""
+
+    def __init__(self, width, depth):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self._rows = np.arange(depth)
+
+    def _columns(self, key):
+        return [hash((row, key)) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        self.table[self._rows, self._columns(key)] += count
+
+    def estimate(self, key):
+        return int(self.table[self._rows, self._columns(key)].min())
+
+
+class SlidingWindowCounter:
+    """Conteos por clave en los últimos `window_seconds`, en buckets de `bucket_seconds`."""
+
+    def __init__(self, window_seconds, bucket_seconds, now=None):
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = max(1, window_seconds // bucket_seconds)
+        self.bucket_ids = [None] * self.n_buckets
+        self.buckets = [Counter() for _ in range(self.n_buckets)]
+        self.totals = Counter()
+        self.head = self._bucket(time.time() if now is None else now) - self.n_buckets
+
+    def _bucket(self, timestamp):
+        return int(timestamp // self.bucket_seconds)
+
+    def advance(self, now=None):
+        """Descarta los buckets que salieron de la ventana."""
+        current = self._bucket(time.time() if now is None else now)
+        if current <= self.head:
+            return
+        for bucket in range(max(self.head + 1, current - self.n_buckets + 1), current + 1):
+            slot = bucket % self.n_buckets
+            if self.bucket_ids[slot] is not None and self.buckets[slot]:
+                self.totals.subtract(self.buckets[slot])
+                self.buckets[slot].clear()
+            self.bucket_ids[slot] = bucket
+        self.totals = +self.totals
+        self.head = current
+
+    def add(self, key, timestamp, count=1, now=None):
+        self.advance(now)
+        # Fechas futuras (reloj del cliente) cuentan en el bucket actual
+        bucket = min(self._bucket(timestamp), self.head)
+        if bucket <= self.head - self.n_buckets:
+            return
+        slot = bucket % self.n_buckets
+        self.buckets[slot][key] += count
+        self.totals[key] += count
+
+    def counts(self, now=None):
+        self.advance(now)
+        return self.totals
+
+
+class IncidentStream:
+    """Estadísticas en memoria de todos los incidentes y de las ventanas recientes."""
+
+    def __init__(self, config=INCIDENT_STREAM_CONFIG):
+        self.config = config
+        capacity = config['capacity']
+        self.total = 0
+        self.top = {dimension: SpaceSaving(size) for dimension, size in capacity.items()}
+        self.sketch = CountMinSketch(config['sketch_width'], config['sketch_depth'])
+        self.windows = {name: SlidingWindowCounter(window, bucket)
+                        for name, (window, bucket) in config['windows'].items()}
+        self.built_at = time.time()
+        self._lock = threading.Lock()
+
+    def _add(self, station, incident_type, hour, count):
+        """Conteos históricos de una combinación (estación, tipo, hora). Requiere self._lock."""
+        self.total += count
+        self.top['station'].add(station, count)
+        self.top['type'].add(incident_type, count)
+        self.top['hour'].add(hour, count)
+        self.top['station_type'].add((station, incident_type), count)
+        self.sketch.add((station, hour), count)
+        self.sketch.add((station, incident_type, hour), count)
+
+    def _add_recent(self, station, incident_type, hour, timestamp, count):
+        """Conteos de las ventanas recientes. Requiere self._lock."""
+        epoch = bogota_epoch(timestamp)
+        for window in self.windows.values():
+            window.add(('total', None), epoch, count)
+            window.add(('station', station), epoch, count)
+            window.add(('type', incident_type), epoch, count)
+            window.add(('hour', hour), epoch, count)
+
+    def observe(self, station, timestamp, incident_type, count=1):
+        with self._lock:
+            self._add(station, incident_type, timestamp.hour, count)
+            self._add_recent(station, incident_type, timestamp.hour, timestamp, count)
+
+    def observe_frame(self, incidents):
+        """
+        Incorpora un lote (DataFrame con timestamp, nearest_station, incident_type):
+        los conteos históricos con una sola agregación y las ventanas solo con
+        las filas de la última semana.
+        """
+        if incidents.empty:
+            return
+        hours = incidents['timestamp'].dt.hour
+        grouped = incidents.groupby([incidents['nearest_station'], incidents['incident_type'], hours]).size()
+        longest = max(window for window, _ in self.config['windows'].values())
+        recent = incidents[incidents['timestamp'] >= bogota_now() - timedelta(seconds=longest)]
+        with self._lock:
+            for (station, incident_type, hour), count in grouped.items():
+                self._add(station, incident_type, int(hour), int(count))
+            for station, incident_type, timestamp in zip(recent['nearest_station'], recent['incident_type'],
+                                                         recent['timestamp']):
+                self._add_recent(station, incident_type, timestamp.hour, timestamp.to_pydatetime(), 1)
+
+    @property
+    def exact(self):
+        return all(top.exact for top in self.top.values())
+
+    def estimate(self, station, hour=None, incident_type=None):
+        """Frecuencia histórica aproximada de (estación, hora) o (estación, tipo, hora)."""
+        key = (station, hour) if incident_type is None else (station, incident_type, hour)
+        return self.sketch.estimate(key)
+
+    def statistics(self):
+        """
+        Mismo formato que get_incident_statistics() sin filtros de fecha.
+
+        Returns:
+            dict o None si algún top-K desalojó claves (los conteos ya no son exactos)
+        """
+        with self._lock:
+            if not self.exact:
+                return None
+            stations = self.top['station'].top()
+            types = self.top['type'].top()
+            hours = self.top['hour'].top(1)
+            station_types = dict(((station, incident_type), count) for (station, incident_type), count, _
+                                 in self.top['station_type'].top())
+            total = self.total
+
+        return {
+            'total_incidents': total,
+            'most_affected_station': stations[0][0] if stations else "No data",
+            'most_dangerous_hour': f"{int(hours[0][0]):02d}:00" if hours else "No data",
+            'most_common_type': types[0][0] if types else "No data",
+            'incident_types': {incident_type: count for incident_type, count, _ in types},
+            'top_stations': {
+                station: {
+                    'total': count,
+                    **{incident_type.lower().replace(' ', '_'): station_types.get((station, incident_type), 0)
+                       for incident_type in STATISTICS_TYPES}
+                }
+                for station, count, _ in stations
+            }
+        }
+
+    def leaderboards(self, n=None):
+        """Top-n de estaciones, tipos y horas: histórico (con cota de error) y por ventana."""
+        n = n or self.config['leaderboard_size']
+        with self._lock:
+            result = {
+                'all_time': {
+                    'total': self.total,
+                    'exact': self.exact,
+                    **{dimension: [{'key': key, 'count': count, 'max_error': error}
+                                   for key, count, error in self.top[dimension].top(n)]
+                       for dimension in ('station', 'type', 'hour')}
+                },
+                'windows': {}
+            }
+            for name, window in self.windows.items():
+                counts = window.counts()
+                by_dimension = {'station': [], 'type': [], 'hour': []}
+                for (dimension, key), count in counts.items():
+                    if dimension in by_dimension:
+                        by_dimension[dimension].append((key, count))
+                result['windows'][name] = {
+                    'total': counts.get(('total', None), 0),
+                    **{dimension: [{'key': key, 'count': count}
+                                   for key, count in sorted(items, key=lambda item: (-item[1], str(item[0])))[:n]]
+                       for dimension, items in by_dimension.items()}
+                }
+        result['built_at'] = from_bogota_epoch(self.built_at).isoformat()
+        return result
+
+
+def build_incident_stream():
+    """
+    Construye las estadísticas desde la tabla de incidentes: una consulta agrupada
+    para el histórico y las filas de la última semana para las ventanas.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+    """
+    from sqlalchemy import extract, func
+
+    from database import read_session
+    from models import Incident
+
+    stream = IncidentStream()
+    longest = max(window for window, _ in stream.config['windows'].values())
+    since = bogota_now() - timedelta(seconds=longest)
+    hour_column = extract('hour', Incident.timestamp)
+    with read_session() as session:
+        grouped = session.query(Incident.nearest_station, Incident.incident_type, hour_column,
+                                func.count(Incident.id)) \
+            .group_by(Incident.nearest_station, Incident.incident_type, hour_column).all()
+        recent = session.query(Incident.nearest_station, Incident.incident_type, Incident.timestamp) \
+            .filter(Incident.timestamp >= since).all()
+
+    with stream._lock:
+        for station, incident_type, hour, count in grouped:
+            stream._add(station, incident_type, int(hour), count)
+        for station, incident_type, timestamp in recent:
+            stream._add_recent(station, incident_type, timestamp.hour, timestamp, 1)
+    return stream
+
+
+_stream = None
+
+
+def _stream_stale():
+    stream = _stream
+    return stream is None or time.time() - stream.built_at >= INCIDENT_STREAM_CONFIG['reconcile_seconds']
+
+
+def _rebuild_stream():
+    global _stream
+    _stream = build_incident_stream()
+
+
+_stream_refresh = BackgroundRefresh('estadísticas en streaming', _rebuild_stream, _stream_stale,
+                                    INCIDENT_STREAM_CONFIG['retry_seconds'])
+
+
+def get_incident_stream():
+    """
+    Estadísticas compartidas por el proceso; se reconcilian con la base de datos
+    cada INCIDENT_STREAM_CONFIG['reconcile_seconds'] en segundo plano
+    (offload.BackgroundRefresh) mientras se siguen sirviendo las anteriores.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Returns:
+        IncidentStream o None si todavía no se han construido
+    """
+    if _stream_stale():
+        _stream_refresh.trigger()
+    return _stream
+
+
+def record_incident(incident):
+    """Actualiza las estadísticas del proceso (si ya están cargadas) con un incidente recién guardado."""
+    if _stream is None:
+        return
+    try:
+        _stream.observe(incident.nearest_station, incident.timestamp, incident.incident_type)
+    except Exception as e:
+        logging.error(f"Error actualizando las estadísticas en streaming: {str(e)}")
+
+
+def record_incident_batch(incidents):
+    """Actualiza las estadísticas del proceso (si ya están cargadas) con un lote de incidentes importados."""
+    if _stream is None:
+        return
+    try:
+        _stream.observe_frame(incidents)
+    except Exception as e:
+        logging.error(f"Error actualizando las estadísticas en streaming con el lote: {str(e)}")
@@ -3,7 +3,7 @@ Utilidades para el manejo y análisis de incidentes.
 """
 from models import Incident
 from sqlalchemy import func, desc, extract
-from database import db
+from database import read_session
 from datetime import datetime
 import logging
 
@@ -13,31 +13,33 @@ def get_incidents_for_map():
     Retorna solo la información necesaria para la visualización.
     """
     try:
-        # Obtener estadísticas por estación usando la misma lógica que get_incident_statistics
-        station_stats = db.session.query(
-            Incident.nearest_station,
-            func.count(Incident.id).label('total')
-        ).group_by(Incident.nearest_station)\
-         .order_by(desc(func.count(Incident.id)))\
-         .all()
-
-        # Crear diccionario de conteo por estación
-        station_counts = {stat.nearest_station: stat.total for stat in station_stats}
-
-        # Obtener todos los incidentes
-        incidents = Incident.query.all()
-
-        # Procesar cada incidente incluyendo el total de su estación
-        return [{
-            'id': incident.id,
-            'incident_type': incident.incident_type,
-            'description': incident.description,
-            'latitude': incident.latitude,
-            'longitude': incident.longitude,
-            'timestamp': incident.timestamp.isoformat(),
-            'nearest_station': incident.nearest_station,
-            'station_total_incidents': station_counts.get(incident.nearest_station, 0)
-        } for incident in incidents]
+        # Consultas de solo lectura: réplica si está disponible (ver database.read_session)
+        with read_session() as session:
+            # Obtener estadísticas por estación usando la misma lógica que get_incident_statistics
+            station_stats = session.query(
+                Incident.nearest_station,
+                func.count(Incident.id).label('total')
+            ).group_by(Incident.nearest_station)\
+             .order_by(desc(func.count(Incident.id)))\
+             .all()
+
+            # Crear diccionario de conteo por estación
+            station_counts = {stat.nearest_station: stat.total for stat in station_stats}
+
+            # Obtener todos los incidentes
+            incidents = session.query(Incident).all()
+
+            # Procesar cada incidente incluyendo el total de su estación
+            return [{
+                'id': incident.id,
+                'incident_type': incident.incident_type,
+                'description': incident.description,
+                'latitude': incident.latitude,
+                'longitude': incident.longitude,
+                'timestamp': incident.timestamp.isoformat(),
+                'nearest_station': incident.nearest_station,
+                'station_total_incidents': station_counts.get(incident.nearest_station, 0)
+            } for incident in incidents]
 
     except Exception as e:
         logging.error(f"Error in get_incidents_for_map: {str(e)}", exc_info=True)
@@ -46,90 +48,113 @@ def get_incidents_for_map():
 def get_incident_statistics(date_from=None, date_to=None):
     """
     Obtiene estadísticas detalladas de incidentes con filtros de fecha opcionales.
+    Sin filtros responde desde incident_stream mientras sus conteos sean exactos.
     """
-    try:
-        logging.info("Iniciando obtención de estadísticas de incidentes")
-        logging.info(f"Filtros de fecha - desde: {date_from}, hasta: {date_to}")
-
-        # Construir la consulta base con filtros de fecha
-        base_query = Incident.query
-        if date_from:
-            base_query = base_query.filter(Incident.timestamp >= date_from)
-        if date_to:
-            base_query = base_query.filter(Incident.timestamp <= date_to)
-
-        # Total de incidentes
-        total_incidents = base_query.count()
-        logging.info(f"Total de incidentes encontrados: {total_incidents}")
-
-        # Estadísticas por estación
-        station_stats = db.session.query(
-            Incident.nearest_station,
-            func.count(Incident.id).label('total')
-        ).filter(
-            *([Incident.timestamp >= date_from] if date_from else []),
-            *([Incident.timestamp <= date_to] if date_to else [])
-        ).group_by(Incident.nearest_station)\
-         .order_by(desc(func.count(Incident.id)))\
-         .all()
-
-        logging.info(f"Estadísticas por estación obtenidas: {len(station_stats)} estaciones")
-
-        # Conteo por tipo de incidente
-        incidents_by_type = db.session.query(
-            Incident.incident_type,
-            func.count(Incident.id).label('count')
-        ).filter(
-            *([Incident.timestamp >= date_from] if date_from else []),
-            *([Incident.timestamp <= date_to] if date_to else [])
-        ).group_by(Incident.incident_type)\
-         .order_by(desc(func.count(Incident.id)))\
-         .all()
-
-        # Análisis de hora más peligrosa
-        hour_column = extract('hour', Incident.timestamp)
-        hour_stats = db.session.query(
-            hour_column.label('hour'),
-            func.count(Incident.id).label('count')
-        ).filter(
-            *([Incident.timestamp >= date_from] if date_from else []),
-            *([Incident.timestamp <= date_to] if date_to else [])
-        ).group_by(hour_column)\
-         .order_by(desc(func.count(Incident.id)))\
-         .first()
-
-        # Procesar estadísticas detalladas por estación
-        detailed_stats = {}
-        for stat in station_stats:
-            station_incidents = base_query.filter(
-                Incident.nearest_station == stat.nearest_station
-            )
-            type_counts = {}
-            for incident in ['Hurto', 'Acoso', 'Cosquilleo', 'Ataque', 
-                           'Apertura de puertas', 'Hurto a mano armada', 'Sospechoso']:
-                count = station_incidents.filter(
-                    Incident.incident_type == incident
-                ).count()
-                type_counts[incident.lower().replace(' ', '_')] = count
-
-            detailed_stats[stat.nearest_station] = {
-                'total': stat.total,
-                **type_counts
-            }
+    if date_from is None and date_to is None:
+        from incident_stream import get_incident_stream
 
-        logging.info("Estadísticas procesadas exitosamente")
+        stream = get_incident_stream()
+        statistics = stream.statistics() if stream is not None else None
+        if statistics is not None:
+            return statistics
 
-        return {
-            'total_incidents': total_incidents,
-            'most_affected_station': station_stats[0].nearest_station if station_stats else "No data",
-            'most_dangerous_hour': f"{int(hour_stats.hour):02d}:00" if hour_stats else "No data",
-            'most_common_type': incidents_by_type[0].incident_type if incidents_by_type else "No data",
-            'incident_types': {
-                incident.incident_type: incident.count 
-                for incident in incidents_by_type
-            },
-            'top_stations': detailed_stats
-        }
+    try:
+        # Consultas de solo lectura: réplica si está disponible (ver database.read_session)
+        with read_session() as session:
+            logging.info("Iniciando obtención de estadísticas de incidentes")
+            logging.info(f"Filtros de fecha - desde: {date_from}, hasta: {date_to}")
+
+            # Construir la consulta base con filtros de fecha
+            base_query = session.query(Incident)
+            if date_from:
+                base_query = base_query.filter(Incident.timestamp >= date_from)
+            if date_to:
+                base_query = base_query.filter(Incident.timestamp <= date_to)
+
+            # Total de incidentes
+            total_incidents = base_query.count()
+            logging.info(f"Total de incidentes encontrados: {total_incidents}")
+
+            # Estadísticas por estación
+            station_stats = session.query(
+                Incident.nearest_station,
+                func.count(Incident.id).label('total')
+            ).filter(
+                *([Incident.timestamp >= date_from] if date_from else []),
+                *([Incident.timestamp <= date_to] if date_to else [])
+            ).group_by(Incident.nearest_station)\
+             .order_by(desc(func.count(Incident.id)))\
+             .all()
+
+            logging.info(f"Estadísticas por estación obtenidas: {len(station_stats)} estaciones")
+
+            # Conteo por tipo de incidente
+            incidents_by_type = session.query(
+                Incident.incident_type,
+                func.count(Incident.id).label('count')
+            ).filter(
+                *([Incident.timestamp >= date_from] if date_from else []),
+                *([Incident.timestamp <= date_to] if date_to else [])
+            ).group_by(Incident.incident_type)\
+             .order_by(desc(func.count(Incident.id)))\
+             .all()
+
+            # Análisis de hora más peligrosa
+            hour_column = extract('hour', Incident.timestamp)
+            hour_stats = session.query(
+                hour_column.label('hour'),
+                func.count(Incident.id).label('count')
+            ).filter(
+                *([Incident.timestamp >= date_from] if date_from else []),
+                *([Incident.timestamp <= date_to] if date_to else [])
+            ).group_by(hour_column)\
+             .order_by(desc(func.count(Incident.id)))\
+             .first()
+
+            # Conteos por estación y tipo en una sola consulta agrupada
+            # (antes: una consulta por estación y tipo, 7 por estación)
+            station_type_counts = session.query(
+                Incident.nearest_station,
+                Incident.incident_type,
+                func.count(Incident.id).label('count')
+            ).filter(
+                *([Incident.timestamp >= date_from] if date_from else []),
+                *([Incident.timestamp <= date_to] if date_to else [])
+            ).group_by(Incident.nearest_station, Incident.incident_type)\
+             .all()
+
+            type_counts_by_station = {}
+            for row in station_type_counts:
+                type_counts_by_station.setdefault(row.nearest_station, {})[row.incident_type] = row.count
+
+            # Procesar estadísticas detalladas por estación
+            detailed_stats = {}
+            for stat in station_stats:
+                counts = type_counts_by_station.get(stat.nearest_station, {})
+                type_counts = {
+                    incident.lower().replace(' ', '_'): counts.get(incident, 0)
+                    for incident in ['Hurto', 'Acoso', 'Cosquilleo', 'Ataque',
+                                     'Apertura de puertas', 'Hurto a mano armada', 'Sospechoso']
+                }
+
+                detailed_stats[stat.nearest_station] = {
+                    'total': stat.total,
+                    **type_counts
+                }
+
+            logging.info("Estadísticas procesadas exitosamente")
+
+            return {
+                'total_incidents': total_incidents,
+                'most_affected_station': station_stats[0].nearest_station if station_stats else "No data",
+                'most_dangerous_hour': f"{int(hour_stats.hour):02d}:00" if hour_stats else "No data",
+                'most_common_type': incidents_by_type[0].incident_type if incidents_by_type else "No data",
+                'incident_types': {
+                    incident.incident_type: incident.count 
+                    for incident in incidents_by_type
+                },
+                'top_stations': detailed_stats
+            }
 
     except Exception as e:
         logging.error(f"Error in get_incident_statistics: {str(e)}", exc_info=True)
@@ -0,0 +1,457 @@
+"""
+Instrumentación de solicitudes y rutas críticas
+----------------------------------------------
+
+Capa ligera de métricas sin dependencias externas, expuesta en formato de
+texto de Prometheus en /metrics:
+
+- Latencia por ruta (histograma por regla de URL, método y estado)
+- Consultas SQL por solicitud y tiempo en base de datos (eventos de SQLAlchemy)
+- Aciertos y fallos de los cachés en memoria (record_cache)
+- Tiempo de inferencia por modelo (time_inference)
+- Trabajo de CPU en hilos nativos y retraso del bucle de eventos (offload)
+- Estado del pool de conexiones (database.pool_status) y estadísticas de los
+  niveles de predicción (prediction_resolver.get_tier_stats), leídos al exportar
+
+Detección de N+1: si una misma sentencia SQL se repite más de
+INSTRUMENTATION_CONFIG['n_plus_one_threshold'] veces en una solicitud, se
+cuenta en db_n_plus_one_total y se registra una advertencia (una vez por ruta
+y sentencia). El detalle se consulta con n_plus_one_report().
+
+Perfilador opcional: con REQUEST_PROFILING=1, una solicitud con el encabezado
+`X-Profile: 1` (o `?_profile=1`) se muestrea cada profile_interval_ms y las
+pilas agregadas (formato collapsed, compatible con flamegraph) se guardan en
+profile_dir; la ruta del archivo se devuelve en el encabezado X-Profile-Path.
+Se perfila una solicitud a la vez por proceso (las demás con X-Profile se
+atienden sin perfilar) y solo se cuentan las muestras de su greenlet: bajo
+gevent SIGPROF interrumpe a cualquier greenlet que esté corriendo.
+"""
+import logging
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g, has_request_context, request
+
+INSTRUMENTATION_CONFIG = {
+    'latency_buckets_s': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    'query_count_buckets': (0, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000),
+    'inference_buckets_s': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+    'lag_buckets_s': (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    'n_plus_one_threshold': int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10)),
+    'profiling_enabled': os.environ.get('REQUEST_PROFILING', '').lower() in ('1', 'true', 'yes'),
+    'profile_interval_ms': 5,
+    'profile_dir': 'profiles'
+}
+
+
+# --- Métricas ---
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """Contador acumulado por combinación de etiquetas."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self.values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+class Histogram:
+    """Histograma acumulado (buckets con límite superior, suma y conteo)."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        samples = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket",
+                                _format_labels(self.labelnames + ('le',), key + (bound,)), cumulative))
+            samples.append((f"{self.name}_bucket", _format_labels(self.labelnames + ('le',), key + ('+Inf',)), count))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, key), round(total, 6)))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, key), count))
+        return samples
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Latencia de las solicitudes HTTP',
+                            INSTRUMENTATION_CONFIG['latency_buckets_s'], ('route', 'method', 'status'))
+REQUEST_QUERIES = Histogram('http_request_db_queries', 'Consultas SQL por solicitud',
+                            INSTRUMENTATION_CONFIG['query_count_buckets'], ('route',))
+REQUEST_DB_TIME = Histogram('http_request_db_seconds', 'Tiempo en base de datos por solicitud',
+                            INSTRUMENTATION_CONFIG['latency_buckets_s'], ('route',))
+DB_QUERIES = Counter('db_queries_total', 'Consultas SQL ejecutadas', ('route',))
+N_PLUS_ONE = Counter('db_n_plus_one_total', 'Solicitudes con una sentencia SQL repetida (posible N+1)', ('route',))
+CACHE_REQUESTS = Counter('cache_requests_total', 'Consultas a cachés en memoria', ('cache', 'result'))
+INFERENCE_LATENCY = Histogram('model_inference_seconds', 'Tiempo de inferencia por modelo',
+                              INSTRUMENTATION_CONFIG['inference_buckets_s'], ('model',))
+INFERENCE_SAMPLES = Counter('model_inference_samples_total', 'Muestras evaluadas por modelo', ('model',))
+OFFLOAD_LATENCY = Histogram('offload_task_seconds', 'Duración del trabajo de CPU ejecutado en hilos nativos',
+                            INSTRUMENTATION_CONFIG['latency_buckets_s'], ('task',))
+EVENT_LOOP_LAG = Histogram('event_loop_lag_seconds', 'Retraso del bucle de eventos de gevent',
+                           INSTRUMENTATION_CONFIG['lag_buckets_s'])
+EVENT_LOOP_BLOCKED = Counter('event_loop_blocked_total', 'Bloqueos del bucle de eventos sobre el umbral')
+HOTSPOT_ALERTS = Counter('hotspot_alerts_total', 'Alertas de focos de incidentes emitidas', ('scope',))
+
+METRICS = [REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_DB_TIME, DB_QUERIES, N_PLUS_ONE,
+           CACHE_REQUESTS, INFERENCE_LATENCY, INFERENCE_SAMPLES, OFFLOAD_LATENCY,
+           EVENT_LOOP_LAG, EVENT_LOOP_BLOCKED, HOTSPOT_ALERTS]
+
+
+def record_cache(cache, hit):
+    """Registra un acierto o fallo del caché `cache`."""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+@contextmanager
+def time_inference(model, samples=1):
+    """Mide el bloque como una inferencia de `model` sobre `samples` muestras."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        INFERENCE_LATENCY.observe(time.perf_counter() - start, model=model)
+        INFERENCE_SAMPLES.inc(samples, model=model)
+
+
+# --- Consultas SQL por solicitud ---
+
+_n_plus_one_seen = {}
+_n_plus_one_lock = threading.Lock()
+
+
+def _route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('instrumentation_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('instrumentation_start')
+    elapsed = time.perf_counter() - starts.pop() if starts else 0.0
+    if not has_request_context():
+        DB_QUERIES.inc(route='background')
+        return
+    state = g.get('instrumentation')
+    if state is None:
+        return
+    state['queries'] += 1
+    state['db_seconds'] += elapsed
+    state['statements'][statement] += 1
+
+
+def _check_n_plus_one(route, statements):
+    threshold = INSTRUMENTATION_CONFIG['n_plus_one_threshold']
+    repeated = {statement: count for statement, count in statements.items() if count > threshold}
+    if not repeated:
+        return
+    N_PLUS_ONE.inc(route=route)
+    for statement, count in repeated.items():
+        key = (route, statement)
+        with _n_plus_one_lock:
+            first_time = key not in _n_plus_one_seen
+            _n_plus_one_seen[key] = max(_n_plus_one_seen.get(key, 0), count)
+        if first_time:
+            logging.warning(f"Posible N+1 en {route}: sentencia repetida {count} veces: "
+                            f"{' '.join(statement.split())[:200]}")
+
+
+def n_plus_one_report():
+    """
+    Returns:
+        list: Sentencias repetidas detectadas por ruta, con el máximo de repeticiones
+    """
+    with _n_plus_one_lock:
+        items = list(_n_plus_one_seen.items())
+    return [{'route': route, 'max_repeats': count, 'statement': ' '.join(statement.split())[:500]}
+            for (route, statement), count in sorted(items, key=lambda item: -item[1])]
+
+
+# --- Perfilador por muestreo ---
+
+def _current_greenlet():
+    try:
+        from greenlet import getcurrent
+    except ImportError:
+        return None
+    return getcurrent()
+
+
+# SIGPROF y su temporizador son únicos por proceso
+_profiler_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """
+    Muestrea la pila del hilo actual cada `interval_ms` de CPU (SIGPROF),
+    descartando las muestras que caen en otro greenlet. Fuera del hilo
+    principal (servidor con hilos) usa un hilo que lee sys._current_frames()
+    en tiempo real. Solo puede haber uno activo por proceso.
+    """
+
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000.0
+        self.samples = StackCounter()
+        self.other_greenlet_samples = 0
+        self._previous_handler = None
+        self._thread = None
+        self._greenlet = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _stack_key(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _handle_signal(self, signum, frame):
+        if _current_greenlet() is not self._greenlet:
+            self.other_greenlet_samples += 1
+            return
+        self.samples[self._stack_key(frame)] += 1
+
+    def _sample_thread(self, thread_id):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self.samples[self._stack_key(frame)] += 1
+
+    def start(self):
+        """
+        Raises:
+            RuntimeError: si otra solicitud ya se está perfilando
+        """
+        if not _profiler_lock.acquire(blocking=False):
+            raise RuntimeError("otra solicitud se está perfilando")
+        try:
+            self._greenlet = _current_greenlet()
+            # Bajo gevent threading.current_thread() de un greenlet no es el hilo
+            # principal aunque lo sea: signal.signal solo falla fuera de él
+            try:
+                self._previous_handler = signal.signal(signal.SIGPROF, self._handle_signal)
+                signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+            except (AttributeError, ValueError):
+                self._thread = threading.Thread(target=self._sample_thread, args=(threading.get_ident(),),
+                                                daemon=True)
+                self._thread.start()
+        except Exception:
+            _profiler_lock.release()
+            raise
+
+    def stop(self):
+        try:
+            if self._thread is not None:
+                self._stop.set()
+                self._thread.join()
+            else:
+                signal.setitimer(signal.ITIMER_PROF, 0, 0)
+                signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        finally:
+            _profiler_lock.release()
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+def _profile_requested():
+    return INSTRUMENTATION_CONFIG['profiling_enabled'] and (
+        request.headers.get('X-Profile') == '1' or request.args.get('_profile') == '1')
+
+
+def _save_profile(profiler, route):
+    os.makedirs(INSTRUMENTATION_CONFIG['profile_dir'], exist_ok=True)
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', route).strip('_') or 'root'
+    path = os.path.join(INSTRUMENTATION_CONFIG['profile_dir'],
+                        f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{name}.collapsed")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(profiler.collapsed())
+    return path
+
+
+# --- Integración con Flask ---
+
+def _before_request():
+    g.instrumentation = {'start': time.perf_counter(), 'queries': 0, 'db_seconds': 0.0,
+                         'statements': StackCounter(), 'profiler': None}
+    if _profile_requested():
+        profiler = SamplingProfiler(INSTRUMENTATION_CONFIG['profile_interval_ms'])
+        try:
+            profiler.start()
+            g.instrumentation['profiler'] = profiler
+        except Exception as e:
+            logging.warning(f"No se pudo iniciar el perfilador: {str(e)}")
+
+
+def _after_request(response):
+    state = g.pop('instrumentation', None)
+    if state is None:
+        return response
+    elapsed = time.perf_counter() - state['start']
+    route = _route_label()
+    REQUEST_LATENCY.observe(elapsed, route=route, method=request.method, status=response.status_code)
+    REQUEST_QUERIES.observe(state['queries'], route=route)
+    REQUEST_DB_TIME.observe(state['db_seconds'], route=route)
+    if state['queries']:
+        DB_QUERIES.inc(state['queries'], route=route)
+    _check_n_plus_one(route, state['statements'])
+
+    response.headers['Server-Timing'] = (f"app;dur={elapsed * 1000:.1f}, "
+                                         f"db;dur={state['db_seconds'] * 1000:.1f};desc=\"{state['queries']} queries\"")
+    profiler = state['profiler']
+    if profiler is not None:
+        profiler.stop()
+        try:
+            response.headers['X-Profile-Path'] = _save_profile(profiler, route)
+        except OSError as e:
+            logging.error(f"Error guardando el perfil de {route}: {str(e)}")
+    return response
+
+
+def init_instrumentation(app):
+    """Registra los hooks de solicitud y los eventos de SQLAlchemy."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+
+# --- Exportación ---
+
+def _gauge_samples():
+    """Métricas leídas al exportar: pool de conexiones, réplica, niveles, cachés de predicciones y usuarios."""
+    gauges = []
+    try:
+        from database import CHECKOUT_WAIT_BUCKETS_MS, pool_status, replica_router
+
+        pool = pool_status()
+        for key in ('size', 'checked_in', 'checked_out', 'overflow', 'max_overflow'):
+            if key in pool:
+                gauges.append(('gauge', f'db_pool_{key}', '', pool[key]))
+        gauges.append(('counter', 'db_pool_checkouts_total', '', pool['checkouts']))
+        gauges.append(('counter', 'db_pool_overflow_events_total', '', pool['overflow_events']))
+        gauges.append(('counter', 'db_pool_timeouts_total', '', pool['timeouts']))
+        cumulative = 0
+        for bound in [str(b) for b in CHECKOUT_WAIT_BUCKETS_MS] + ['+Inf']:
+            cumulative += pool['checkout_wait_buckets_ms'][bound]
+            gauges.append(('histogram', 'db_pool_checkout_wait_ms_bucket', f'{{le="{bound}"}}', cumulative))
+        gauges.append(('histogram', 'db_pool_checkout_wait_ms_sum', '', pool['checkout_wait_ms_sum']))
+        gauges.append(('histogram', 'db_pool_checkout_wait_ms_count', '', pool['checkouts']))
+        for target, count in replica_router.reads.items():
+            gauges.append(('counter', 'db_reads_total', f'{{target="{target}"}}', count))
+    except Exception as e:
+        logging.error(f"Error leyendo métricas del pool: {str(e)}")
+
+    try:
+        from prediction_resolver import get_tier_stats
+
+        for tier, stats in get_tier_stats().items():
+            for outcome, count in stats['counts'].items():
+                gauges.append(('counter', 'prediction_tier_requests_total',
+                               f'{{tier="{tier}",outcome="{outcome}"}}', count))
+            for quantile in ('p50', 'p95', 'p99'):
+                if f'{quantile}_ms' in stats:
+                    gauges.append(('gauge', 'prediction_tier_latency_ms',
+                                   f'{{tier="{tier}",quantile="0.{quantile[1:]}"}}', stats[f'{quantile}_ms']))
+            if stats.get('circuit') is not None:
+                gauges.append(('gauge', 'prediction_tier_circuit_open', f'{{tier="{tier}"}}',
+                               int(stats['circuit'] == 'open')))
+    except Exception as e:
+        logging.error(f"Error leyendo estadísticas de niveles de predicción: {str(e)}")
+
+    from user_cache import user_cache_stats
+
+    users = user_cache_stats()
+    gauges.append(('gauge', 'user_cache_size', '', users['size']))
+    gauges.append(('counter', 'user_cache_expirations_total', '', users['expirations']))
+    gauges.append(('counter', 'user_cache_evictions_total', '', users['evictions']))
+
+    from prediction_store import get_prediction_view
+
+    view = get_prediction_view()
+    if view is not None:
+        gauges.append(('gauge', 'prediction_store_generation', '', view.generation))
+        gauges.append(('gauge', 'prediction_store_rows', '', len(view)))
+    return gauges
+
+
+def render_metrics():
+    """Todas las métricas en formato de texto de Prometheus (version 0.0.4)."""
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name}{labels} {value}" for name, labels, value in metric.samples())
+
+    declared = set()
+    for kind, name, labels, value in _gauge_samples():
+        family = re.sub(r'_(bucket|sum|count)$', '', name) if kind == 'histogram' else name
+        if family not in declared:
+            lines.append(f"# TYPE {family} {kind}")
+            declared.add(family)
+        lines.append(f"{name}{labels} {value}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,350 @@
+"""
+Estado de características en vivo para la inferencia del RNN
+-----------------------------------------------------------
+
+El RNN recibe, por estación, las últimas MODEL_CONFIG['sequence_length'] horas
+como [hora, día_semana, mes, incidentes, tipo]. En lugar de consultar la base
+de datos en cada predicción, cada proceso mantiene un buffer circular de
+conteos por hora (estaciones x horas x tipos) que:
+
+- avanza con el reloj al cambiar la hora (la hora que sale de la ventana se
+  reinicia en cero y recibe el calendario de la hora nueva)
+- se actualiza con cada incidente guardado (record_incident,
+  record_incident_batch) y se reconcilia con la base de datos cada
+  LIVE_FEATURES_CONFIG['reconcile_seconds'] en segundo plano
+- se guarda en disco (models/live_features.npz, temporal + rename) al
+  reconstruirse y al avanzar de hora, y se restaura al reiniciar el proceso
+
+Cada hora se escribe dos veces (posiciones p y p + sequence_length), así que
+la ventana de las últimas horas es siempre un rango contiguo del arreglo:
+windows() retorna el tensor (estaciones, sequence_length, n_features) de todas
+las estaciones como una vista NumPy de solo lectura, sin copias.
+
+El tipo de cada hora es el más frecuente en la estación (el primero de
+VALID_INCIDENT_TYPES si no hubo incidentes), codificado en orden alfabético
+como el LabelEncoder del entrenamiento (ml_models.prepare_data).
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from bogota_clock import bogota_now
+from offload import BackgroundRefresh
+
+LIVE_FEATURES_CONFIG = {
+    'snapshot_path': os.environ.get('LIVE_FEATURES_SNAPSHOT', 'models/live_features.npz'),
+    'reconcile_seconds': 600,    # Reconstrucción desde la base de datos
+    'retry_seconds': 60          # Espera tras una reconstrucción fallida
+}
+
+
+def _floor_hour(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+class HourlyFeatureState:
+    """
+    Conteos por (estación, hora, tipo) de las últimas sequence_length horas y
+    las características del RNN derivadas de ellos.
+
+    Args:
+        stations (list): Nombres de estación en el orden de load_stations()
+        types (list): Tipos de incidente en el orden de VALID_INCIDENT_TYPES
+        sequence_length (int): Horas de la ventana
+        head (datetime): Hora más reciente de la ventana (por defecto, la actual)
+    """
+
+    def __init__(self, stations, types, sequence_length, head=None):
+        self.stations = list(stations)
+        self.types = list(types)
+        self.length = sequence_length
+        self.station_idx = {name: i for i, name in enumerate(self.stations)}
+        self.type_idx = {name: i for i, name in enumerate(self.types)}
+        # Código del LabelEncoder (orden alfabético) de cada tipo
+        self.type_codes = np.argsort(np.argsort(self.types)).astype(np.float32)
+
+        self.counts = np.zeros((len(self.stations), 2 * sequence_length, len(self.types)), dtype=np.int32)
+        self.features = np.zeros((len(self.stations), 2 * sequence_length, 5), dtype=np.float32)
+        self.built_at = time.time()
+        self.snapshot_head = None
+        self._lock = threading.Lock()
+        self._reset(_floor_hour(head or bogota_now()))
+
+    def _reset(self, head):
+        self.counts[:] = 0
+        self.head = head
+        self.pos = self.length - 1
+        for age in range(self.length):
+            self._start_slot(self.pos - age, head - timedelta(hours=age))
+
+    def _start_slot(self, pos, hour):
+        """Hora nueva en la posición pos: sin incidentes y con su calendario."""
+        slots = [pos, pos + self.length]
+        self.counts[:, slots] = 0
+        self.features[:, slots, 0] = hour.hour
+        self.features[:, slots, 1] = hour.weekday()
+        self.features[:, slots, 2] = hour.month
+        self.features[:, slots, 3] = 0
+        self.features[:, slots, 4] = self.type_codes[0]
+
+    def _refresh(self, stations, pos):
+        """Recalcula incidentes y tipo dominante de las estaciones en la posición pos."""
+        counts = self.counts[stations, pos]
+        for slot in (pos, pos + self.length):
+            self.features[stations, slot, 3] = counts.sum(axis=-1)
+            # argmax sin incidentes es 0: el primer tipo, igual que antes
+            self.features[stations, slot, 4] = self.type_codes[counts.argmax(axis=-1)]
+
+    def _advance(self, now):
+        head = _floor_hour(now)
+        steps = int((head - self.head).total_seconds() // 3600)
+        if steps <= 0:
+            return False
+        if steps >= self.length:
+            self._reset(head)
+            return True
+        for step in range(1, steps + 1):
+            self.pos = (self.pos + 1) % self.length
+            self._start_slot(self.pos, self.head + timedelta(hours=step))
+        self.head = head
+        return True
+
+    def advance(self, now=None):
+        """
+        Lleva la ventana a la hora actual.
+
+        Returns:
+            bool: True si cambió de hora
+        """
+        with self._lock:
+            return self._advance(now or bogota_now())
+
+    def _slot(self, timestamp):
+        age = int((self.head - _floor_hour(timestamp)).total_seconds() // 3600)
+        if not 0 <= age < self.length:
+            return None
+        return (self.pos - age) % self.length
+
+    def _add(self, station, incident_type, timestamp, count):
+        station_i = self.station_idx.get(station)
+        type_i = self.type_idx.get(incident_type)
+        pos = self._slot(timestamp)
+        if station_i is None or type_i is None or pos is None:
+            return
+        self.counts[station_i, [pos, pos + self.length], type_i] += count
+        self._refresh([station_i], pos)
+
+    def observe(self, station, timestamp, incident_type):
+        """Incorpora un incidente; los que caen fuera de la ventana se ignoran."""
+        with self._lock:
+            self._advance(bogota_now())
+            self._add(station, incident_type, timestamp, 1)
+
+    def observe_frame(self, incidents):
+        """Incorpora un lote (DataFrame con timestamp, nearest_station, incident_type)."""
+        if incidents.empty:
+            return
+        with self._lock:
+            self._advance(bogota_now())
+            since = self.head - timedelta(hours=self.length - 1)
+            recent = incidents[incidents['timestamp'] >= since]
+            hours = recent['timestamp'].dt.floor('h')
+            grouped = recent.groupby([recent['nearest_station'], recent['incident_type'], hours]).size()
+            for (station, incident_type, hour), count in grouped.items():
+                self._add(station, incident_type, hour.to_pydatetime(), int(count))
+
+    def _window_slice(self):
+        return slice(self.pos + 1, self.pos + 1 + self.length)
+
+    def windows(self):
+        """
+        Tensor de entrada del RNN de todas las estaciones, de la hora más
+        antigua a la actual. Es una vista del estado vivo: refleja los
+        incidentes que lleguen después; copiarla si se necesita fija.
+
+        Returns:
+            numpy.ndarray: Vista de solo lectura (n_estaciones, sequence_length, n_features)
+        """
+        with self._lock:
+            self._advance(bogota_now())
+            view = self.features[:, self._window_slice()]
+        view = view.view()
+        view.flags.writeable = False
+        return view
+
+    def station_window(self, station):
+        """
+        Returns:
+            numpy.ndarray: Vista (1, sequence_length, n_features) o None si la estación no existe
+        """
+        idx = self.station_idx.get(station)
+        if idx is None:
+            return None
+        return self.windows()[idx:idx + 1]
+
+    def incident_count(self, station):
+        """Incidentes de la estación en la ventana."""
+        idx = self.station_idx.get(station)
+        if idx is None:
+            return 0
+        with self._lock:
+            return int(self.counts[idx, self._window_slice()].sum())
+
+    def save(self, path=None):
+        """Guarda los conteos de la ventana (temporal + rename)."""
+        path = path or LIVE_FEATURES_CONFIG['snapshot_path']
+        with self._lock:
+            counts = self.counts[:, self._window_slice()].copy()
+            head = self.head
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, counts=counts, stations=np.array(self.stations), types=np.array(self.types),
+                     head=np.array(head.isoformat()), built_at=np.array(self.built_at))
+        os.replace(tmp_path, path)
+        self.snapshot_head = head
+
+    @classmethod
+    def load(cls, path, stations, types, sequence_length):
+        """
+        Restaura un estado guardado con save() y lo avanza a la hora actual.
+
+        Returns:
+            HourlyFeatureState o None si no existe o no corresponde a las estaciones y tipos actuales
+        """
+        try:
+            with np.load(path) as snapshot:
+                counts = snapshot['counts']
+                if (snapshot['stations'].tolist() != list(stations) or snapshot['types'].tolist() != list(types)
+                        or counts.shape[1] != sequence_length):
+                    logging.warning(f"Estado de características en {path} no corresponde a las estaciones actuales")
+                    return None
+                head = datetime.fromisoformat(str(snapshot['head']))
+                built_at = float(snapshot['built_at'])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"Error leyendo estado de características {path}: {str(e)}")
+            return None
+
+        state = cls(stations, types, sequence_length, head=head)
+        state.counts[:, :sequence_length] = counts
+        state.counts[:, sequence_length:] = counts
+        for pos in range(sequence_length):
+            state._refresh(slice(None), pos)
+        state.built_at = built_at
+        state.snapshot_head = head
+        state.advance()
+        return state
+
+
+def _layout():
+    """Estaciones, tipos y longitud de la ventana actuales."""
+    from ml_models import MODEL_CONFIG
+    from rollups import incident_types
+    from stations import station_names
+
+    return station_names(), incident_types(), MODEL_CONFIG['sequence_length']
+
+
+def build_live_features():
+    """Estado con los incidentes de la ventana actual (una consulta)."""
+    from database import read_session
+    from models import Incident
+
+    state = HourlyFeatureState(*_layout())
+    since = state.head - timedelta(hours=state.length - 1)
+    with read_session() as session:
+        recent = session.query(Incident.nearest_station, Incident.incident_type, Incident.timestamp) \
+            .filter(Incident.timestamp >= since).all()
+
+    with state._lock:
+        for station, incident_type, timestamp in recent:
+            state._add(station, incident_type, timestamp, 1)
+    return state
+
+
+def _restore_live_features():
+    state = HourlyFeatureState.load(LIVE_FEATURES_CONFIG['snapshot_path'], *_layout())
+    if state is not None:
+        logging.info(f"Estado de características restaurado de {LIVE_FEATURES_CONFIG['snapshot_path']}")
+    return state
+
+
+def _save_snapshot(state):
+    try:
+        state.save()
+    except Exception as e:
+        logging.error(f"Error guardando estado de características: {str(e)}")
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def _state_stale():
+    state = _state
+    return state is None or time.time() - state.built_at >= LIVE_FEATURES_CONFIG['reconcile_seconds']
+
+
+def _rebuild_state():
+    global _state
+    state = build_live_features()
+    _save_snapshot(state)
+    _state = state
+
+
+_state_refresh = BackgroundRefresh('estado de características', _rebuild_state, _state_stale,
+                                   LIVE_FEATURES_CONFIG['retry_seconds'])
+
+
+def get_live_features():
+    """
+    Estado compartido por el proceso. Al arrancar se restaura de disco; se
+    reconstruye desde la base de datos cada LIVE_FEATURES_CONFIG['reconcile_seconds']
+    (contados desde que se construyó el estado guardado) en segundo plano
+    (offload.BackgroundRefresh), mientras se sigue sirviendo el estado anterior.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Returns:
+        HourlyFeatureState o None si todavía no se ha construido
+    """
+    global _state
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                _state = _restore_live_features()
+    if _state_stale():
+        _state_refresh.trigger()
+    state = _state
+    if state is None:
+        return None
+
+    state.advance()
+    if state.snapshot_head != state.head:
+        _save_snapshot(state)
+    return state
+
+
+def record_incident(incident):
+    """Actualiza el estado del proceso (si ya está cargado) con un incidente recién guardado."""
+    if _state is None:
+        return
+    try:
+        _state.observe(incident.nearest_station, incident.timestamp, incident.incident_type)
+    except Exception as e:
+        logging.error(f"Error actualizando el estado de características: {str(e)}")
+
+
+def record_incident_batch(incidents):
+    """Actualiza el estado del proceso (si ya está cargado) con un lote de incidentes importados."""
+    if _state is None:
+        return
+    try:
+        _state.observe_frame(incidents)
+    except Exception as e:
+        logging.error(f"Error actualizando el estado de características con el lote: {str(e)}")
@@ -10,9 +10,9 @@ from dotenv import load_dotenv
 # Cargar variables de entorno
 load_dotenv()
 
-# Configurar logging más detallado
+# Configurar logging (LOG_LEVEL=DEBUG para el detalle de cada solicitud)
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout),
@@ -30,6 +30,10 @@ try:
     else:
         logger.info("DATABASE_URL encontrada: " + database_url.split('@')[1] if '@' in database_url else database_url)
 
+    # psycopg2 debe ceder el control a otros greenlets mientras espera a la base de datos
+    from database import make_psycopg2_green
+    make_psycopg2_green()
+
     # Importar la aplicación Flask y SocketIO después del monkey patch
     logger.info("Importando módulos de la aplicación...")
     from app import app, socketio
@@ -8,36 +8,23 @@ ARQUITECTURA IMPLEMENTADA:
    - Entrada: Secuencias temporales de incidentes
    - Capas ocultas: LSTM para capturar patrones temporales
    - Salida: Predicción de riesgo y tipo de incidente
+
+Este módulo contiene solo el entrenamiento y la validación. Las funciones de
+servicio (caché de predicciones, fallback, inferencia) están en
+prediction_service.py. TensorFlow, pandas y scikit-learn se importan dentro de
+las funciones que los usan para que importar este módulo sea barato.
 """
 
 import logging
-from datetime import datetime, timedelta
-import random
-import math
-from flask import current_app
+from datetime import datetime
 import numpy as np
-import pandas as pd
-from database import db
 from models import Incident
-import tensorflow as tf
-from tensorflow.keras.models import Sequential, load_model
-from tensorflow.keras.layers import LSTM, Dense, Dropout
-from tensorflow.keras.optimizers import Adam
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+from database import read_session
 import os
 import json
-import pytz
-
-# Definir tipos de incidentes válidos
-VALID_INCIDENT_TYPES = [
-    'Hurto',
-    'Hurto a mano armada',
-    'Cosquilleo',
-    'Ataque',
-    'Apertura de puertas',
-    'Sospechoso',
-    'Acoso'
-]
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Actualizar configuración del modelo para evitar sobreajuste
 MODEL_CONFIG = {
@@ -51,28 +38,45 @@ MODEL_CONFIG = {
     'l2_lambda': 0.02      # Aumentado para mayor regularización
 }
 
-def create_rnn_model():
+# Configuración de la validación cruzada temporal
+CV_CONFIG = {
+    'early_stopping_patience': 5,
+    'min_delta': 0.001,
+    'metrics_path': 'models/validation_metrics.json'
+}
+
+def create_rnn_model(config=None):
     """
     Crea el modelo RNN con arquitectura LSTM.
     Versión con regularización mejorada para evitar sobreajuste.
+
+    Args:
+        config (dict): Valores que reemplazan a los de MODEL_CONFIG
+            (usado por la búsqueda de hiperparámetros)
     """
+    import tensorflow as tf
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import LSTM, Dense, Dropout
+    from tensorflow.keras.optimizers import Adam
+
+    config = {**MODEL_CONFIG, **(config or {})}
     try:
         model = Sequential([
-            LSTM(MODEL_CONFIG['lstm_units'], 
-                 input_shape=(MODEL_CONFIG['sequence_length'], MODEL_CONFIG['n_features']),
+            LSTM(config['lstm_units'], 
+                 input_shape=(config['sequence_length'], config['n_features']),
                  return_sequences=True,
-                 kernel_regularizer=tf.keras.regularizers.l2(MODEL_CONFIG['l2_lambda'])),
-            Dropout(MODEL_CONFIG['dropout_rate']),
-            LSTM(MODEL_CONFIG['lstm_units'] // 2,
-                 kernel_regularizer=tf.keras.regularizers.l2(MODEL_CONFIG['l2_lambda'])),
-            Dropout(MODEL_CONFIG['dropout_rate']),
+                 kernel_regularizer=tf.keras.regularizers.l2(config['l2_lambda'])),
+            Dropout(config['dropout_rate']),
+            LSTM(config['lstm_units'] // 2,
+                 kernel_regularizer=tf.keras.regularizers.l2(config['l2_lambda'])),
+            Dropout(config['dropout_rate']),
             Dense(8, activation='relu',  # Reducido de 16 a 8
-                  kernel_regularizer=tf.keras.regularizers.l2(MODEL_CONFIG['l2_lambda'])),
+                  kernel_regularizer=tf.keras.regularizers.l2(config['l2_lambda'])),
             Dense(1, activation='sigmoid')
         ])
 
         # Usar optimizador con decaimiento de learning rate
-        initial_learning_rate = MODEL_CONFIG['learning_rate']
+        initial_learning_rate = config['learning_rate']
         lr_schedule = tf.keras.optimizers.schedules.ExponentialDecay(
             initial_learning_rate,
             decay_steps=1000,
@@ -88,7 +92,7 @@ def create_rnn_model():
         )
 
         logging.info("Modelo RNN creado exitosamente")
-        logging.info(f"Configuración del modelo: {MODEL_CONFIG}")
+        logging.info(f"Configuración del modelo: {config}")
         model.summary(print_fn=logging.info)
         return model
     except Exception as e:
@@ -154,8 +158,13 @@ def prepare_data():
     Prepara los datos históricos para el entrenamiento del modelo.
     Solo lee datos existentes, no modifica la base de datos.
     """
+    import pandas as pd
+    from sklearn.preprocessing import LabelEncoder
+
     try:
-        incidents = Incident.query.order_by(Incident.timestamp).all()
+        # Lectura de solo lectura: réplica si está disponible (ver database.read_session)
+        with read_session() as session:
+            incidents = session.query(Incident).order_by(Incident.timestamp).all()
         if not incidents:
             logging.warning("No incidents found in database")
             return pd.DataFrame()
@@ -201,6 +210,8 @@ def train_rnn_model():
     Entrena el modelo RNN con datos históricos existentes.
     No modifica la base de datos, solo usa los datos disponibles.
     """
+    import tensorflow as tf
+
     try:
         # Preparar datos existentes
         data = prepare_data()
@@ -265,206 +276,130 @@ def train_rnn_model():
         logging.error(f"Error training RNN model: {str(e)}")
         return None, None
 
-def predict_station_risk(station, hour):
+def get_incident_trends():
     """
-    Predice el nivel de riesgo para una estación específica en una hora determinada.
-    Mantiene el sistema de fallback si el modelo RNN falla.
+    Analiza tendencias en los incidentes históricos.
     """
-    try:
-        # Intentar obtener predicción del caché
-        predictions = get_cached_predictions()
-        if predictions:
-            for prediction in predictions:
-                if (prediction.get('station') == station and 
-                    isinstance(prediction.get('predicted_time'), str) and
-                    datetime.fromisoformat(prediction['predicted_time']).hour == hour):
-                    return prediction.get('risk_score')
-
-        # Intentar usar el modelo RNN
-        try:
-            model_path = 'models/rnn_model.h5'
-            if os.path.exists(model_path):
-                model = load_model(model_path)
-                # Preparar datos para predicción
-                current_data = prepare_prediction_data(station, hour)
-                if current_data is not None:
-                    prediction = model.predict(current_data)
-                    return float(prediction[0][0])
-        except Exception as model_error:
-            logging.warning(f"RNN prediction failed, using fallback: {str(model_error)}")
-
-        # Sistema de fallback mejorado
-        risk_score, _ = enhanced_fallback_prediction(station, datetime(datetime.now().year, datetime.now().month, datetime.now().day, hour, 0, 0))
-        return risk_score
+    import pandas as pd
 
-    except Exception as e:
-        logging.error(f"Error predicting risk for station {station}: {str(e)}")
-        return None
-
-def predict_incident_type(station, hour):
-    """
-    Predice el tipo de incidente más probable.
-    Mantiene el sistema de fallback si el modelo falla.
-    """
-    try:
-        # Intentar obtener del caché
-        predictions = get_cached_predictions()
-        if predictions:
-            for prediction in predictions:
-                if (prediction.get('station') == station and 
-                    isinstance(prediction.get('predicted_time'), str) and
-                    datetime.fromisoformat(prediction['predicted_time']).hour == hour):
-                    return prediction.get('incident_type')
-
-        # Intentar usar el modelo RNN para tipo de incidente
-        try:
-            model_path = 'models/incident_type_model.h5'
-            if os.path.exists(model_path):
-                model = load_model(model_path)
-                current_data = prepare_prediction_data(station, hour)
-                if current_data is not None:
-                    prediction = model.predict(current_data)
-                    return VALID_INCIDENT_TYPES[np.argmax(prediction[0])]
-        except Exception as model_error:
-            logging.warning(f"RNN incident type prediction failed, using fallback: {str(model_error)}")
-
-        # Sistema de fallback mejorado
-        _, incident_type = enhanced_fallback_prediction(station, datetime(datetime.now().year, datetime.now().month, datetime.now().day, hour, 0, 0))
-        return incident_type
+    data = prepare_data()
 
-    except Exception as e:
-        logging.error(f"Error predicting incident type for station {station}: {str(e)}")
-        return None
+    if len(data) < 100:
+        logging.warning("Not enough data to calculate incident trends.")
+        return {}
 
-def get_model_insights():
-    """
-    Proporciona métricas e insights sobre el rendimiento del modelo.
-    """
     try:
-        model_path = 'models/rnn_model.h5'
-        if os.path.exists(model_path):
-            model = load_model(model_path)
-            return {
-                'accuracy': 0.75,  # TODO: Calcular accuracy real
-                'predictions_available': True,
-                'model_status': 'active',
-                'model_type': 'RNN-LSTM',
-                'last_training': os.path.getmtime(model_path)
-            }
-    except Exception:
-        pass
+        # Agrupar por fecha y tipo de incidente
+        daily_incidents = data.groupby([pd.Grouper(key='timestamp', freq='D'), 'incident_type']).size().unstack(fill_value=0)
 
-    return {
-        'accuracy': 0.75,
-        'predictions_available': True,
-        'model_status': 'fallback',
-        'model_type': 'statistical',
-        'last_training': None
-    }
+        # Calcular media móvil de 7 días
+        trends = daily_incidents.rolling(window=7).mean()
 
-# Funciones auxiliares para futuras implementaciones
-def predict_incident_probability(latitude, longitude, hour, day_of_week, month, nearest_station):
-    """Placeholder para futura implementación de predicción de probabilidad"""
-    return "Prediction not available with the simplified model."
+        return trends.to_dict()
+    except Exception as e:
+        logging.error(f"Error in get_incident_trends: {str(e)}", exc_info=True)
+        return {}
 
-def prepare_prediction_data(station, hour):
+
+def rolling_origin_splits(n_samples, k_folds=5):
     """
-    Prepara los datos para predicción en tiempo real.
+    Genera particiones temporales con origen móvil (rolling origin).
+
+    Los datos se dividen en k_folds + 1 bloques consecutivos. En la partición i
+    el modelo se entrena con los bloques 0..i y se valida con el bloque i + 1,
+    de modo que la validación nunca contiene datos anteriores al entrenamiento.
 
     Args:
-        station (str): Nombre de la estación
-        hour (int): Hora del día (0-23)
+        n_samples (int): Número total de secuencias ordenadas en el tiempo
+        k_folds (int): Número de particiones
 
     Returns:
-        numpy.ndarray: Datos preparados para predicción con la RNN
-        None: En caso de error o datos insuficientes
+        list: Tuplas (train_end, val_start, val_end) con índices sobre las secuencias
     """
-    try:
-        # Obtener datos históricos recientes
-        current_time = datetime.now()
-        start_time = current_time - timedelta(hours=MODEL_CONFIG['sequence_length'])
-
-        # Consultar incidentes recientes para la estación
-        recent_incidents = Incident.query.filter(
-            Incident.nearest_station == station,
-            Incident.timestamp >= start_time,
-            Incident.timestamp <= current_time
-        ).order_by(Incident.timestamp).all()
-
-        if len(recent_incidents) < MODEL_CONFIG['sequence_length'] // 2:
-            logging.warning(f"Insufficient recent data for station {station}")
-            return None
-
-        # Crear DataFrame con la secuencia temporal
-        data = []
-        current = start_time
-        while current <= current_time:
-            incidents_at_time = [i for i in recent_incidents if i.timestamp.hour == current.hour]
-            incident_type = incidents_at_time[0].incident_type if incidents_at_time else VALID_INCIDENT_TYPES[0]
-
-            data.append({
-                'hour': current.hour,
-                'day_of_week': current.weekday(),
-                'month': current.month,
-                'incident_count': len(incidents_at_time),
-                'incident_type': incident_type
-            })
-            current += timedelta(hours=1)
-
-        # Convertir a DataFrame
-        df = pd.DataFrame(data)
-
-        # Codificar tipos de incidente
-        le = LabelEncoder()
-        df['incident_type_encoded'] = le.fit_transform(df['incident_type'])
-
-        # Preparar secuencia de características
-        features = np.array([
-            df['hour'].values,
-            df['day_of_week'].values,
-            df['month'].values,
-            df['incident_count'].values,
-            df['incident_type_encoded'].values
-        ]).T
-
-        # Reshape para RNN: [1, sequence_length, n_features]
-        features = features.reshape(1, len(features), MODEL_CONFIG['n_features'])
-
-        return features
+    block_size = n_samples // (k_folds + 1)
+    if block_size == 0:
+        return []
 
-    except Exception as e:
-        logging.error(f"Error preparing prediction data: {str(e)}")
-        return None
+    splits = []
+    for fold in range(k_folds):
+        train_end = (fold + 1) * block_size
+        val_end = n_samples if fold == k_folds - 1 else train_end + block_size
+        splits.append((train_end, train_end, val_end))
+    return splits
 
-def get_incident_trends():
+def _configure_worker_threads(n_threads):
     """
-    Analiza tendencias en los incidentes históricos.
+    Limita los hilos de TensorFlow en un proceso trabajador para que varios
+    entrenamientos en paralelo no compitan por los mismos núcleos.
+    Debe ejecutarse antes de crear cualquier operación de TensorFlow.
     """
-    data = prepare_data()
-
-    if len(data) < 100:
-        logging.warning("Not enough data to calculate incident trends.")
-        return {}
+    import tensorflow as tf
 
+    os.environ['OMP_NUM_THREADS'] = str(n_threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(n_threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
     try:
-        # Agrupar por fecha y tipo de incidente
-        daily_incidents = data.groupby([pd.Grouper(key='timestamp', freq='D'), 'incident_type']).size().unstack(fill_value=0)
+        tf.config.threading.set_intra_op_parallelism_threads(n_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError as e:
+        logging.warning(f"No se pudieron configurar los hilos de TensorFlow: {str(e)}")
 
-        # Calcular media móvil de 7 días
-        trends = daily_incidents.rolling(window=7).mean()
+def _train_fold(fold, X_train, y_train, X_val, y_val):
+    """
+    Entrena y evalúa el modelo para una partición. Se ejecuta en un proceso trabajador.
 
-        return trends.to_dict()
-    except Exception as e:
-        logging.error(f"Error in get_incident_trends: {str(e)}", exc_info=True)
-        return {}
+    Returns:
+        dict: Métricas de validación de la partición
+    """
+    import tensorflow as tf
 
+    start = time.perf_counter()
+    model = create_rnn_model()
+    if model is None:
+        return None
 
-def cross_validate_model(k_folds=5):
+    callbacks = [
+        tf.keras.callbacks.EarlyStopping(
+            monitor='val_loss',
+            patience=CV_CONFIG['early_stopping_patience'],
+            restore_best_weights=True,
+            min_delta=CV_CONFIG['min_delta']
+        )
+    ]
+
+    history = model.fit(
+        X_train, y_train,
+        validation_data=(X_val, y_val),
+        batch_size=MODEL_CONFIG['batch_size'],
+        epochs=MODEL_CONFIG['epochs'],
+        callbacks=callbacks,
+        verbose=0
+    )
+
+    val_loss, val_accuracy, val_auc = model.evaluate(X_val, y_val, verbose=0)
+    return {
+        'fold': fold + 1,
+        'train_samples': int(len(X_train)),
+        'val_samples': int(len(X_val)),
+        'epochs_run': len(history.history['loss']),
+        'accuracy': float(val_accuracy),
+        'loss': float(val_loss),
+        'auc': float(val_auc),
+        'duration_seconds': round(time.perf_counter() - start, 2)
+    }
+
+def cross_validate_model(k_folds=5, n_workers=None):
     """
-    Realiza validación cruzada del modelo RNN.
+    Realiza validación cruzada temporal del modelo RNN.
+
+    Cada partición usa un origen móvil (ver rolling_origin_splits) y se entrena
+    en un proceso independiente con early stopping. Los hilos de TensorFlow se
+    reparten entre los procesos trabajadores.
 
     Args:
         k_folds (int): Número de particiones para validación cruzada
+        n_workers (int): Procesos en paralelo (por defecto, uno por partición
+            limitado por el número de núcleos)
 
     Returns:
         dict: Métricas promedio de validación cruzada
@@ -482,57 +417,63 @@ def cross_validate_model(k_folds=5):
             logging.error("No sequences could be generated for cross validation")
             return None
 
-        # Inicializar métricas
-        metrics = {
-            'accuracy': [],
-            'loss': [],
-            'auc': []
-        }
-
-        # Realizar validación cruzada
-        fold_size = len(X) // k_folds
-        for fold in range(k_folds):
-            logging.info(f"Training fold {fold + 1}/{k_folds}")
-
-            # Definir índices para esta partición
-            val_start = fold * fold_size
-            val_end = (fold + 1) * fold_size
-
-            # Separar datos de entrenamiento y validación
-            X_val = X[val_start:val_end]
-            y_val = y[val_start:val_end]
-            X_train = np.concatenate([X[:val_start], X[val_end:]])
-            y_train = np.concatenate([y[:val_start], y[val_end:]])
-
-            # Crear y entrenar modelo
-            model = create_rnn_model()
-            if model is None:
-                continue
+        splits = rolling_origin_splits(len(X), k_folds)
+        if not splits:
+            logging.error(f"Not enough sequences ({len(X)}) for {k_folds} folds")
+            return None
 
-            history = model.fit(
-                X_train, y_train,
-                validation_data=(X_val, y_val),
-                batch_size=MODEL_CONFIG['batch_size'],
-                epochs=MODEL_CONFIG['epochs'],
-                verbose=1
-            )
+        cpu_count = os.cpu_count() or 1
+        n_workers = max(1, min(n_workers or k_folds, k_folds, cpu_count))
+        threads_per_worker = max(1, cpu_count // n_workers)
+        logging.info(f"Validación cruzada: {k_folds} particiones, {n_workers} procesos, "
+                     f"{threads_per_worker} hilos por proceso")
+
+        start = time.perf_counter()
+        fold_results = []
+        # 'spawn' evita heredar el estado de TensorFlow del proceso padre
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_configure_worker_threads,
+                                 initargs=(threads_per_worker,)) as executor:
+            futures = {
+                executor.submit(_train_fold, fold,
+                                X[:train_end], y[:train_end],
+                                X[val_start:val_end], y[val_start:val_end]): fold
+                for fold, (train_end, val_start, val_end) in enumerate(splits)
+            }
+            for future in as_completed(futures):
+                fold = futures[future]
+                try:
+                    result = future.result()
+                except Exception as fold_error:
+                    logging.error(f"Fold {fold + 1} failed: {str(fold_error)}")
+                    continue
+                if result is None:
+                    continue
+                fold_results.append(result)
+                logging.info(f"Fold {result['fold']} metrics - Accuracy: {result['accuracy']:.4f}, "
+                             f"Loss: {result['loss']:.4f}, AUC: {result['auc']:.4f}, "
+                             f"Epochs: {result['epochs_run']}")
 
-            # Evaluar modelo
-            val_loss, val_accuracy, val_auc = model.evaluate(X_val, y_val, verbose=0)
-            metrics['accuracy'].append(val_accuracy)
-            metrics['loss'].append(val_loss)
-            metrics['auc'].append(val_auc)
+        if not fold_results:
+            logging.error("All cross validation folds failed")
+            return None
 
-            logging.info(f"Fold {fold + 1} metrics - Accuracy: {val_accuracy:.4f}, Loss: {val_loss:.4f}, AUC: {val_auc:.4f}")
+        fold_results.sort(key=lambda r: r['fold'])
+        metrics = {
+            'accuracy': [r['accuracy'] for r in fold_results],
+            'loss': [r['loss'] for r in fold_results],
+            'auc': [r['auc'] for r in fold_results]
+        }
 
         # Calcular y registrar métricas promedio
         avg_metrics = {
-            'accuracy': np.mean(metrics['accuracy']),
-            'loss': np.mean(metrics['loss']),
-            'auc': np.mean(metrics['auc']),
-            'std_accuracy': np.std(metrics['accuracy']),
-            'std_loss': np.std(metrics['loss']),
-            'std_auc': np.std(metrics['auc'])
+            'accuracy': float(np.mean(metrics['accuracy'])),
+            'loss': float(np.mean(metrics['loss'])),
+            'auc': float(np.mean(metrics['auc'])),
+            'std_accuracy': float(np.std(metrics['accuracy'])),
+            'std_loss': float(np.std(metrics['loss'])),
+            'std_auc': float(np.std(metrics['auc']))
         }
 
         logging.info("Cross validation results:")
@@ -540,223 +481,22 @@ def cross_validate_model(k_folds=5):
         logging.info(f"Average loss: {avg_metrics['loss']:.4f} ± {avg_metrics['std_loss']:.4f}")
         logging.info(f"Average AUC: {avg_metrics['auc']:.4f} ± {avg_metrics['std_auc']:.4f}")
 
+        report = {
+            **avg_metrics,
+            'timestamp': datetime.now().isoformat(),
+            'split_method': 'rolling_origin',
+            'k_folds': k_folds,
+            'n_workers': n_workers,
+            'threads_per_worker': threads_per_worker,
+            'duration_seconds': round(time.perf_counter() - start, 2),
+            'folds': fold_results
+        }
+        with open(CV_CONFIG['metrics_path'], 'w') as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Métricas de validación guardadas en {CV_CONFIG['metrics_path']}")
+
         return avg_metrics
 
     except Exception as e:
         logging.error(f"Error in cross validation: {str(e)}")
         return None
-
-
-
-def generate_prediction_cache(hours_ahead=24):
-    """
-    Genera predicciones para las próximas horas.
-    """
-    try:
-        logging.info(f"Generando predicciones para las próximas {hours_ahead} horas...")
-        predictions = []
-        current_time = datetime.now(pytz.timezone('America/Bogota'))
-
-        # Cargar datos de estaciones
-        with open('static/Estaciones_Troncales_de_TRANSMILENIO.geojson', 'r', encoding='utf-8') as f:
-            geojson_data = json.load(f)
-            logging.info(f"Datos de estaciones cargados: {len(geojson_data['features'])} estaciones")
-
-        # Generar predicciones para las próximas hours_ahead horas
-        for hour_offset in range(hours_ahead):
-            pred_time = current_time + timedelta(hours=hour_offset)
-            logging.info(f"Generando predicciones para {pred_time.isoformat()}")
-
-            for feature in geojson_data['features']:
-                station = feature['properties']['nombre_estacion']
-                coordinates = feature['geometry']['coordinates']
-
-                try:
-                    # Usar sistema de fallback mejorado
-                    risk_score, incident_type = enhanced_fallback_prediction(station, pred_time)
-
-                    prediction = {
-                        'station': station,
-                        'predicted_time': pred_time.isoformat(),
-                        'risk_score': float(risk_score),
-                        'incident_type': incident_type,
-                        'latitude': coordinates[1],
-                        'longitude': coordinates[0],
-                        'prediction_made': datetime.now().isoformat(),
-                        'model_version': 'fallback'
-                    }
-                    predictions.append(prediction)
-
-                except Exception as e:
-                    logging.error(f"Error prediciendo para estación {station}: {str(e)}")
-                    continue
-
-        # Guardar predicciones en archivo para respaldo
-        if predictions:
-            with open('predictions_cache.json', 'w', encoding='utf-8') as f:
-                json.dump(predictions, f, indent=2, ensure_ascii=False)
-
-            logging.info(f"Generadas y guardadas {len(predictions)} predicciones")
-            return predictions
-
-        logging.warning("No se generaron predicciones")
-        return []
-
-    except Exception as e:
-        logging.error(f"Error generando predicciones: {str(e)}", exc_info=True)
-        return []
-
-def update_predictions_periodically():
-    """
-    Actualiza las predicciones periódicamente y notifica a los clientes conectados.
-    """
-    try:
-        logging.info("Iniciando actualización periódica de predicciones...")
-        predictions = generate_prediction_cache(hours_ahead=24)
-
-        if predictions:
-            # Cargar información de troncales
-            with open('static/Estaciones_Troncales_de_TRANSMILENIO.geojson', 'r', encoding='utf-8') as f:
-                geojson_data = json.load(f)
-                station_to_troncal = {
-                    feature['properties']['nombre_estacion']: feature['properties'].get('troncal_estacion', 'N/A')
-                    for feature in geojson_data['features']
-                    if 'nombre_estacion' in feature['properties']
-                }
-
-            # Agregar información de troncal a cada predicción
-            for prediction in predictions:
-                prediction['troncal'] = station_to_troncal.get(prediction['station'], 'N/A')
-
-            # Notificar a través de SocketIO
-            from app import socketio
-            prediction_data = {
-                'timestamp': datetime.now().isoformat(),
-                'prediction_count': len(predictions),
-                'predictions': predictions,
-                'update_type': 'periodic'
-            }
-
-            logging.info(f"Enviando {len(predictions)} predicciones a través de WebSocket")
-            socketio.emit('predictions_updated', prediction_data, namespace='/')
-
-            logging.info("Predicciones enviadas exitosamente")
-            return True
-
-        logging.warning("No se generaron predicciones para enviar")
-        return False
-    except Exception as e:
-        logging.error(f"Error actualizando predicciones: {str(e)}", exc_info=True)
-        return False
-
-def get_cached_predictions():
-    """
-    Obtiene predicciones del caché con fallback al archivo.
-    """
-    try:
-        # Intentar obtener del archivo de respaldo primero
-        try:
-            with open('predictions_cache.json', 'r', encoding='utf-8') as f:
-                predictions = json.load(f)
-                if predictions:
-                    logging.info(f"Predicciones recuperadas del archivo: {len(predictions)}")
-                    return predictions
-        except Exception as file_error:
-            logging.warning(f"No se pudo cargar el archivo de respaldo: {str(file_error)}")
-
-        # Si no hay archivo o está vacío, generar nuevas predicciones
-        logging.info("Generando nuevas predicciones ya que no hay caché disponible")
-        predictions = generate_prediction_cache(hours_ahead=24)
-        return predictions if predictions else []
-
-    except Exception as e:
-        logging.error(f"Error obteniendo predicciones del caché: {str(e)}")
-        return []
-
-def enhanced_fallback_prediction(station, pred_time):
-    """
-    Sistema de fallback mejorado para predicciones.
-
-    Args:
-        station (str): Nombre de la estación
-        pred_time (datetime): Tiempo para la predicción
-
-    Returns:
-        tuple: (risk_score, incident_type)
-    """
-    try:
-        hour = pred_time.hour
-        day_of_week = pred_time.weekday()
-
-        # Factores de riesgo base por hora del día
-        if 5 <= hour <= 9:  # Hora pico mañana
-            base_risk = random.uniform(0.6, 0.9)
-        elif 16 <= hour <= 20:  # Hora pico tarde
-            base_risk = random.uniform(0.7, 0.95)
-        elif 22 <= hour or hour <= 4:  # Noche
-            base_risk = random.uniform(0.5, 0.8)
-        else:  # Hora valle
-            base_risk = random.uniform(0.3, 0.6)
-
-        # Ajuste por día de la semana
-        if day_of_week < 5:  # Lunes a Viernes
-            day_factor = 1.2
-        else:  # Fin de semana
-            day_factor = 0.8
-
-        # Calcular risk score final
-        risk_score = min(0.95, max(0.1, base_risk * day_factor))
-
-        # Determinar tipo de incidente más probable según la hora
-        if 6 <= hour <= 9:  # Hora pico mañana
-            weights = {
-                'Cosquilleo': 0.3,
-                'Hurto': 0.25,
-                'Hurto a mano armada': 0.1,
-                'Acoso': 0.15,
-                'Sospechoso': 0.1,
-                'Ataque': 0.05,
-                'Apertura de puertas': 0.05
-            }
-        elif 16 <= hour <= 20:  # Hora pico tarde
-            weights = {
-                'Hurto': 0.3,
-                'Cosquilleo': 0.25,
-                'Hurto a mano armada': 0.15,
-                'Acoso': 0.1,
-                'Sospechoso': 0.1,
-                'Ataque': 0.05,
-                'Apertura de puertas': 0.05
-            }
-        elif 22 <= hour or hour <= 4:  # Noche
-            weights = {
-                'Hurto a mano armada': 0.3,
-                'Ataque': 0.2,
-                'Hurto': 0.2,
-                'Sospechoso': 0.15,
-                'Acoso': 0.1,
-                'Cosquilleo': 0.03,
-                'Apertura de puertas': 0.02
-            }
-        else:  # Hora valle
-            weights = {
-                'Hurto': 0.25,
-                'Cosquilleo': 0.2,
-                'Sospechoso': 0.15,
-                'Acoso': 0.15,
-                'Hurto a mano armada': 0.1,
-                'Ataque': 0.1,
-                'Apertura de puertas': 0.05
-            }
-
-        # Seleccionar tipo de incidente
-        incident_type = random.choices(
-            list(weights.keys()),
-            weights=list(weights.values())
-        )[0]
-
-        return risk_score, incident_type
-
-    except Exception as e:
-        logging.error(f"Error en predicción fallback: {str(e)}")
-        return 0.5, VALID_INCIDENT_TYPES[0]
\ No newline at end of file
@@ -0,0 +1,295 @@
+"""
+Trabajo de CPU fuera del bucle de eventos de gevent
+--------------------------------------------------
+
+main.py sirve todas las conexiones (HTTP y websockets) con greenlets en un
+solo hilo: mientras una función de CPU se ejecuta sin ceder, ningún otro
+cliente avanza, ni siquiera los heartbeats de Socket.IO.
+
+- run_cpu_bound(fn, ...) ejecuta fn en un hilo nativo del threadpool del hub
+  de gevent y el greenlet que llama espera sin bloquear el bucle. El GIL se
+  cede cada sys.getswitchinterval(), así que el bucle sigue atendiendo a los
+  demás clientes; el hashing de contraseñas (scrypt) y NumPy además lo liberan.
+  Si hay contexto de aplicación, se abre uno nuevo en el hilo (con su propia
+  sesión de SQLAlchemy): no se deben pasar objetos cargados en otra sesión
+  que tengan atributos sin cargar. Sin gevent (scripts, programador de tareas)
+  la función se ejecuta en línea.
+- run_cpu_bound_with_timeout(timeout, fn, ...) hace lo mismo pero el greenlet
+  deja de esperar a los timeout segundos (presupuestos de prediction_resolver).
+  Un hilo nativo no se puede interrumpir: termina en segundo plano y su
+  resultado se descarta.
+- BackgroundRefresh reconstruye un objeto compartido por el proceso (motor
+  bayesiano, flujo de incidentes, características en vivo) en un hilo nativo:
+  quien lo consulta sigue usando la versión anterior, hay una sola
+  reconstrucción a la vez y tras un fallo no se reintenta antes de
+  retry_seconds.
+- LoopLagMonitor mide cada lag_interval_ms cuánto tarda el bucle en volver a
+  un greenlet dormido. Los retrasos van a event_loop_lag_seconds y los que
+  superan lag_threshold_ms se registran como bloqueos (advertencia en el log,
+  event_loop_blocked_total y /api/metrics/event_loop). Con
+  LOOP_BLOCK_STACKS=1 se activa además el monitor de gevent, que escribe en
+  stderr la pila del greenlet que bloqueó el bucle.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from flask import current_app, has_app_context
+
+from instrumentation import EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG, OFFLOAD_LATENCY
+
+OFFLOAD_CONFIG = {
+    'threads': int(os.environ.get('OFFLOAD_THREADS', 10)),
+    'lag_interval_ms': 50,
+    'lag_threshold_ms': float(os.environ.get('LOOP_LAG_THRESHOLD_MS', 100)),
+    'lag_window': 1000,          # Retrasos recientes para los percentiles
+    'recent_blocks': 20,         # Bloqueos recientes listados en el resumen
+    'report_stacks': os.environ.get('LOOP_BLOCK_STACKS', '').lower() in ('1', 'true', 'yes')
+}
+
+
+def gevent_patched():
+    """True si el proceso corre con gevent.monkey.patch_all() (main.py)."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+_pool_lock = threading.Lock()
+_pool_sized = False
+
+
+def _threadpool():
+    global _pool_sized
+    import gevent
+
+    pool = gevent.get_hub().threadpool
+    if not _pool_sized:
+        with _pool_lock:
+            # El mismo pool resuelve DNS con el resolver por defecto: no se reduce
+            pool.maxsize = max(pool.maxsize, OFFLOAD_CONFIG['threads'])
+            _pool_sized = True
+    return pool
+
+
+def _native(name):
+    """Función de _thread sin el parche de gevent (hilos y candados del sistema)."""
+    if gevent_patched():
+        from gevent import monkey
+        return monkey.get_original('_thread', name)
+    import _thread
+    return getattr(_thread, name)
+
+
+def _with_app_context(fn):
+    """fn envuelta para ejecutarse en otro hilo con el contexto de aplicación actual, si hay."""
+    app = current_app._get_current_object() if has_app_context() else None
+    if app is None:
+        return fn
+
+    def call(*args, **kwargs):
+        with app.app_context():
+            return fn(*args, **kwargs)
+    return call
+
+
+def run_cpu_bound(fn, *args, **kwargs):
+    """
+    Ejecuta fn(*args, **kwargs) en un hilo nativo sin bloquear el bucle de eventos.
+
+    Returns:
+        El resultado de fn; sus excepciones se propagan al que llama
+    """
+    if not gevent_patched():
+        return fn(*args, **kwargs)
+
+    task = getattr(fn, '__qualname__', repr(fn))
+    start = time.perf_counter()
+    try:
+        return _threadpool().apply(_with_app_context(fn), args, kwargs)
+    finally:
+        OFFLOAD_LATENCY.observe(time.perf_counter() - start, task=task)
+
+
+def run_cpu_bound_with_timeout(timeout, fn, *args, **kwargs):
+    """
+    Como run_cpu_bound, pero espera a lo sumo `timeout` segundos. Sin gevent
+    la función se ejecuta en línea y sin límite.
+
+    Returns:
+        El resultado de fn; sus excepciones se propagan al que llama
+
+    Raises:
+        TimeoutError: si fn no terminó a tiempo (sigue ejecutándose en su hilo)
+    """
+    if not gevent_patched():
+        return fn(*args, **kwargs)
+    import gevent
+
+    task = getattr(fn, '__qualname__', repr(fn))
+    start = time.perf_counter()
+    try:
+        return _threadpool().spawn(_with_app_context(fn), *args, **kwargs).get(timeout=timeout)
+    except gevent.Timeout:
+        raise TimeoutError(f"{task} excedió {timeout * 1000:.0f} ms") from None
+    finally:
+        OFFLOAD_LATENCY.observe(time.perf_counter() - start, task=task)
+
+
+class BackgroundRefresh:
+    """
+    Reconstrucción de un objeto compartido por el proceso fuera del camino de
+    las solicitudes.
+
+    Args:
+        name (str): Nombre para el log
+        rebuild (callable): Construye y publica el objeto (asigna el global del
+            módulo); una excepción cuenta como fallo
+        stale (callable): True si el objeto publicado debe reconstruirse
+        retry_seconds (float): Espera mínima tras un fallo antes de reintentar
+    """
+
+    def __init__(self, name, rebuild, stale, retry_seconds):
+        self.name = name
+        self.rebuild = rebuild
+        self.stale = stale
+        self.retry_seconds = retry_seconds
+        self.failed_at = None
+        # Una reconstrucción a la vez; candado nativo porque se libera desde el hilo de fondo
+        self._lock = _native('allocate_lock')()
+
+    def backing_off(self):
+        return self.failed_at is not None and time.time() - self.failed_at < self.retry_seconds
+
+    def _rebuild(self):
+        # Otra reconstrucción pudo terminar mientras se esperaba el candado
+        if self.backing_off() or not self.stale():
+            return False
+        try:
+            self.rebuild()
+        except Exception as e:
+            self.failed_at = time.time()
+            logging.error(f"Error reconstruyendo {self.name} (reintento en {self.retry_seconds:.0f} s): {str(e)}",
+                          exc_info=True)
+            return False
+        self.failed_at = None
+        return True
+
+    def run(self):
+        """
+        Reconstruye en línea (scripts, programador de tareas, hilos de fondo),
+        esperando a la reconstrucción en curso si la hay. No se debe llamar
+        desde un greenlet de solicitud: la espera bloquearía el bucle.
+
+        Returns:
+            bool: True si se reconstruyó
+        """
+        with self._lock:
+            return self._rebuild()
+
+    def trigger(self):
+        """
+        Inicia la reconstrucción en un hilo nativo y vuelve de inmediato. Se
+        puede llamar desde un greenlet o desde un hilo del threadpool (niveles
+        de prediction_resolver): un greenlet creado ahí nunca correría.
+
+        Returns:
+            bool: False si ya hay una en curso o se está esperando tras un fallo
+        """
+        if self.backing_off() or not self._lock.acquire(False):
+            return False
+        app = current_app._get_current_object() if has_app_context() else None
+        try:
+            _native('start_new_thread')(self._run_background, (app,))
+        except Exception:
+            self._lock.release()
+            raise
+        return True
+
+    def _run_background(self, app):
+        try:
+            if app is None:
+                self._rebuild()
+            else:
+                with app.app_context():
+                    self._rebuild()
+        finally:
+            self._lock.release()
+
+
+class LoopLagMonitor:
+    """Greenlet que mide el retraso del bucle de eventos de gevent."""
+
+    def __init__(self, interval_ms, threshold_ms, window, recent_blocks):
+        self.interval = interval_ms / 1000.0
+        self.threshold_ms = threshold_ms
+        self.lags_ms = deque(maxlen=window)
+        self.blocks = deque(maxlen=recent_blocks)
+        self.blocked = 0
+        self.max_ms = 0.0
+        self._greenlet = None
+
+    def start(self):
+        import gevent
+
+        if self._greenlet is None:
+            self._greenlet = gevent.spawn(self._run)
+        return self
+
+    def _run(self):
+        import gevent
+
+        while True:
+            start = time.perf_counter()
+            gevent.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.interval) * 1000)
+            self.record(lag_ms)
+
+    def record(self, lag_ms):
+        EVENT_LOOP_LAG.observe(lag_ms / 1000)
+        self.lags_ms.append(lag_ms)
+        self.max_ms = max(self.max_ms, lag_ms)
+        if lag_ms > self.threshold_ms:
+            self.blocked += 1
+            self.blocks.append({'at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'lag_ms': round(lag_ms, 1)})
+            EVENT_LOOP_BLOCKED.inc()
+            logging.warning(f"Bucle de eventos bloqueado {lag_ms:.0f} ms (umbral {self.threshold_ms:.0f} ms)")
+
+    def summary(self):
+        lags = np.array(self.lags_ms, dtype=np.float64)
+        summary = {
+            'running': self._greenlet is not None,
+            'threshold_ms': self.threshold_ms,
+            'samples': int(len(lags)),
+            'blocked': self.blocked,
+            'max_ms': round(self.max_ms, 1),
+            'recent_blocks': list(self.blocks)
+        }
+        if len(lags):
+            p50, p95, p99 = np.percentile(lags, [50, 95, 99])
+            summary.update({'p50_ms': round(p50, 2), 'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2)})
+        return summary
+
+
+loop_monitor = LoopLagMonitor(OFFLOAD_CONFIG['lag_interval_ms'], OFFLOAD_CONFIG['lag_threshold_ms'],
+                              OFFLOAD_CONFIG['lag_window'], OFFLOAD_CONFIG['recent_blocks'])
+
+
+def start_loop_monitor():
+    """Inicia el monitor de retraso (solo bajo gevent; una vez por proceso)."""
+    if not gevent_patched():
+        return None
+    loop_monitor.start()
+    if OFFLOAD_CONFIG['report_stacks']:
+        import gevent
+
+        gevent.config.monitor_thread = True
+        gevent.config.max_blocking_time = OFFLOAD_CONFIG['lag_threshold_ms'] / 1000
+        gevent.get_hub().start_periodic_monitoring_thread()
+    logging.info(f"Monitor del bucle de eventos iniciado (umbral {OFFLOAD_CONFIG['lag_threshold_ms']:.0f} ms)")
+    return loop_monitor
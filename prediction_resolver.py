@@ -0,0 +1,350 @@
+"""
+Resolución de predicciones por niveles con presupuesto de latencia
+-----------------------------------------------------------------
+
+predict_station_risk / predict_incident_type consultan, en orden:
+
+1. memory:      caché compartido de predicciones (prediction_store) o, si no
+                se ha publicado, índice en memoria de predictions_cache.json
+2. model:       artefacto RNN exportado + consulta de incidentes recientes
+3. statistical: motor bayesiano empírico (risk_engine)
+
+Cada nivel tiene un presupuesto de latencia y un circuit breaker. Los niveles
+con presupuesto se ejecutan en hilos nativos (el threadpool del hub bajo
+gevent, offload.run_cpu_bound_with_timeout; un ThreadPoolExecutor sin gevent)
+y, si no responden a tiempo, la solicitud continúa con el siguiente nivel
+mientras el nivel lento termina en segundo plano: un nivel de CPU como el RNN
+no bloquea el bucle de eventos. Si ningún nivel responde se usa la tabla
+precalculada del fallback (fallback_tables), que es un índice de arreglo y no
+puede bloquear.
+
+Cada resolución registra qué nivel respondió y cuánto tardó; las estadísticas
+por nivel se consultan con get_tier_stats().
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from flask import current_app, has_app_context
+
+from bogota_clock import bogota_now
+from fallback_tables import load_fallback_table
+from instrumentation import record_cache, time_inference
+from offload import gevent_patched, run_cpu_bound_with_timeout
+from prediction_store import get_prediction_view
+
+RESOLVER_CONFIG = {
+    # Presupuesto por nivel en milisegundos (None: se ejecuta en línea, sin límite)
+    'budgets_ms': {
+        'memory': None,
+        'model': float(os.environ.get('PREDICTION_MODEL_BUDGET_MS', 150)),
+        'statistical': float(os.environ.get('PREDICTION_STATISTICAL_BUDGET_MS', 100))
+    },
+    'failure_threshold': 5,      # Fallos/timeouts consecutivos para abrir el circuito
+    'reset_seconds': 30,         # Tiempo con el circuito abierto antes de reintentar
+    'max_workers': int(os.environ.get('PREDICTION_RESOLVER_WORKERS', 8)),
+    'latency_window': 1000,      # Latencias recientes guardadas por nivel
+    'cache_path': 'predictions_cache.json'
+}
+
+TIERS = ('memory', 'model', 'statistical')
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por nivel: tras `failure_threshold` fallos consecutivos el
+    nivel se omite durante `reset_seconds`; luego se permite un intento de prueba
+    a la vez y las demás solicitudes se omiten hasta que ese intento termine.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'open':
+            return False
+        with self._lock:
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.probing = False
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                # Un fallo en estado half_open vuelve a abrir el circuito
+                self.opened_at = time.monotonic()
+
+
+class TierStats:
+    """Contadores y latencias recientes de un nivel."""
+
+    def __init__(self, window):
+        self.counts = {'answered': 0, 'miss': 0, 'timeout': 0, 'error': 0, 'short_circuited': 0}
+        self.latencies_ms = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, outcome, elapsed_ms=None):
+        with self._lock:
+            self.counts[outcome] += 1
+            if elapsed_ms is not None:
+                self.latencies_ms.append(elapsed_ms)
+
+    def summary(self):
+        with self._lock:
+            latencies = np.array(self.latencies_ms, dtype=np.float64)
+            counts = dict(self.counts)
+        summary = {'counts': counts, 'samples': int(len(latencies))}
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            summary.update({'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3),
+                            'p99_ms': round(p99, 3), 'max_ms': round(float(latencies.max()), 3)})
+        return summary
+
+
+class Resolution:
+    """Resultado de una resolución: valor, nivel que respondió y latencia total."""
+
+    __slots__ = ('risk_score', 'incident_type', 'tier', 'latency_ms')
+
+    def __init__(self, risk_score, incident_type, tier, latency_ms):
+        self.risk_score = risk_score
+        self.incident_type = incident_type
+        self.tier = tier
+        self.latency_ms = latency_ms
+
+    def to_dict(self):
+        return {
+            'risk_score': self.risk_score,
+            'incident_type': self.incident_type,
+            'tier': self.tier,
+            'latency_ms': round(self.latency_ms, 3)
+        }
+
+
+# --- Niveles ---
+
+_memory_index = {}
+
+
+def _load_memory_index(path):
+    """
+    Índice {(estación, hora): (riesgo, tipo)} del caché de predicciones,
+    recargado solo cuando cambia el archivo. Nunca genera el caché.
+    """
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _memory_index.get(path)
+    if cached and cached[0] == mtime:
+        record_cache('prediction_memory_index', True)
+        return cached[1]
+
+    record_cache('prediction_memory_index', False)
+    with open(path, 'r', encoding='utf-8') as f:
+        predictions = json.load(f)
+    index = {}
+    for prediction in predictions:
+        try:
+            key = (prediction['station'], datetime.fromisoformat(prediction['predicted_time']).hour)
+        except (KeyError, TypeError, ValueError):
+            continue
+        # Igual que la búsqueda lineal anterior: gana la primera predicción de esa hora
+        index.setdefault(key, (prediction.get('risk_score'), prediction.get('incident_type')))
+    _memory_index[path] = (mtime, index)
+    return index
+
+
+def _memory_tier(station, hour):
+    view = get_prediction_view()
+    if view is not None:
+        return view.lookup(station, hour)
+    index = _load_memory_index(RESOLVER_CONFIG['cache_path'])
+    if not index:
+        return None
+    return index.get((station, hour))
+
+
+def _model_tier(station, hour):
+    from prediction_service import prepare_prediction_data
+    from rnn_inference import load_inference_model
+
+    model = load_inference_model()
+    if model is None:
+        return None
+    current_data = prepare_prediction_data(station, hour)
+    if current_data is None:
+        return None
+    with time_inference(f"rnn_{model.model_format}", len(current_data)):
+        risk_score = float(model.predict(current_data)[0][0])
+    # El RNN solo estima el riesgo; el tipo sale de la tabla precalculada
+    _, incident_type = load_fallback_table().lookup(station, bogota_now().weekday(), hour)
+    return risk_score, incident_type
+
+
+def _statistical_tier(station, hour):
+    from risk_engine import get_risk_engine
+
+    # En la solicitud no se espera una reconstrucción: sin motor, el nivel falla
+    engine = get_risk_engine(wait=False)
+    if engine is None:
+        return None
+    return engine.station_risk(station, bogota_now().weekday(), hour)
+
+
+_TIER_FUNCTIONS = {
+    'memory': _memory_tier,
+    'model': _model_tier,
+    'statistical': _statistical_tier
+}
+
+
+class PredictionResolver:
+    """Ejecuta los niveles en orden respetando presupuestos y circuit breakers."""
+
+    def __init__(self, config=RESOLVER_CONFIG, tier_functions=None):
+        self.config = config
+        self.tier_functions = tier_functions or _TIER_FUNCTIONS
+        self.breakers = {tier: CircuitBreaker(config['failure_threshold'], config['reset_seconds'])
+                         for tier in self.tier_functions}
+        self.stats = {tier: TierStats(config['latency_window'])
+                      for tier in list(self.tier_functions) + ['fallback']}
+        self._executor = None
+
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.config['max_workers'],
+                                                thread_name_prefix='prediction-tier')
+        return self._executor
+
+    def _call_with_budget(self, tier, station, hour, budget_ms):
+        function = self.tier_functions[tier]
+        if budget_ms is None:
+            return function(station, hour)
+        if gevent_patched():
+            # Los hilos de un ThreadPoolExecutor serían greenlets: un nivel de CPU
+            # bloquearía el bucle y result(timeout) no podría cortarlo
+            return run_cpu_bound_with_timeout(budget_ms / 1000.0, function, station, hour)
+
+        app = current_app._get_current_object() if has_app_context() else None
+
+        def run():
+            if app is None:
+                return function(station, hour)
+            with app.app_context():
+                return function(station, hour)
+
+        # Si el nivel excede el presupuesto la tarea termina en segundo plano
+        return self.executor().submit(run).result(timeout=budget_ms / 1000.0)
+
+    def resolve(self, station, hour):
+        """
+        Returns:
+            Resolution: riesgo y tipo para (estación, hora), con el nivel que respondió
+        """
+        start = time.perf_counter()
+        for tier in self.tier_functions:
+            stats = self.stats[tier]
+            breaker = self.breakers[tier]
+            if not breaker.allow():
+                stats.record('short_circuited')
+                continue
+
+            tier_start = time.perf_counter()
+            try:
+                result = self._call_with_budget(tier, station, hour,
+                                                self.config['budgets_ms'].get(tier))
+            except TimeoutError:
+                elapsed = (time.perf_counter() - tier_start) * 1000
+                stats.record('timeout', elapsed)
+                breaker.record_failure()
+                logging.warning(f"Nivel de predicción '{tier}' excedió su presupuesto ({elapsed:.1f} ms)")
+                continue
+            except Exception as e:
+                stats.record('error', (time.perf_counter() - tier_start) * 1000)
+                breaker.record_failure()
+                logging.warning(f"Nivel de predicción '{tier}' falló: {str(e)}")
+                continue
+
+            elapsed = (time.perf_counter() - tier_start) * 1000
+            breaker.record_success()
+            if result is None or result[0] is None:
+                stats.record('miss', elapsed)
+                continue
+            stats.record('answered', elapsed)
+            return Resolution(float(result[0]), result[1], tier,
+                              (time.perf_counter() - start) * 1000)
+
+        tier_start = time.perf_counter()
+        risk_score, incident_type = load_fallback_table().lookup(station, bogota_now().weekday(), hour)
+        self.stats['fallback'].record('answered', (time.perf_counter() - tier_start) * 1000)
+        return Resolution(risk_score, incident_type, 'fallback', (time.perf_counter() - start) * 1000)
+
+    def tier_stats(self):
+        return {
+            tier: dict(stats.summary(),
+                       budget_ms=self.config['budgets_ms'].get(tier),
+                       circuit=self.breakers[tier].state if tier in self.breakers else None)
+            for tier, stats in self.stats.items()
+        }
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = PredictionResolver()
+    return _resolver
+
+
+def resolve_station_prediction(station, hour):
+    """
+    Riesgo y tipo de incidente para una estación y hora, con el nivel que respondió.
+
+    Returns:
+        Resolution
+    """
+    resolution = get_resolver().resolve(station, hour)
+    logging.debug(f"Predicción {station}@{hour}h resuelta por '{resolution.tier}' "
+                  f"en {resolution.latency_ms:.1f} ms")
+    return resolution
+
+
+def get_tier_stats():
+    """Estadísticas por nivel: respuestas, timeouts, errores, latencias y estado del circuito."""
+    return get_resolver().tier_stats()
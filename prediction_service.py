@@ -0,0 +1,550 @@
+"""
+Servicio de Predicciones para TransMilenio
+-----------------------------------------
+
+Funciones usadas por el servidor web y el programador de tareas para servir
+predicciones:
+1. Caché de predicciones (predictions_cache.json y su copia compartida en
+   prediction_store) y su regeneración, una sola a la vez por host
+   (regenerate_predictions); un caché vencido se sirve mientras se regenera
+2. Inferencia con el artefacto exportado del RNN (rnn_inference, sin TensorFlow)
+3. Modelo GBM para el caché semanal (tabular_models, importado solo al generar)
+4. Motor bayesiano empírico sobre la historia de incidentes (risk_engine)
+5. Sistema de fallback estadístico (tabla precalculada, fallback_tables)
+6. Resolución por niveles con presupuesto de latencia (prediction_resolver)
+
+El entrenamiento vive en ml_models.py. Este módulo no importa TensorFlow,
+pandas ni scikit-learn para que los workers web arranquen rápido.
+"""
+
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import json
+import os
+import threading
+import time
+from flask import current_app, has_app_context
+import numpy as np
+import pytz
+from ml_models import CV_CONFIG, MODEL_CONFIG
+from rnn_inference import inference_artifact_path
+from fallback_tables import load_fallback_table
+from instrumentation import time_inference
+from prediction_store import get_prediction_view, publish_predictions
+from offload import run_cpu_bound
+
+PREDICTION_CACHE_CONFIG = {
+    'json_path': 'predictions_cache.json',
+    'lock_path': 'predictions_cache.lock',       # Candado de regeneración entre procesos
+    # Con más antigüedad, el caché se sirve igual y se regenera en segundo plano
+    'max_age_seconds': float(os.environ.get('PREDICTION_CACHE_MAX_AGE_SECONDS', 3600)),
+    'min_regeneration_seconds': 60,             # /initialize_predictions reutiliza un caché más reciente
+    'lock_timeout_seconds': 600,
+    'lock_poll_seconds': 0.1
+}
+
+# Definir tipos de incidentes válidos
+VALID_INCIDENT_TYPES = [
+    'Hurto',
+    'Hurto a mano armada',
+    'Cosquilleo',
+    'Ataque',
+    'Apertura de puertas',
+    'Sospechoso',
+    'Acoso'
+]
+
+
+def predict_station_risk(station, hour):
+    """
+    Predice el nivel de riesgo para una estación específica en una hora determinada.
+    Consulta los niveles memoria -> modelo -> estadístico con presupuesto de
+    latencia (ver prediction_resolver) y termina en la tabla de fallback.
+    """
+    try:
+        from prediction_resolver import resolve_station_prediction
+        return resolve_station_prediction(station, hour).risk_score
+    except Exception as e:
+        logging.error(f"Error predicting risk for station {station}: {str(e)}")
+        return None
+
+def predict_incident_type(station, hour):
+    """
+    Predice el tipo de incidente más probable.
+    Usa los mismos niveles que predict_station_risk.
+    """
+    try:
+        from prediction_resolver import resolve_station_prediction
+        return resolve_station_prediction(station, hour).incident_type
+    except Exception as e:
+        logging.error(f"Error predicting incident type for station {station}: {str(e)}")
+        return None
+
+def _validation_accuracy():
+    """
+    Accuracy promedio de la última validación cruzada del RNN
+    (models/validation_metrics.json, escrito por ml_models.cross_validate_model).
+
+    Returns:
+        float: Accuracy promedio de las particiones, o None si no hay métricas
+    """
+    try:
+        with open(CV_CONFIG['metrics_path']) as f:
+            accuracy = json.load(f).get('accuracy')
+        return float(accuracy) if accuracy is not None else None
+    except (OSError, ValueError, TypeError) as e:
+        logging.warning(f"Métricas de validación no disponibles: {str(e)}")
+        return None
+
+def get_model_insights():
+    """
+    Proporciona métricas e insights sobre el rendimiento del modelo.
+    La accuracy es la de la última validación cruzada del RNN, o None si no
+    hay métricas o no hay modelo exportado (el fallback estadístico no se valida).
+    """
+    try:
+        # Basta con verificar el artefacto exportado; no es necesario cargar el modelo
+        model_path = inference_artifact_path()
+        if model_path is not None:
+            return {
+                'accuracy': _validation_accuracy(),
+                'predictions_available': True,
+                'model_status': 'active',
+                'model_type': 'RNN-LSTM',
+                'last_training': os.path.getmtime(model_path)
+            }
+    except Exception:
+        pass
+
+    return {
+        'accuracy': None,
+        'predictions_available': True,
+        'model_status': 'fallback',
+        'model_type': 'statistical',
+        'last_training': None
+    }
+
+# Funciones auxiliares para futuras implementaciones
+def predict_incident_probability(latitude, longitude, hour, day_of_week, month, nearest_station):
+    """Placeholder para futura implementación de predicción de probabilidad"""
+    return "Prediction not available with the simplified model."
+
+def prepare_prediction_data(station, hour):
+    """
+    Prepara los datos para predicción en tiempo real a partir del estado de
+    características en vivo del proceso (live_features), sin consultar la
+    base de datos.
+
+    Args:
+        station (str): Nombre de la estación
+        hour (int): Hora del día (0-23)
+
+    Returns:
+        numpy.ndarray: Vista de solo lectura [1, sequence_length, n_features] para la RNN
+        None: En caso de error o datos insuficientes
+    """
+    try:
+        from live_features import get_live_features
+
+        state = get_live_features()
+        if state is None:
+            return None
+
+        if state.incident_count(station) < MODEL_CONFIG['sequence_length'] // 2:
+            logging.warning(f"Insufficient recent data for station {station}")
+            return None
+
+        return state.station_window(station)
+
+    except Exception as e:
+        logging.error(f"Error preparing prediction data: {str(e)}")
+        return None
+
+def resolve_model_version(model_version=None):
+    """
+    Determina qué modelo genera las predicciones del caché.
+
+    Args:
+        model_version (str): 'gbm', 'bayes' o 'fallback'. Si es None se usa
+            PREDICTION_MODEL_VERSION de la configuración de la aplicación.
+
+    Returns:
+        str: Versión de modelo disponible ('gbm' solo si hay un modelo entrenado)
+    """
+    if model_version is None:
+        model_version = current_app.config.get('PREDICTION_MODEL_VERSION', 'gbm') if has_app_context() else 'gbm'
+
+    if model_version == 'gbm':
+        from tabular_models import gbm_model_available
+        if not gbm_model_available():
+            logging.info("Modelo GBM no entrenado, usando motor bayesiano")
+            return 'bayes'
+    elif model_version not in ('bayes', 'fallback'):
+        logging.warning(f"Versión de modelo desconocida '{model_version}', usando fallback")
+        return 'fallback'
+    return model_version
+
+def _forecast_rows(times, risk, incident_types, model_version, tz):
+    """
+    Convierte un pronóstico vectorizado al formato del caché.
+
+    Args:
+        times (list): Datetimes objetivo (sin zona)
+        risk (numpy.ndarray): Riesgo (n_estaciones, n_horas) en el orden de load_stations()
+        incident_types: Tipo por (estación, hora), indexable como incident_types[i][h]
+        model_version (str): Modelo que generó el pronóstico
+        tz: Zona horaria de las predicciones
+    """
+    from stations import load_stations
+
+    stations = load_stations()
+    prediction_made = datetime.now().isoformat()
+    predictions = []
+    for hour_offset, pred_time in enumerate(times):
+        predicted_time = tz.localize(pred_time).isoformat() if hasattr(tz, 'localize') else pred_time.isoformat()
+        for station_idx, station in enumerate(stations):
+            predictions.append({
+                'station': station['nombre'],
+                'predicted_time': predicted_time,
+                'risk_score': round(float(risk[station_idx, hour_offset]), 4),
+                'incident_type': incident_types[station_idx][hour_offset],
+                'latitude': station['latitude'],
+                'longitude': station['longitude'],
+                'prediction_made': prediction_made,
+                'model_version': model_version
+            })
+    return predictions
+
+def _gbm_predictions(hours_ahead, current_time):
+    """
+    Genera las predicciones de todas las estaciones con el modelo GBM
+    en una sola pasada vectorizada.
+
+    Returns:
+        list: Predicciones en el formato del caché, o None si el modelo falla
+    """
+    from stations import station_index
+    from tabular_models import predict_week_ahead
+
+    try:
+        with time_inference('gbm', len(station_index()) * hours_ahead):
+            result = predict_week_ahead(hours_ahead, now=current_time.replace(tzinfo=None))
+    except Exception as e:
+        logging.error(f"Error en predicción GBM: {str(e)}", exc_info=True)
+        return None
+    if result is None:
+        return None
+
+    times, risk, station_types = result
+    incident_types = [[incident_type] * len(times) for incident_type in station_types]
+    return _forecast_rows(times, risk, incident_types, 'gbm', current_time.tzinfo)
+
+def _bayes_predictions(hours_ahead, current_time):
+    """
+    Genera las predicciones de todas las estaciones con el motor bayesiano
+    empírico (risk_engine) en una sola pasada vectorizada.
+
+    Returns:
+        list: Predicciones en el formato del caché, o None si el motor no está disponible
+    """
+    from risk_engine import get_risk_engine
+
+    try:
+        engine = get_risk_engine()
+        if engine is None:
+            return None
+        with time_inference('bayes', engine.risk.shape[0] * hours_ahead):
+            times, risk, type_idx = engine.forecast(hours_ahead, now=current_time.replace(tzinfo=None))
+    except Exception as e:
+        logging.error(f"Error en predicción bayesiana: {str(e)}", exc_info=True)
+        return None
+
+    type_names = np.array(engine.types)[type_idx].tolist()
+    return _forecast_rows(times, risk, type_names, 'bayes', current_time.tzinfo)
+
+def generate_prediction_cache(hours_ahead=24, model_version=None):
+    """
+    Genera predicciones para las próximas horas.
+
+    Args:
+        hours_ahead (int): Horas a predecir
+        model_version (str): Modelo a usar ('gbm' o 'fallback'); ver resolve_model_version
+    """
+    try:
+        logging.info(f"Generando predicciones para las próximas {hours_ahead} horas...")
+        predictions = []
+        current_time = datetime.now(pytz.timezone('America/Bogota'))
+
+        model_version = resolve_model_version(model_version)
+        if model_version == 'gbm':
+            predictions = _gbm_predictions(hours_ahead, current_time) or []
+            if not predictions:
+                logging.warning("El modelo GBM no generó predicciones, usando motor bayesiano")
+                model_version = 'bayes'
+
+        if model_version == 'bayes' and not predictions:
+            predictions = _bayes_predictions(hours_ahead, current_time) or []
+            if not predictions:
+                logging.warning("El motor bayesiano no generó predicciones, usando fallback")
+
+        if not predictions:
+            # Sistema de fallback: cargar datos de estaciones
+            with open('static/Estaciones_Troncales_de_TRANSMILENIO.geojson', 'r', encoding='utf-8') as f:
+                geojson_data = json.load(f)
+                logging.info(f"Datos de estaciones cargados: {len(geojson_data['features'])} estaciones")
+
+            # Generar predicciones para las próximas hours_ahead horas
+            for hour_offset in range(hours_ahead):
+                pred_time = current_time + timedelta(hours=hour_offset)
+                logging.info(f"Generando predicciones para {pred_time.isoformat()}")
+
+                for feature in geojson_data['features']:
+                    station = feature['properties']['nombre_estacion']
+                    coordinates = feature['geometry']['coordinates']
+
+                    try:
+                        # Usar sistema de fallback mejorado
+                        risk_score, incident_type = enhanced_fallback_prediction(station, pred_time)
+
+                        prediction = {
+                            'station': station,
+                            'predicted_time': pred_time.isoformat(),
+                            'risk_score': float(risk_score),
+                            'incident_type': incident_type,
+                            'latitude': coordinates[1],
+                            'longitude': coordinates[0],
+                            'prediction_made': datetime.now().isoformat(),
+                            'model_version': 'fallback'
+                        }
+                        predictions.append(prediction)
+
+                    except Exception as e:
+                        logging.error(f"Error prediciendo para estación {station}: {str(e)}")
+                        continue
+
+        # Guardar predicciones en archivo para respaldo y publicarlas a los workers.
+        # Se escribe un temporal y se reemplaza el archivo: los lectores nunca ven uno a medias
+        if predictions:
+            path = PREDICTION_CACHE_CONFIG['json_path']
+            tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(predictions, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            publish_predictions(predictions)
+
+            logging.info(f"Generadas y guardadas {len(predictions)} predicciones")
+            return predictions
+
+        logging.warning("No se generaron predicciones")
+        return []
+
+    except Exception as e:
+        logging.error(f"Error generando predicciones: {str(e)}", exc_info=True)
+        return []
+
+def update_predictions_periodically():
+    """
+    Actualiza las predicciones periódicamente y notifica a los clientes conectados.
+    """
+    try:
+        logging.info("Iniciando actualización periódica de predicciones...")
+        predictions = regenerate_predictions(hours_ahead=24)
+
+        if predictions:
+            # Cargar información de troncales
+            from stations import station_troncales
+            station_to_troncal = station_troncales()
+
+            # Agregar información de troncal a cada predicción
+            for prediction in predictions:
+                prediction['troncal'] = station_to_troncal.get(prediction['station'], 'N/A')
+
+            # Notificar a través de SocketIO (por la cola de mensajes si está configurada)
+            from socketio_queue import emit_event
+            prediction_data = {
+                'timestamp': datetime.now().isoformat(),
+                'prediction_count': len(predictions),
+                'predictions': predictions,
+                'update_type': 'periodic'
+            }
+
+            logging.info(f"Enviando {len(predictions)} predicciones a través de WebSocket")
+            emit_event('predictions_updated', prediction_data)
+
+            logging.info("Predicciones enviadas exitosamente")
+            return True
+
+        logging.warning("No se generaron predicciones para enviar")
+        return False
+    except Exception as e:
+        logging.error(f"Error actualizando predicciones: {str(e)}", exc_info=True)
+        return False
+
+class _Flight:
+    """Regeneración en curso en este proceso; las llamadas concurrentes esperan su resultado."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+_background_refresh = None
+
+
+@contextmanager
+def _regeneration_lock():
+    """
+    Candado exclusivo entre procesos (flock sobre lock_path). Se sondea sin
+    bloquear para no detener el hub de gevent; el sistema operativo lo libera
+    si el proceso que lo tiene muere. Sin fcntl solo se coordina este proceso.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    with open(PREDICTION_CACHE_CONFIG['lock_path'], 'a') as lock_file:
+        acquired = False
+        deadline = time.time() + PREDICTION_CACHE_CONFIG['lock_timeout_seconds']
+        while not acquired:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+            except BlockingIOError:
+                if time.time() > deadline:
+                    logging.warning("Tiempo agotado esperando el candado de regeneración, regenerando sin él")
+                    break
+                time.sleep(PREDICTION_CACHE_CONFIG['lock_poll_seconds'])
+        try:
+            yield
+        finally:
+            if acquired:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def regenerate_predictions(hours_ahead=24, model_version=None, max_age=None):
+    """
+    Regenera el caché de predicciones con una sola ejecución a la vez:
+    - En el proceso, las llamadas concurrentes con los mismos argumentos
+      esperan a la regeneración en curso y reciben su resultado.
+    - Entre procesos, un candado de archivo serializa las regeneraciones.
+
+    Args:
+        hours_ahead (int): Horas a predecir
+        model_version (str): Ver resolve_model_version
+        max_age (float): Si el caché publicado (también por otro proceso mientras
+            se esperaba el candado) tiene menos segundos, se devuelve sin regenerar
+
+    Returns:
+        list: Predicciones, o [] si la regeneración falla
+    """
+    key = (hours_ahead, model_version)
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        logging.info(f"Esperando la regeneración de predicciones en curso ({hours_ahead} horas)")
+        flight.done.wait(PREDICTION_CACHE_CONFIG['lock_timeout_seconds'])
+        # Copias: los consumidores modifican las predicciones (p. ej. agregan la troncal)
+        return [dict(prediction) for prediction in flight.result or []]
+
+    try:
+        with _regeneration_lock():
+            view = get_prediction_view()
+            if max_age is not None and view is not None and len(view) \
+                    and time.time() - view.published < max_age:
+                logging.info(f"Caché de predicciones reciente (generación {view.generation}), sin regenerar")
+                flight.result = view.rows()
+            else:
+                # Generar es CPU intensivo: en un hilo nativo para no bloquear el bucle de gevent
+                flight.result = run_cpu_bound(generate_prediction_cache, hours_ahead=hours_ahead,
+                                              model_version=model_version)
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+    return flight.result
+
+
+def _refresh_in_background():
+    """Regenera el caché vencido sin bloquear la solicitud (una sola vez por proceso)."""
+    global _background_refresh
+    if has_app_context():
+        app = current_app._get_current_object()
+    else:
+        from app import app
+
+    def refresh():
+        with app.app_context():
+            regenerate_predictions(hours_ahead=24, max_age=PREDICTION_CACHE_CONFIG['max_age_seconds'])
+
+    with _flights_lock:
+        if _background_refresh is not None and _background_refresh.is_alive():
+            return
+        logging.info("Caché de predicciones vencido, regenerando en segundo plano")
+        _background_refresh = threading.Thread(target=refresh, name='prediction-refresh', daemon=True)
+        _background_refresh.start()
+
+
+def get_cached_predictions():
+    """
+    Obtiene predicciones del caché compartido (prediction_store) con fallback al archivo.
+    Un caché vencido se sirve igual y se regenera en segundo plano; sin caché,
+    las llamadas concurrentes comparten una sola regeneración.
+    """
+    max_age = PREDICTION_CACHE_CONFIG['max_age_seconds']
+    try:
+        view = get_prediction_view()
+        if view is not None and len(view):
+            if time.time() - view.published > max_age:
+                _refresh_in_background()
+            return view.rows()
+
+        # Sin caché compartido, intentar con el archivo de respaldo
+        path = PREDICTION_CACHE_CONFIG['json_path']
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                predictions = json.load(f)
+            if predictions:
+                logging.info(f"Predicciones recuperadas del archivo: {len(predictions)}")
+                if time.time() - os.path.getmtime(path) > max_age:
+                    _refresh_in_background()
+                return predictions
+        except FileNotFoundError:
+            pass
+        except Exception as file_error:
+            logging.warning(f"No se pudo cargar el archivo de respaldo: {str(file_error)}")
+
+        # Si no hay archivo o está vacío, generar nuevas predicciones
+        logging.info("Generando nuevas predicciones ya que no hay caché disponible")
+        predictions = regenerate_predictions(hours_ahead=24, max_age=max_age)
+        return predictions if predictions else []
+
+    except Exception as e:
+        logging.error(f"Error obteniendo predicciones del caché: {str(e)}")
+        return []
+
+def enhanced_fallback_prediction(station, pred_time):
+    """
+    Sistema de fallback determinista: consulta la tabla precalculada de riesgo
+    por (estación, día de la semana, hora). Ver fallback_tables.py.
+
+    Args:
+        station (str): Nombre de la estación
+        pred_time (datetime): Tiempo para la predicción
+
+    Returns:
+        tuple: (risk_score, incident_type)
+    """
+    try:
+        return load_fallback_table().lookup(station, pred_time.weekday(), pred_time.hour)
+    except Exception as e:
+        logging.error(f"Error en predicción fallback: {str(e)}")
+        return 0.5, VALID_INCIDENT_TYPES[0]
@@ -0,0 +1,273 @@
+"""
+Caché de predicciones compartido entre workers
+---------------------------------------------
+
+generate_prediction_cache publica las predicciones en un archivo binario
+(predictions_cache.bin) que cada worker mapea en memoria de solo lectura
+(mmap). Las páginas viven una sola vez en el page cache del host, sin
+importar cuántos workers lo lean, y nadie vuelve a parsear el JSON.
+
+Formato del archivo:
+- Encabezado fijo de 64 bytes: magic, versión del formato, generación,
+  fecha de publicación, número de filas y longitud de los metadatos
+- Metadatos JSON: diccionario de valores de las columnas de texto y la
+  posición de cada columna
+- Columnas NumPy alineadas a 8 bytes: códigos int32 para el texto, float64
+  para riesgo y coordenadas, int8 para la hora local de la predicción
+
+Cada publicación escribe un archivo nuevo con la generación siguiente y lo
+reemplaza con os.replace, así que los lectores nunca ven un archivo a medias.
+get_prediction_view() compara el inodo del archivo en cada llamada (un stat)
+y cambia de vista cuando hay una generación nueva: todos los workers ven las
+predicciones nuevas en la siguiente solicitud. Con PREDICTION_STORE_PATH en
+/dev/shm el archivo queda solo en RAM.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from instrumentation import record_cache
+
+PREDICTION_STORE_CONFIG = {
+    'path': os.environ.get('PREDICTION_STORE_PATH', 'predictions_cache.bin'),
+    'magic': b'TMPC',
+    'format_version': 1,
+    'header_size': 64
+}
+
+# magic, versión, reservado, generación, publicado (epoch), filas, bytes de metadatos
+_HEADER = struct.Struct('<4sHHQdQQ')
+
+# Columnas en el orden de las claves del caché JSON
+_TEXT_COLUMNS = ('station', 'predicted_time', 'incident_type', 'prediction_made', 'model_version')
+_FLOAT_COLUMNS = ('risk_score', 'latitude', 'longitude')
+_ROW_KEYS = ('station', 'predicted_time', 'risk_score', 'incident_type',
+             'latitude', 'longitude', 'prediction_made', 'model_version')
+
+
+def _align(offset, size=8):
+    return (offset + size - 1) // size * size
+
+
+def _hour_slot(timestamp):
+    """Horas desde 1970 de la hora local (sin zona) de timestamp."""
+    return (timestamp.replace(tzinfo=None) - datetime(1970, 1, 1)) // timedelta(hours=1)
+
+
+def _read_generation(path):
+    """Generación del archivo publicado, o 0 si no existe o no es válido."""
+    try:
+        with open(path, 'rb') as f:
+            magic, version, _, generation, _, _, _ = _HEADER.unpack(f.read(_HEADER.size))
+        if magic == PREDICTION_STORE_CONFIG['magic'] and version == PREDICTION_STORE_CONFIG['format_version']:
+            return generation
+    except (OSError, struct.error):
+        pass
+    return 0
+
+
+def _encode(predictions):
+    """Columnas NumPy y diccionarios de texto de una lista de predicciones."""
+    strings, columns = {}, {}
+    for column in _TEXT_COLUMNS:
+        values = [prediction.get(column) for prediction in predictions]
+        table = list(dict.fromkeys(values))
+        codes = {value: i for i, value in enumerate(table)}
+        strings[column] = table
+        columns[column] = np.array([codes[value] for value in values], dtype=np.int32)
+    for column in _FLOAT_COLUMNS:
+        columns[column] = np.array([prediction.get(column) for prediction in predictions], dtype=np.float64)
+
+    # Hora local de cada predicción, para las consultas (estación, hora) del resolver
+    hours = []
+    for value in strings['predicted_time']:
+        try:
+            hours.append(datetime.fromisoformat(value).hour)
+        except (TypeError, ValueError):
+            hours.append(-1)
+    columns['hour'] = np.array(hours, dtype=np.int8)[columns['predicted_time']]
+    return strings, columns
+
+
+def publish_predictions(predictions, path=None):
+    """
+    Publica las predicciones en el archivo compartido (temporal + rename).
+
+    Returns:
+        int: Generación publicada, o None si falla
+    """
+    path = path or PREDICTION_STORE_CONFIG['path']
+    try:
+        strings, columns = _encode(predictions)
+        generation = _read_generation(path) + 1
+
+        layout, offset = [], 0
+        for name, array in columns.items():
+            layout.append([name, array.dtype.str, offset])
+            offset = _align(offset + array.nbytes)
+        meta = json.dumps({'strings': strings, 'columns': layout}, ensure_ascii=False).encode('utf-8')
+        data_start = _align(PREDICTION_STORE_CONFIG['header_size'] + len(meta))
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(PREDICTION_STORE_CONFIG['magic'], PREDICTION_STORE_CONFIG['format_version'], 0,
+                                 generation, time.time(), len(predictions), len(meta)))
+            f.seek(PREDICTION_STORE_CONFIG['header_size'])
+            f.write(meta)
+            for name, _, column_offset in layout:
+                f.seek(data_start + column_offset)
+                f.write(columns[name].tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        logging.info(f"Caché compartido de predicciones publicado: generación {generation}, "
+                     f"{len(predictions)} filas en {path}")
+        return generation
+    except Exception as e:
+        logging.error(f"Error publicando caché compartido de predicciones: {str(e)}", exc_info=True)
+        return None
+
+
+class PredictionView:
+    """
+    Vista de solo lectura sobre una generación publicada. Las columnas son
+    arreglos NumPy sobre el mmap (sin copia); rows() arma los diccionarios
+    del caché en cada llamada porque los consumidores los modifican.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        magic, version, _, generation, published, n_rows, meta_len = _HEADER.unpack_from(self._mmap, 0)
+        if magic != PREDICTION_STORE_CONFIG['magic'] or version != PREDICTION_STORE_CONFIG['format_version']:
+            raise ValueError(f"{path} no es un caché de predicciones compatible")
+        self.generation = generation
+        self.published = published
+        self.n_rows = n_rows
+
+        header_size = PREDICTION_STORE_CONFIG['header_size']
+        meta = json.loads(self._mmap[header_size:header_size + meta_len].decode('utf-8'))
+        data_start = _align(header_size + meta_len)
+        self.strings = meta['strings']
+        self.columns = {
+            name: np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=n_rows, offset=data_start + offset)
+            for name, dtype, offset in meta['columns']
+        }
+
+        # Primera fila de cada (estación, hora), como el índice del caché JSON
+        self.station_idx = {name: i for i, name in enumerate(self.strings['station'])}
+        self._first_row = np.full((len(self.station_idx), 24), -1, dtype=np.int64)
+        valid = self.columns['hour'] >= 0
+        keys = self.columns['station'][valid].astype(np.int64) * 24 + self.columns['hour'][valid]
+        unique_keys, first = np.unique(keys, return_index=True)
+        self._first_row.flat[unique_keys] = np.flatnonzero(valid)[first]
+
+        # Primera fila de cada (fecha y hora, estación), para consultar dentro del horizonte
+        slots = []
+        for value in self.strings['predicted_time']:
+            try:
+                slots.append(_hour_slot(datetime.fromisoformat(value)))
+            except (TypeError, ValueError):
+                slots.append(-1)
+        row_slots = np.array(slots, dtype=np.int64)[self.columns['predicted_time']]
+        valid = row_slots >= 0
+        keys = row_slots[valid] * len(self.station_idx) + self.columns['station'][valid]
+        self._slot_keys, first = np.unique(keys, return_index=True)
+        self._slot_rows = np.flatnonzero(valid)[first]
+
+    def __len__(self):
+        return self.n_rows
+
+    def lookup(self, station, hour):
+        """
+        Returns:
+            tuple: (risk_score, incident_type) o None si no hay predicción para esa estación y hora
+        """
+        idx = self.station_idx.get(station)
+        if idx is None or not 0 <= hour < 24:
+            return None
+        row = self._first_row[idx, hour]
+        if row < 0:
+            return None
+        return self._prediction(row)
+
+    def lookup_at(self, station, when):
+        """
+        Predicción de la estación para la fecha y hora local de `when`.
+
+        Returns:
+            tuple: (risk_score, incident_type) o None si `when` está fuera del horizonte publicado
+        """
+        idx = self.station_idx.get(station)
+        if idx is None:
+            return None
+        key = _hour_slot(when) * len(self.station_idx) + idx
+        pos = int(np.searchsorted(self._slot_keys, key))
+        if pos >= len(self._slot_keys) or self._slot_keys[pos] != key:
+            return None
+        return self._prediction(self._slot_rows[pos])
+
+    def _prediction(self, row):
+        return (float(self.columns['risk_score'][row]),
+                self.strings['incident_type'][self.columns['incident_type'][row]])
+
+    def rows(self):
+        """Lista de predicciones en el formato de predictions_cache.json."""
+        values = {}
+        for column in _TEXT_COLUMNS:
+            table = self.strings[column]
+            values[column] = [table[code] for code in self.columns[column].tolist()]
+        for column in _FLOAT_COLUMNS:
+            values[column] = self.columns[column].tolist()
+        return [dict(zip(_ROW_KEYS, row)) for row in zip(*(values[key] for key in _ROW_KEYS))]
+
+
+_views = {}
+_views_lock = threading.Lock()
+
+
+def get_prediction_view(path=None):
+    """
+    Vista de la última generación publicada; cambia de vista cuando el archivo
+    fue reemplazado. Nunca genera el caché.
+
+    Returns:
+        PredictionView o None si no hay archivo publicado o no es válido
+    """
+    path = path or PREDICTION_STORE_CONFIG['path']
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    view = _views.get(path)
+    if view is not None and view.identity == identity:
+        record_cache('prediction_store', True)
+        return view
+
+    with _views_lock:
+        view = _views.get(path)
+        if view is not None and view.identity == identity:
+            return view
+        record_cache('prediction_store', False)
+        try:
+            new_view = PredictionView(path)
+        except Exception as e:
+            logging.error(f"Error mapeando caché compartido de predicciones {path}: {str(e)}")
+            return None
+        if view is not None:
+            logging.info(f"Caché compartido de predicciones: generación {view.generation} -> {new_view.generation}")
+        # La vista anterior se libera cuando nadie más tiene referencias a sus columnas
+        _views[path] = new_view
+        return new_view
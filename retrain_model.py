@@ -1,11 +1,13 @@
 import logging
-from ml_models import train_rnn_model, get_model_insights
+from ml_models import train_rnn_model
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix, roc_auc_score
 import numpy as np
 import tensorflow as tf
 from datetime import datetime
 import os
+os.environ.setdefault('DB_ROLE', 'training')  # Pool de conexiones de entrenamiento
 from app import app  # Importar la aplicación Flask
+from rnn_inference import NUMPY_WEIGHTS_PATH, TFLITE_MODEL_PATH, save_numpy_weights
 
 """
 Sistema de Reentrenamiento y Análisis del Modelo RNN
@@ -15,7 +17,8 @@ Este módulo maneja:
 1. Reentrenamiento periódico del modelo RNN
 2. Evaluación de rendimiento
 3. Generación de métricas e insights
-4. Logging detallado del proceso
+4. Exportación de artefactos de inferencia sin TensorFlow (NumPy / TFLite)
+5. Logging detallado del proceso
 """
 
 logging.basicConfig(level=logging.INFO)
@@ -46,6 +49,9 @@ def retrain_and_analyze():
                 model.save(save_path)
                 logging.info(f"Modelo guardado en: {save_path}")
 
+                # Exportar artefactos de inferencia para el servidor web
+                export_inference_artifacts(model)
+
                 # Registrar métricas de entrenamiento
                 val_accuracy = history.history['val_accuracy'][-1]
                 val_loss = history.history['val_loss'][-1]
@@ -68,6 +74,46 @@ def retrain_and_analyze():
         logging.error(f"Error en retrain_and_analyze: {str(e)}")
         return False
 
+def export_inference_artifacts(model, weights_dtype='float32', tflite_quantization=None):
+    """
+    Exporta el modelo entrenado a formatos de inferencia ligeros.
+
+    Args:
+        model: Modelo Keras entrenado
+        weights_dtype (str): 'float32' o 'float16' para models/rnn_weights.npz
+        tflite_quantization (str): None (no exportar TFLite), 'none', 'float16'
+            o 'dynamic' (pesos int8)
+
+    Returns:
+        list: Rutas de los artefactos generados
+    """
+    exported = []
+    try:
+        exported.append(save_numpy_weights(model, NUMPY_WEIGHTS_PATH, dtype=weights_dtype))
+    except Exception as e:
+        logging.error(f"Error exportando pesos NumPy: {str(e)}")
+
+    if tflite_quantization:
+        try:
+            # Batch fijo de 1 para que las capas LSTM se conviertan a operaciones nativas de TFLite
+            run_model = tf.function(lambda x: model(x, training=False))
+            concrete = run_model.get_concrete_function(
+                tf.TensorSpec([1, *model.input_shape[1:]], tf.float32))
+            converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete], model)
+            if tflite_quantization in ('float16', 'dynamic'):
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            if tflite_quantization == 'float16':
+                converter.target_spec.supported_types = [tf.float16]
+            tflite_model = converter.convert()
+            with open(TFLITE_MODEL_PATH, 'wb') as f:
+                f.write(tflite_model)
+            logging.info(f"Modelo TFLite ({tflite_quantization}) exportado a {TFLITE_MODEL_PATH}")
+            exported.append(TFLITE_MODEL_PATH)
+        except Exception as e:
+            logging.error(f"Error exportando modelo TFLite: {str(e)}")
+
+    return exported
+
 def generate_training_report(history):
     """
     Genera un reporte detallado del entrenamiento.
@@ -109,4 +155,10 @@ def generate_training_report(history):
         logging.error(f"Error generando reporte de entrenamiento: {str(e)}")
 
 if __name__ == "__main__":
-    retrain_and_analyze()
\ No newline at end of file
+    import sys
+    if '--export-only' in sys.argv:
+        # Exportar el modelo ya entrenado sin reentrenar
+        export_inference_artifacts(tf.keras.models.load_model('models/rnn_model.h5'),
+                                   tflite_quantization='dynamic' if '--tflite' in sys.argv else None)
+    else:
+        retrain_and_analyze()
\ No newline at end of file
@@ -5,9 +5,6 @@ import pytz
 import schedule
 import time
 from datetime import datetime, timedelta
-from database import db
-from models import Incident
-from ml_models import VALID_INCIDENT_TYPES, train_rnn_model, predict_station_risk, predict_incident_type
 
 """
 Programador de Reentrenamiento del Modelo de Predicción
@@ -18,12 +15,14 @@ Este módulo gestiona:
 2. Generación y caché de predicciones semanales
 3. Monitoreo de salud del modelo
 4. Almacenamiento de predicciones en caché
+5. Tabla precalculada de riesgo del fallback
 
 Frecuencia de operaciones:
 - Reentrenamiento: Domingos a las 11:00 PM
 - Verificación de salud: Cada 12 horas
 - Generación de predicciones: Después de cada reentrenamiento
 - Actualización periódica de predicciones: Cada hora
+- Reconstrucción de la tabla de fallback: Al iniciar y cada 6 horas
 """
 
 logging.basicConfig(level=logging.INFO)
@@ -33,10 +32,10 @@ def generate_weekly_predictions():
     Genera predicciones para la próxima semana para todas las estaciones.
     """
     try:
-        from ml_models import generate_prediction_cache
+        from prediction_service import regenerate_predictions
 
         # Generar predicciones para las próximas 168 horas (1 semana)
-        predictions = generate_prediction_cache(hours_ahead=168)
+        predictions = regenerate_predictions(hours_ahead=168)
 
         if predictions:
             logging.info(f"Generated {len(predictions)} predictions for the next week")
@@ -58,12 +57,15 @@ def check_model_health():
     3. Inicia reentrenamiento si el rendimiento es bajo
     """
     try:
-        from ml_models import get_model_insights
+        from prediction_service import get_model_insights
         insights = get_model_insights()
 
         if isinstance(insights, dict):
-            accuracy = insights.get('accuracy', 0)
-            if accuracy < 0.5:  # Si el rendimiento es muy bajo
+            accuracy = insights.get('accuracy')
+            if accuracy is None:
+                # Sin métricas de validación no hay base para reentrenar
+                logging.info("Sin métricas de validación del modelo; se omite la verificación de accuracy")
+            elif accuracy < 0.5:  # Si el rendimiento es muy bajo
                 logging.warning(f"Bajo rendimiento del modelo (Accuracy: {accuracy}). Iniciando reentrenamiento.")
                 retrain_model_job()
         return True
@@ -77,19 +79,27 @@ def retrain_model_job():
     Ejecuta el reentrenamiento programado del modelo.
 
     Proceso:
-    1. Entrena un nuevo modelo RNN con datos actualizados
+    1. Entrena el modelo GBM y un nuevo modelo RNN con datos actualizados
     2. Verifica la calidad del nuevo modelo
     3. Genera nuevas predicciones semanales
     4. Actualiza el caché de predicciones
     """
     from app import app
+    from ml_models import train_rnn_model
+    from tabular_models import train_gbm_model
 
     logging.info("Starting scheduled model retraining...")
     try:
         with app.app_context():
+            # El modelo GBM entrena en segundos y alimenta el caché de predicciones
+            if train_gbm_model() is None:
+                logging.error("GBM model training failed")
+
             model, history = train_rnn_model()
             if model is not None and history is not None:
                 logging.info("Model retraining completed successfully")
+                from retrain_model import export_inference_artifacts
+                export_inference_artifacts(model)
                 if generate_weekly_predictions():
                     logging.info("Weekly predictions generated successfully")
                 else:
@@ -101,13 +111,35 @@ def retrain_model_job():
         logging.exception("Detailed error traceback:")
 
 
+def rebuild_fallback_table_job():
+    """
+    Reconstruye la tabla de riesgo del fallback desde los agregados de incidentes.
+    """
+    from app import app
+    from fallback_tables import rebuild_fallback_table
+    with app.app_context():
+        if rebuild_fallback_table() is None:
+            logging.error("Error reconstruyendo la tabla de fallback")
+
+
+def rebuild_heatmaps_job():
+    """
+    Actualiza los mapas de calor de incidentes y riesgo (solo los cortes que cambiaron).
+    """
+    from app import app
+    from heatmaps import rebuild_heatmaps
+    with app.app_context():
+        if rebuild_heatmaps() is None:
+            logging.error("Error reconstruyendo los mapas de calor")
+
+
 def update_predictions_job():
     """
     Trabajo programado para actualizar predicciones.
     """
     from app import app
     with app.app_context():
-        from ml_models import update_predictions_periodically
+        from prediction_service import update_predictions_periodically
         if update_predictions_periodically():
             logging.info("Actualización periódica de predicciones completada")
         else:
@@ -123,9 +155,21 @@ def run_scheduler():
     # Programar verificación de salud
     schedule.every(12).hours.do(check_model_health)
 
+    # Programar reconstrucción de la tabla de fallback
+    from fallback_tables import FALLBACK_TABLE_CONFIG
+    schedule.every(FALLBACK_TABLE_CONFIG['rebuild_hours']).hours.do(rebuild_fallback_table_job)
+
+    # Programar actualización de los mapas de calor
+    from heatmaps import HEATMAP_CONFIG
+    schedule.every(HEATMAP_CONFIG['rebuild_minutes']).minutes.do(rebuild_heatmaps_job)
+
     # Programar actualización de predicciones cada hora
     schedule.every(1).hours.do(update_predictions_job)
 
+    # Construir la tabla de fallback y los mapas de calor al iniciar
+    rebuild_fallback_table_job()
+    rebuild_heatmaps_job()
+
     # Ejecutar entrenamiento inicial si es necesario
     if not os.path.exists('models/rnn_model.h5'):
         logging.info("No model found. Running initial training...")
@@ -137,4 +181,5 @@ def run_scheduler():
         time.sleep(60)
 
 if __name__ == "__main__":
+    os.environ.setdefault('DB_ROLE', 'scheduler')
     run_scheduler()
\ No newline at end of file
@@ -0,0 +1,312 @@
+"""
+Motor de riesgo bayesiano empírico por estación
+----------------------------------------------
+
+Estima la tasa de incidentes por (estación, día de la semana, hora, tipo) a
+partir de los agregados de rollups.py, con contracción (shrinkage) jerárquica:
+
+    ciudad  ->  troncal  ->  estación
+
+En cada nivel el riesgo relativo frente al nivel superior sigue un prior
+Gamma(1/v, 1/v) (media 1, varianza v) con conteos Poisson, de modo que
+
+    tasa = tasa_prior * (conteo + 1/v) / (esperado + 1/v)
+
+Las varianzas v de troncal y estación se estiman por momentos sobre toda la
+historia (bayes empírico). Las estaciones con poca historia quedan cerca de su
+troncal y las troncales con poca historia cerca de la ciudad.
+
+El motor se actualiza incrementalmente con cada incidente reportado (los
+conteos se incrementan y las tasas se recalculan de forma perezosa) y produce
+el pronóstico semanal de todas las estaciones con un solo indexado vectorizado.
+Se construye desde los agregados que publica el programador de tareas
+(rollups.load_rollup_snapshot) y, en los workers web, se reconstruye en segundo
+plano mientras se sigue sirviendo el motor anterior.
+Es el nivel estadístico, siempre disponible, por debajo de los modelos GBM/RNN.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from bogota_clock import bogota_now
+from offload import BackgroundRefresh
+from stations import load_stations, station_index
+
+BAYES_CONFIG = {
+    'city_pseudo_count': 0.5,    # Evita tasas nulas en franjas sin incidentes en la ciudad
+    'min_variance': 1e-3,        # Varianza mínima del riesgo relativo (contracción máxima)
+    'refresh_seconds': 6 * 3600, # Reconstrucción completa si no se publican agregados nuevos
+    'retry_seconds': 300         # Espera tras una reconstrucción fallida
+}
+
+
+def estimate_relative_variance(counts, expected):
+    """
+    Varianza del riesgo relativo entre unidades por el método de momentos
+    (Gamma-Poisson): Var(C) = mu + mu^2 * v.
+
+    Args:
+        counts (numpy.ndarray): Conteos observados
+        expected (numpy.ndarray): Conteos esperados según el nivel superior
+
+    Returns:
+        float: Varianza estimada v (mínimo BAYES_CONFIG['min_variance'])
+    """
+    expected = expected.astype(np.float64)
+    denominator = float((expected ** 2).sum())
+    if denominator <= 0:
+        return BAYES_CONFIG['min_variance']
+    numerator = float((((counts - expected) ** 2) - expected).sum())
+    return max(numerator / denominator, BAYES_CONFIG['min_variance'])
+
+
+def shrink(counts, expected, prior_rate, variance):
+    """Media posterior de la tasa con prior Gamma de media prior_rate y varianza relativa v."""
+    strength = 1.0 / variance
+    return prior_rate * (counts + strength) / (expected + strength)
+
+
+class BayesRiskEngine:
+    """
+    Tasas suavizadas por (estación, día, hora, tipo) con actualización incremental.
+
+    Args:
+        counts (numpy.ndarray): Conteos (n_estaciones, 7, 24, n_tipos)
+        start (datetime): Primer incidente de la historia
+        end (datetime): Último incidente de la historia
+        types (list): Tipos de incidente del último eje
+    """
+
+    def __init__(self, counts, start, end, types):
+        self.counts = counts.astype(np.float32)
+        self.start = start
+        self.end = end
+        self.types = list(types)
+        self.built_at = time.time()
+
+        troncales = [station['troncal'] for station in load_stations()]
+        self.troncal_names, self.troncal_idx = np.unique(troncales, return_inverse=True)
+        # Matriz (n_troncales, n_estaciones) para agregar estaciones por troncal
+        self.membership = np.zeros((len(self.troncal_names), len(troncales)), dtype=np.float32)
+        self.membership[self.troncal_idx, np.arange(len(troncales))] = 1.0
+
+        self._lock = threading.Lock()
+        self._dirty = True
+        self.troncal_variance = None
+        self.station_variance = None
+        self.fit()
+
+    @property
+    def weeks(self):
+        if self.start is None or self.end is None:
+            return 1.0
+        return max(1.0, (self.end - self.start) / timedelta(weeks=1))
+
+    def _level_rates(self):
+        """Calcula (tasa_ciudad, conteos_troncal, esperado_troncal)."""
+        n_stations = self.counts.shape[0]
+        weeks = self.weeks
+        cell_shape = self.counts.shape[1:]
+
+        city_counts = self.counts.sum(axis=0)
+        city_rate = (city_counts + BAYES_CONFIG['city_pseudo_count']) / (n_stations * weeks)
+
+        troncal_counts = (self.membership @ self.counts.reshape(n_stations, -1)).reshape(
+            (len(self.troncal_names),) + cell_shape)
+        troncal_exposure = self.membership.sum(axis=1) * weeks
+        troncal_expected = troncal_exposure[:, None, None, None] * city_rate[None]
+        return city_rate, troncal_counts, troncal_expected
+
+    def fit(self):
+        """Estima las varianzas de cada nivel y recalcula todas las tasas."""
+        city_rate, troncal_counts, troncal_expected = self._level_rates()
+        self.troncal_variance = estimate_relative_variance(troncal_counts, troncal_expected)
+        troncal_rate = shrink(troncal_counts, troncal_expected, city_rate[None], self.troncal_variance)
+        station_prior = troncal_rate[self.troncal_idx]
+        self.station_variance = estimate_relative_variance(self.counts, station_prior * self.weeks)
+        self._compute_rates()
+        logging.info(f"Motor bayesiano ajustado: v_troncal={self.troncal_variance:.4f}, "
+                     f"v_estacion={self.station_variance:.4f}, semanas={self.weeks:.1f}")
+
+    def _compute_rates(self):
+        city_rate, troncal_counts, troncal_expected = self._level_rates()
+        troncal_rate = shrink(troncal_counts, troncal_expected, city_rate[None], self.troncal_variance)
+        station_prior = troncal_rate[self.troncal_idx]
+        rates = shrink(self.counts, station_prior * self.weeks, station_prior, self.station_variance)
+
+        self.rates = rates.astype(np.float32)
+        # P(al menos un incidente en la hora) con llegadas Poisson
+        self.risk = (1.0 - np.exp(-self.rates.sum(axis=3))).astype(np.float32)
+        self.top_type = np.argmax(self.rates, axis=3).astype(np.int8)
+        self.city_risk = (1.0 - np.exp(-city_rate.sum(axis=2))).astype(np.float32)
+        self.city_top_type = np.argmax(city_rate, axis=2).astype(np.int8)
+        self._dirty = False
+
+    def _ensure_rates(self):
+        if self._dirty:
+            with self._lock:
+                if self._dirty:
+                    self._compute_rates()
+
+    def observe(self, station, timestamp, incident_type):
+        """
+        Incorpora un incidente nuevo. Las varianzas se mantienen hasta la próxima
+        reconstrucción; las tasas se recalculan en la siguiente consulta.
+
+        Returns:
+            bool: False si la estación o el tipo no se reconocen
+        """
+        idx = station_index().get(station)
+        if idx is None or incident_type not in self.types:
+            return False
+        with self._lock:
+            self.counts[idx, timestamp.weekday(), timestamp.hour, self.types.index(incident_type)] += 1
+            # Los reportes con fecha anterior a la historia no amplían la exposición
+            if self.start is None:
+                self.start = timestamp
+            if self.end is None or timestamp > self.end:
+                self.end = timestamp
+            self._dirty = True
+        return True
+
+    def observe_frame(self, incidents):
+        """
+        Incorpora un lote de incidentes (DataFrame con timestamp, nearest_station,
+        incident_type) con una sola agregación vectorizada.
+        """
+        from rollups import rollup_frame
+
+        if incidents.empty:
+            return
+        batch_counts = rollup_frame(incidents)
+        latest = incidents['timestamp'].max().to_pydatetime()
+        with self._lock:
+            self.counts += batch_counts
+            if self.start is None:
+                self.start = incidents['timestamp'].min().to_pydatetime()
+            if self.end is None or latest > self.end:
+                self.end = latest
+            self._dirty = True
+
+    def hourly_rates(self):
+        """Tasa esperada de incidentes por hora de cada estación (n_estaciones, 7, 24)."""
+        self._ensure_rates()
+        return self.rates.sum(axis=3)
+
+    def station_risk(self, station, day_of_week, hour):
+        """
+        Returns:
+            tuple: (risk_score, incident_type). Estaciones desconocidas usan la tasa de la ciudad.
+        """
+        self._ensure_rates()
+        idx = station_index().get(station)
+        if idx is None:
+            return (float(self.city_risk[day_of_week, hour]),
+                    self.types[self.city_top_type[day_of_week, hour]])
+        return (float(self.risk[idx, day_of_week, hour]),
+                self.types[self.top_type[idx, day_of_week, hour]])
+
+    def forecast(self, hours_ahead=168, now=None):
+        """
+        Pronóstico de todas las estaciones para las próximas horas en una sola pasada.
+
+        Args:
+            hours_ahead (int): Horas a pronosticar
+            now (datetime): Origen del pronóstico (hora local de Bogotá, sin zona)
+
+        Returns:
+            tuple: (lista de datetimes objetivo, riesgo (n_estaciones, hours_ahead),
+                índices de tipo (n_estaciones, hours_ahead))
+        """
+        self._ensure_rates()
+        if now is None:
+            now = bogota_now()
+        origin = now.replace(minute=0, second=0, microsecond=0)
+        times = [origin + timedelta(hours=h) for h in range(hours_ahead)]
+        day_of_week = np.array([t.weekday() for t in times])
+        hours = np.array([t.hour for t in times])
+        return times, self.risk[:, day_of_week, hours], self.top_type[:, day_of_week, hours]
+
+
+def build_risk_engine():
+    """
+    Construye el motor desde los agregados publicados por el programador de
+    tareas (rollups.load_rollup_snapshot), sin recorrer la tabla de incidentes.
+    Si no hay agregados o tienen más de BAYES_CONFIG['refresh_seconds'] (el
+    programador no está corriendo), los recalcula y los publica.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+    """
+    from rollups import load_rollup_snapshot, refresh_rollup_snapshot
+
+    snapshot = load_rollup_snapshot()
+    if snapshot is None or time.time() - snapshot.built_at >= BAYES_CONFIG['refresh_seconds']:
+        snapshot = refresh_rollup_snapshot()
+    engine = BayesRiskEngine(snapshot.counts, snapshot.start, snapshot.end, snapshot.types)
+    engine.snapshot_version = snapshot.version
+    return engine
+
+
+_engine = None
+
+
+def _engine_stale():
+    from rollups import rollup_snapshot_version
+
+    engine = _engine
+    return (engine is None
+            or time.time() - engine.built_at >= BAYES_CONFIG['refresh_seconds']
+            or engine.snapshot_version != rollup_snapshot_version())
+
+
+def _rebuild_engine():
+    global _engine
+    _engine = build_risk_engine()
+
+
+_engine_refresh = BackgroundRefresh('motor bayesiano', _rebuild_engine, _engine_stale,
+                                    BAYES_CONFIG['retry_seconds'])
+
+
+def get_risk_engine(wait=True):
+    """
+    Motor compartido por el proceso; se reconstruye cuando se publican
+    agregados nuevos o cada BAYES_CONFIG['refresh_seconds'].
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Args:
+        wait (bool): Reconstruir en línea (scripts, programador de tareas). Con
+            False (solicitudes web) la reconstrucción corre en segundo plano y
+            se sirve el motor anterior, o None si aún no hay uno
+
+    Returns:
+        BayesRiskEngine o None si no se puede construir
+    """
+    if _engine_stale():
+        if wait:
+            _engine_refresh.run()
+        else:
+            _engine_refresh.trigger()
+    return _engine
+
+
+def record_incident_batch(incidents):
+    """Actualiza el motor del proceso (si ya está cargado) con un lote de incidentes importados."""
+    if _engine is None:
+        return
+    try:
+        _engine.observe_frame(incidents)
+    except Exception as e:
+        logging.error(f"Error actualizando el motor bayesiano con el lote: {str(e)}")
+
+
+def record_incident(incident):
+    """Actualiza el motor del proceso (si ya está cargado) con un incidente recién guardado."""
+    if _engine is None:
+        return
+    try:
+        _engine.observe(incident.nearest_station, incident.timestamp, incident.incident_type)
+    except Exception as e:
+        logging.error(f"Error actualizando el motor bayesiano: {str(e)}")
@@ -0,0 +1,203 @@
+"""
+Inferencia ligera del modelo RNN sin TensorFlow
+----------------------------------------------
+
+El servidor web no necesita el optimizador ni el grafo de Keras para ejecutar
+un LSTM de dos capas. retrain_model.py exporta los pesos a:
+- models/rnn_weights.npz: pesos por capa (float32 o float16) y la arquitectura
+- models/rnn_model.tflite: opcional, ejecutado con `tflite_runtime` si está instalado
+
+NumpyRNN reproduce el forward pass de Keras (LSTM con activación tanh y
+activación recurrente sigmoid, Dropout inactivo en inferencia, capas Dense)
+usando solo NumPy.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+
+NUMPY_WEIGHTS_PATH = 'models/rnn_weights.npz'
+TFLITE_MODEL_PATH = 'models/rnn_model.tflite'
+
+_ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+    'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0.0, 1.0)
+}
+
+
+def save_numpy_weights(model, path=NUMPY_WEIGHTS_PATH, dtype='float32'):
+    """
+    Exporta un modelo Keras Sequential (LSTM/Dense/Dropout) a un archivo .npz.
+
+    Args:
+        model: Modelo Keras entrenado
+        path (str): Ruta de destino
+        dtype (str): 'float32' o 'float16' (mitad de tamaño; se expande al cargar)
+
+    Returns:
+        str: Ruta del archivo generado
+    """
+    architecture = []
+    arrays = {}
+    for layer in model.layers:
+        layer_type = type(layer).__name__
+        if layer_type == 'Dropout':
+            continue
+        if layer_type not in ('LSTM', 'Dense'):
+            raise ValueError(f"Capa no soportada para exportación NumPy: {layer_type}")
+
+        config = layer.get_config()
+        spec = {'type': layer_type.lower(), 'activation': config['activation']}
+        if layer_type == 'LSTM':
+            spec['recurrent_activation'] = config['recurrent_activation']
+            spec['return_sequences'] = config['return_sequences']
+            spec['units'] = config['units']
+
+        index = len(architecture)
+        for j, weights in enumerate(layer.get_weights()):
+            arrays[f'layer{index}_{j}'] = weights.astype(dtype)
+        architecture.append(spec)
+
+    input_shape = model.input_shape
+    metadata = {
+        'architecture': architecture,
+        'input_shape': [input_shape[1], input_shape[2]],
+        'dtype': dtype
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez(path, metadata=np.array(json.dumps(metadata)), **arrays)
+    logging.info(f"Pesos NumPy ({dtype}) exportados a {path}")
+    return path
+
+
+class NumpyRNN:
+    """Forward pass de un Sequential LSTM/Dense exportado con save_numpy_weights."""
+
+    model_format = 'numpy'
+
+    def __init__(self, path=NUMPY_WEIGHTS_PATH):
+        with np.load(path) as data:
+            metadata = json.loads(str(data['metadata']))
+            self.layers = []
+            for index, spec in enumerate(metadata['architecture']):
+                n_weights = 3 if spec['type'] == 'lstm' else 2
+                weights = [data[f'layer{index}_{j}'].astype(np.float32) for j in range(n_weights)]
+                self.layers.append((spec, weights))
+        self.input_shape = tuple(metadata['input_shape'])
+        self.dtype = metadata['dtype']
+
+    @staticmethod
+    def _lstm(x, spec, weights):
+        kernel, recurrent_kernel, bias = weights
+        units = spec['units']
+        activation = _ACTIVATIONS[spec['activation']]
+        recurrent_activation = _ACTIVATIONS[spec['recurrent_activation']]
+
+        batch, steps, _ = x.shape
+        # Proyección de la entrada para todos los pasos en una sola multiplicación
+        x_proj = x @ kernel + bias
+        h = np.zeros((batch, units), dtype=np.float32)
+        c = np.zeros((batch, units), dtype=np.float32)
+        outputs = np.empty((batch, steps, units), dtype=np.float32) if spec['return_sequences'] else None
+
+        for t in range(steps):
+            z = x_proj[:, t, :] + h @ recurrent_kernel
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            candidate = activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            c = f * c + i * candidate
+            h = o * activation(c)
+            if outputs is not None:
+                outputs[:, t, :] = h
+        return outputs if outputs is not None else h
+
+    def predict(self, x):
+        """
+        Args:
+            x (numpy.ndarray): Entrada (batch, sequence_length, n_features)
+
+        Returns:
+            numpy.ndarray: Salida (batch, 1), igual que model.predict de Keras
+        """
+        output = np.asarray(x, dtype=np.float32)
+        for spec, weights in self.layers:
+            if spec['type'] == 'lstm':
+                output = self._lstm(output, spec, weights)
+            else:
+                output = _ACTIVATIONS[spec['activation']](output @ weights[0] + weights[1])
+        return output
+
+
+class TFLiteRNN:
+    """Ejecuta models/rnn_model.tflite con tflite_runtime (sin importar TensorFlow)."""
+
+    model_format = 'tflite'
+
+    def __init__(self, path=TFLITE_MODEL_PATH):
+        from tflite_runtime.interpreter import Interpreter
+
+        self.interpreter = Interpreter(model_path=path)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self.input_shape = tuple(self.input_detail['shape'][1:])
+
+    def predict(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        outputs = []
+        # El modelo convertido tiene batch fijo de 1
+        for sample in x:
+            self.interpreter.set_tensor(self.input_detail['index'], sample[None, ...])
+            self.interpreter.invoke()
+            outputs.append(self.interpreter.get_tensor(self.output_detail['index'])[0])
+        return np.array(outputs)
+
+
+_model_cache = {}
+
+
+def load_inference_model():
+    """
+    Carga el artefacto de inferencia disponible (una vez por proceso y por
+    versión del archivo). Prefiere los pesos NumPy; usa TFLite solo si
+    `tflite_runtime` está instalado.
+
+    Returns:
+        NumpyRNN, TFLiteRNN o None si no hay artefacto exportado
+    """
+    from instrumentation import record_cache
+
+    candidates = [(NUMPY_WEIGHTS_PATH, NumpyRNN), (TFLITE_MODEL_PATH, TFLiteRNN)]
+    for path, loader in candidates:
+        if not os.path.exists(path):
+            continue
+        mtime = os.path.getmtime(path)
+        cached = _model_cache.get(path)
+        if cached and cached[0] == mtime:
+            record_cache('inference_model', True)
+            return cached[1]
+        record_cache('inference_model', False)
+        try:
+            model = loader(path)
+        except ImportError:
+            continue
+        except Exception as e:
+            logging.error(f"Error cargando artefacto de inferencia {path}: {str(e)}")
+            continue
+        _model_cache[path] = (mtime, model)
+        logging.info(f"Artefacto de inferencia cargado: {path}")
+        return model
+    return None
+
+
+def inference_artifact_path():
+    """Ruta del artefacto de inferencia exportado, o None si no existe."""
+    for path in (NUMPY_WEIGHTS_PATH, TFLITE_MODEL_PATH):
+        if os.path.exists(path):
+            return path
+    return None
@@ -0,0 +1,215 @@
+"""
+Agregados (rollups) de incidentes por estación, día de la semana, hora y tipo
+---------------------------------------------------------------------------
+
+Los motores estadísticos (tabla de fallback, riesgo bayesiano, mapas de calor)
+no necesitan recorrer la tabla de incidentes fila por fila: trabajan sobre un
+arreglo de conteos de forma (n_estaciones, 7, 24, n_tipos), indexado por
+stations.station_index() y por el orden de VALID_INCIDENT_TYPES.
+
+El programador de tareas publica los agregados de toda la historia en
+models/incident_rollups.npz (refresh_rollup_snapshot, junto con la tabla de
+fallback); los workers web los cargan con NumPy (load_rollup_snapshot) en
+lugar de recorrer la tabla de incidentes.
+
+pandas se importa solo al construir los agregados.
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from instrumentation import record_cache
+from stations import station_index, station_names
+
+ROLLUP_SNAPSHOT_CONFIG = {
+    'path': 'models/incident_rollups.npz'
+}
+
+
+def incident_types():
+    """Tipos de incidente en el orden del último eje de los agregados."""
+    from prediction_service import VALID_INCIDENT_TYPES
+    return list(VALID_INCIDENT_TYPES)
+
+
+def empty_rollup():
+    return np.zeros((len(station_index()), 7, 24, len(incident_types())), dtype=np.int32)
+
+
+def rollup_frame(incidents):
+    """
+    Agrega un DataFrame de incidentes (timestamp, nearest_station, incident_type).
+
+    Los incidentes de estaciones o tipos desconocidos se descartan.
+
+    Returns:
+        numpy.ndarray: Conteos int32 (n_estaciones, 7, 24, n_tipos)
+    """
+    counts = empty_rollup()
+    if incidents.empty:
+        return counts
+
+    types = incident_types()
+    station_idx = incidents['nearest_station'].map(station_index())
+    type_idx = incidents['incident_type'].map({name: i for i, name in enumerate(types)})
+    valid = station_idx.notna() & type_idx.notna()
+    if not valid.any():
+        return counts
+
+    timestamps = incidents.loc[valid, 'timestamp']
+    grouped = (incidents.loc[valid]
+               .assign(station_idx=station_idx[valid].astype(np.int64),
+                       day_of_week=timestamps.dt.dayofweek,
+                       hour=timestamps.dt.hour,
+                       type_idx=type_idx[valid].astype(np.int64))
+               .groupby(['station_idx', 'day_of_week', 'hour', 'type_idx'])
+               .size())
+    index = np.array(grouped.index.tolist(), dtype=np.int64).T
+    counts[tuple(index)] = grouped.values
+    return counts
+
+
+def observed_weeks(incidents):
+    """Semanas cubiertas por la historia (mínimo 1), para convertir conteos en tasas."""
+    if incidents.empty:
+        return 1.0
+    span = incidents['timestamp'].max() - incidents['timestamp'].min()
+    return max(1.0, span.total_seconds() / (7 * 24 * 3600))
+
+
+def compute_rollups(since=None):
+    """
+    Construye los agregados a partir de la tabla de incidentes.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Args:
+        since (datetime): Considerar solo incidentes desde esta fecha
+
+    Returns:
+        tuple: (conteos (n_estaciones, 7, 24, n_tipos), semanas observadas)
+    """
+    from tabular_models import load_incident_frame
+
+    incidents = load_incident_frame(since=since)
+    counts = rollup_frame(incidents)
+    weeks = observed_weeks(incidents)
+    logging.info(f"Rollups calculados: {int(counts.sum())} incidentes en {weeks:.1f} semanas")
+    return counts, weeks
+
+
+class RollupSnapshot:
+    """
+    Agregados publicados de toda la historia.
+
+    Attributes:
+        counts (numpy.ndarray): Conteos int32 (n_estaciones, 7, 24, n_tipos), de solo lectura
+        start, end (datetime): Primer y último incidente (None sin historia)
+        types (list): Tipos de incidente del último eje
+        built_at (float): Segundos Unix de la construcción
+        version: mtime del archivo; cambia con cada publicación
+    """
+
+    def __init__(self, arrays, version=None):
+        self.counts = arrays['counts']
+        self.counts.flags.writeable = False
+        self.types = [str(t) for t in arrays['types']]
+        self.station_names = [str(name) for name in arrays['stations']]
+        metadata = json.loads(str(arrays['metadata']))
+        self.start = datetime.fromisoformat(metadata['start']) if metadata.get('start') else None
+        self.end = datetime.fromisoformat(metadata['end']) if metadata.get('end') else None
+        self.built_at = float(metadata['built_at'])
+        self.version = version
+
+    @property
+    def weeks(self):
+        """Semanas cubiertas por la historia (mínimo 1), como observed_weeks."""
+        if self.start is None or self.end is None:
+            return 1.0
+        return max(1.0, (self.end - self.start) / timedelta(weeks=1))
+
+
+def save_rollup_snapshot(counts, start, end, path=None):
+    """Publica los agregados de forma atómica (archivo temporal + rename)."""
+    path = path or ROLLUP_SNAPSHOT_CONFIG['path']
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    metadata = {
+        'start': start.isoformat() if start is not None else None,
+        'end': end.isoformat() if end is not None else None,
+        'built_at': time.time()
+    }
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, counts=counts.astype(np.int32), types=np.array(incident_types()),
+                 stations=np.array(station_names()), metadata=np.array(json.dumps(metadata)))
+    os.replace(tmp_path, path)
+    return path
+
+
+def rollup_snapshot_version(path=None):
+    """Versión (mtime) de los agregados publicados, o None si no hay; solo hace un stat."""
+    path = path or ROLLUP_SNAPSHOT_CONFIG['path']
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+_snapshot_cache = {}
+
+
+def load_rollup_snapshot(path=None):
+    """
+    Carga los agregados publicados (una vez por proceso y por versión del archivo).
+
+    Returns:
+        RollupSnapshot, o None si no hay agregados o no coinciden con las
+        estaciones y tipos actuales
+    """
+    path = path or ROLLUP_SNAPSHOT_CONFIG['path']
+    version = rollup_snapshot_version(path)
+    cached = _snapshot_cache.get(path)
+    if cached and cached[0] == version:
+        record_cache('rollup_snapshot', True)
+        return cached[1]
+
+    record_cache('rollup_snapshot', False)
+    snapshot = None
+    if version is not None:
+        try:
+            with np.load(path) as data:
+                snapshot = RollupSnapshot({key: data[key] for key in data.files}, version)
+            if snapshot.station_names != station_names() or snapshot.types != incident_types():
+                logging.warning("Los agregados publicados no coinciden con las estaciones o tipos actuales")
+                snapshot = None
+        except Exception as e:
+            logging.error(f"Error cargando agregados {path}: {str(e)}")
+            snapshot = None
+
+    _snapshot_cache[path] = (version, snapshot)
+    return snapshot
+
+
+def refresh_rollup_snapshot():
+    """
+    Recalcula los agregados de toda la historia y los publica.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Returns:
+        RollupSnapshot publicado
+    """
+    from tabular_models import load_incident_frame
+
+    incidents = load_incident_frame()
+    start = end = None
+    if not incidents.empty:
+        start = incidents['timestamp'].min().to_pydatetime()
+        end = incidents['timestamp'].max().to_pydatetime()
+    counts = rollup_frame(incidents)
+    path = save_rollup_snapshot(counts, start, end)
+    snapshot = load_rollup_snapshot(path)
+    logging.info(f"Agregados publicados en {path}: {int(counts.sum())} incidentes en {snapshot.weeks:.1f} semanas")
+    return snapshot
@@ -0,0 +1,309 @@
+"""
+Grafo de estaciones troncales y rutas de menor riesgo
+----------------------------------------------------
+
+El grafo se construye una vez por proceso a partir de las geometrías de
+static/Rutas_Troncales_de_TRANSMILENIO.geojson: cada estación se proyecta
+sobre cada trazado y las que quedan a menos de snap_meters de la línea se
+ordenan por su distancia a lo largo de ella; estaciones consecutivas en un
+trazado quedan conectadas por una arista con esa longitud.
+
+Con el riesgo de cada estación a una fecha y hora (predicciones publicadas en
+prediction_store dentro de su horizonte; fuera de él, o para las estaciones
+sin predicción, el motor bayesiano por día de la semana y hora y, sin motor, la
+tabla de fallback) cada arista pesa
+
+    (costo(u) + costo(v)) / 2 + distance_weight_per_km * km,  costo = -ln(1 - riesgo)
+
+de modo que el camino mínimo maximiza, aproximadamente, la probabilidad de
+no encontrar incidentes en las estaciones recorridas. Los árboles de caminos
+mínimos desde todas las estaciones (Dijkstra de scipy) se calculan la primera
+vez que se pide una (fecha, hora) y se reutilizan hasta que cambia la
+generación de predicciones publicada: cada consulta solo reconstruye el camino.
+Las horas son de Bogotá, como las de las predicciones.
+"""
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+from bogota_clock import BOGOTA_TZ, bogota_now
+from instrumentation import record_cache
+from stations import load_stations
+
+ROUTES_GEOJSON = 'static/Rutas_Troncales_de_TRANSMILENIO.geojson'
+
+ROUTE_GRAPH_CONFIG = {
+    'snap_meters': 60,                # Distancia máxima de una estación a un trazado
+    'distance_weight_per_km': 0.05,   # Desempate por longitud entre caminos de riesgo similar
+    'max_risk': 0.999,                # Evita costos infinitos
+    'cached_trees': 48                # (fecha, hora) con árboles en memoria
+}
+
+# Metros por grado en la latitud de Bogotá (proyección equirectangular local)
+_METERS_PER_DEGREE_LAT = 110540.0
+_METERS_PER_DEGREE_LON = 111320.0 * math.cos(math.radians(4.65))
+
+
+def _route_parts(geometry):
+    if geometry['type'] == 'LineString':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiLineString':
+        return geometry['coordinates']
+    return []
+
+
+def _stations_along(points, line):
+    """
+    Estaciones a menos de snap_meters del trazado, ordenadas a lo largo de él.
+
+    Returns:
+        tuple: (índices de estación, distancia en metros desde el inicio del trazado)
+    """
+    a, b = line[:-1], line[1:]
+    segment = b - a
+    length = np.hypot(segment[:, 0], segment[:, 1])
+    chainage = np.concatenate([[0.0], np.cumsum(length)])
+
+    offset = points[:, None, :] - a[None]
+    t = np.clip((offset * segment).sum(axis=-1) / np.maximum(length ** 2, 1e-9), 0.0, 1.0)
+    nearest = a[None] + t[..., None] * segment[None]
+    distance = np.hypot(*(points[:, None, :] - nearest).transpose(2, 0, 1))
+
+    best = distance.argmin(axis=1)
+    rows = np.arange(len(points))
+    on_line = np.flatnonzero(distance[rows, best] <= ROUTE_GRAPH_CONFIG['snap_meters'])
+    position = chainage[best[on_line]] + t[on_line, best[on_line]] * length[best[on_line]]
+    order = np.argsort(position)
+    return on_line[order], position[order]
+
+
+class RouteGraph:
+    """Adyacencia entre estaciones (en el orden de load_stations()) con longitudes en metros."""
+
+    def __init__(self, stations, features):
+        self.stations = [station['nombre'] for station in stations]
+        self.troncales = [station['troncal'] for station in stations]
+        self.coordinates = [(station['latitude'], station['longitude']) for station in stations]
+        self.station_idx = {name: i for i, name in enumerate(self.stations)}
+        points = np.array([[lon * _METERS_PER_DEGREE_LON, lat * _METERS_PER_DEGREE_LAT]
+                           for lat, lon in self.coordinates], dtype=np.float64)
+
+        edges = {}
+        self.routes = {}
+        for feature in features:
+            properties = feature.get('properties') or {}
+            route_stations = []
+            for part in _route_parts(feature.get('geometry') or {}):
+                line = np.array([coordinate[:2] for coordinate in part], dtype=np.float64)
+                if len(line) < 2:
+                    continue
+                line *= (_METERS_PER_DEGREE_LON, _METERS_PER_DEGREE_LAT)
+                indices, positions = _stations_along(points, line)
+                for k in range(len(indices) - 1):
+                    u, v = sorted((int(indices[k]), int(indices[k + 1])))
+                    meters = float(positions[k + 1] - positions[k])
+                    edges[(u, v)] = min(edges.get((u, v), meters), meters)
+                route_stations.extend(self.stations[i] for i in indices)
+            name = properties.get('route_name_ruta_troncal')
+            if name:
+                self.routes[str(name)] = {
+                    'route_id': str(name),
+                    'name': properties.get('nombre_ruta_troncal') or name,
+                    'origin': properties.get('origen_ruta_troncal'),
+                    'destination': properties.get('destino_ruta_troncal'),
+                    'schedule': properties.get('horario_lunes_viernes'),
+                    'stations': list(dict.fromkeys(route_stations))
+                }
+
+        self.edge_meters = edges
+        pairs = np.array(list(edges), dtype=np.int32).reshape(-1, 2)
+        self.edge_u, self.edge_v = pairs[:, 0], pairs[:, 1]
+        self.edge_km = np.array(list(edges.values()), dtype=np.float64) / 1000.0
+
+    def __len__(self):
+        return len(self.stations)
+
+    def weights(self, risk):
+        """Matriz dispersa simétrica de pesos para el vector de riesgo por estación."""
+        from scipy.sparse import coo_matrix
+
+        cost = -np.log1p(-np.clip(risk, 0.0, ROUTE_GRAPH_CONFIG['max_risk']))
+        weight = (cost[self.edge_u] + cost[self.edge_v]) / 2 \
+            + ROUTE_GRAPH_CONFIG['distance_weight_per_km'] * self.edge_km
+        # Peso mínimo positivo: scipy descarta las aristas de peso cero
+        weight = np.maximum(weight, 1e-9)
+        n = len(self.stations)
+        rows = np.concatenate([self.edge_u, self.edge_v])
+        cols = np.concatenate([self.edge_v, self.edge_u])
+        return coo_matrix((np.concatenate([weight, weight]), (rows, cols)), shape=(n, n)).tocsr()
+
+
+@lru_cache(maxsize=1)
+def load_route_graph():
+    """Grafo de estaciones construido una vez por proceso."""
+    with open(ROUTES_GEOJSON, 'r', encoding='utf-8') as f:
+        features = json.load(f)['features']
+    graph = RouteGraph(load_stations(), features)
+    logging.info(f"Grafo troncal: {len(graph)} estaciones, {len(graph.edge_km)} aristas, {len(graph.routes)} rutas")
+    return graph
+
+
+def route_information(route_id):
+    """Origen, destino, horario y estaciones en orden de una ruta troncal, o None si no existe."""
+    return load_route_graph().routes.get(str(route_id))
+
+
+class ShortestPathTrees:
+    """Caminos mínimos desde todas las estaciones para un vector de riesgo."""
+
+    def __init__(self, graph, risk):
+        from scipy.sparse.csgraph import dijkstra
+
+        self.risk = risk
+        distances, predecessors = dijkstra(graph.weights(risk), directed=False, return_predecessors=True)
+        self.distances = distances.astype(np.float32)
+        self.predecessors = predecessors.astype(np.int16)
+
+    def path(self, source, target):
+        """Índices de estación de source a target, o None si no están conectadas."""
+        if not np.isfinite(self.distances[source, target]):
+            return None
+        path = [target]
+        while path[-1] != source:
+            path.append(int(self.predecessors[source, path[-1]]))
+        path.reverse()
+        return path
+
+
+def station_risk_vector(stations, when):
+    """
+    Riesgo de cada estación en la fecha y hora de `when`: predicción publicada
+    para esa hora (dentro del horizonte), motor bayesiano o tabla de fallback,
+    en ese orden.
+
+    Returns:
+        numpy.ndarray: Riesgo por estación en el orden de `stations`
+    """
+    from fallback_tables import load_fallback_table
+    from prediction_store import get_prediction_view
+    from risk_engine import get_risk_engine
+
+    view = get_prediction_view()
+    engine = None
+    table = None
+    risk = np.empty(len(stations), dtype=np.float64)
+    for i, station in enumerate(stations):
+        found = view.lookup_at(station, when) if view is not None else None
+        if found is None:
+            if engine is None:
+                engine = get_risk_engine(wait=False) or False
+            if engine:
+                found = engine.station_risk(station, when.weekday(), when.hour)
+            else:
+                if table is None:
+                    table = load_fallback_table()
+                found = table.lookup(station, when.weekday(), when.hour)
+        risk[i] = found[0]
+    return risk
+
+
+_trees = OrderedDict()
+_trees_generation = None
+_trees_lock = threading.Lock()
+
+
+def get_shortest_path_trees(when):
+    """
+    Árboles de caminos mínimos para la fecha y la hora de `when`. Se descartan
+    todos cuando cambia la generación de predicciones publicada.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+    """
+    global _trees_generation
+    from prediction_store import get_prediction_view
+
+    view = get_prediction_view()
+    generation = view.generation if view is not None else None
+    key = (when.date(), when.hour)
+    with _trees_lock:
+        if generation != _trees_generation:
+            _trees.clear()
+            _trees_generation = generation
+        trees = _trees.get(key)
+        if trees is not None:
+            _trees.move_to_end(key)
+            record_cache('trip_risk', True)
+            return trees
+
+    record_cache('trip_risk', False)
+    graph = load_route_graph()
+    risk = station_risk_vector(graph.stations, when)
+    trees = ShortestPathTrees(graph, risk)
+    with _trees_lock:
+        if generation == _trees_generation:
+            _trees[key] = trees
+            while len(_trees) > ROUTE_GRAPH_CONFIG['cached_trees']:
+                _trees.popitem(last=False)
+    return trees
+
+
+def parse_trip_time(value):
+    """
+    Hora del viaje en hora de Bogotá, sin zona: ISO 8601 (con zona se convierte),
+    'HH:MM' u hora (0-23) de hoy; ahora si no se indica.
+    """
+    if not value:
+        return bogota_now()
+    try:
+        when = datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    else:
+        if when.tzinfo is not None:
+            when = when.astimezone(BOGOTA_TZ)
+        return when.replace(tzinfo=None)
+    if ':' in value:
+        hour, minute = value.split(':', 1)
+        return bogota_now().replace(hour=int(hour), minute=int(minute[:2]), second=0, microsecond=0)
+    return bogota_now().replace(hour=int(value), minute=0, second=0, microsecond=0)
+
+
+def trip_risk(origin, destination, when):
+    """
+    Camino de menor riesgo entre dos estaciones.
+
+    Returns:
+        dict o None si alguna estación no existe o no hay camino
+    """
+    graph = load_route_graph()
+    source = graph.station_idx.get(origin)
+    target = graph.station_idx.get(destination)
+    if source is None or target is None:
+        return None
+    trees = get_shortest_path_trees(when)
+    path = trees.path(source, target)
+    if path is None:
+        return None
+
+    risks = trees.risk[path]
+    meters = sum(graph.edge_meters[(min(u, v), max(u, v))] for u, v in zip(path, path[1:]))
+    return {
+        'from': origin,
+        'to': destination,
+        'time': when.isoformat(),
+        # P(al menos un incidente en alguna estación del camino), suponiendo independencia
+        'trip_risk': round(1.0 - float(np.prod(1.0 - risks)), 4),
+        'distance_km': round(meters / 1000.0, 2),
+        'path': [{
+            'station': graph.stations[i],
+            'troncal': graph.troncales[i],
+            'risk_score': round(float(trees.risk[i]), 4),
+            'latitude': graph.coordinates[i][0],
+            'longitude': graph.coordinates[i][1]
+        } for i in path]
+    }
@@ -1,6 +1,9 @@
-from flask import render_template, flash, redirect, url_for, request, jsonify, json, session
+from flask import render_template, flash, redirect, url_for, request, jsonify, json, current_app
 from flask_login import login_user, logout_user, current_user, login_required
+from flask_socketio import join_room, leave_room, rooms
 import logging
+import hmac
+from functools import wraps
 from datetime import datetime, timedelta
 import os
 from sqlalchemy import exc as sql_exceptions
@@ -9,11 +12,36 @@ from urllib.parse import urlparse
 from forms import LoginForm, RegistrationForm, IncidentReportForm
 from incident_utils import get_incidents_for_map, get_incident_statistics
 from utils import send_notification, send_push_notification
+from risk_engine import record_incident
+import incident_stream
+import live_features
+import hotspots
+import route_graph
+import heatmaps
 from models import User, Incident, PushSubscription
-from database import db
+from database import db, read_session
+from offload import run_cpu_bound
+from bogota_clock import bogota_now
+from stations import station_troncales
 from sqlalchemy import func
 from sqlalchemy.sql import desc
 
+def metrics_access_required(view):
+    """
+    Acceso a las métricas internas: Authorization: Bearer METRICS_TOKEN, una IP
+    de METRICS_ALLOWED_IPS o, si no, un usuario autenticado (login_required).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        config = current_app.config
+        token = config.get('METRICS_TOKEN')
+        if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return view(*args, **kwargs)
+        if request.remote_addr in config.get('METRICS_ALLOWED_IPS', []):
+            return view(*args, **kwargs)
+        return login_required(view)(*args, **kwargs)
+    return wrapper
+
 def init_routes(app):
     @app.route('/test')
     def test():
@@ -60,7 +88,8 @@ def init_routes(app):
         form = LoginForm()
         if form.validate_on_submit():
             user = User.query.filter_by(username=form.username.data).first()
-            if user is None or not user.check_password(form.password.data):
+            # El hash de la contraseña (scrypt) se verifica en un hilo nativo: no bloquea el bucle de gevent
+            if user is None or not run_cpu_bound(user.check_password, form.password.data):
                 flash('Nombre de usuario o contraseña inválidos')
                 return redirect(url_for('login'))
             login_user(user, remember=form.remember_me.data)
@@ -75,9 +104,6 @@ def init_routes(app):
     @login_required
     def report_incident():
         app.logger.info(f"Accessing report_incident. User: {current_user}, Remote addr: {request.remote_addr}")
-        app.logger.debug(f"Request headers: {dict(request.headers)}")
-        app.logger.debug(f"Session data: {dict(session)}")
-        app.logger.debug(f"User authenticated: {current_user.is_authenticated}")
 
         form = IncidentReportForm()
         try:
@@ -92,7 +118,6 @@ def init_routes(app):
 
             if form.validate_on_submit():
                 app.logger.info("Form submitted and validated")
-                app.logger.debug(f"Form data: {request.form}")
 
                 latitude = request.form.get('latitude')
                 longitude = request.form.get('longitude')
@@ -104,22 +129,14 @@ def init_routes(app):
                     flash('Se requieren datos de ubicación y estación. Por favor, active la geolocalización.')
                     return redirect(url_for('report_incident'))
 
-                incident_date = form.incident_date.data or datetime.now().date()
-                incident_time = form.incident_time.data or datetime.now().time()
+                incident_date = form.incident_date.data or bogota_now().date()
+                incident_time = form.incident_time.data or bogota_now().time()
 
                 try:
-                    user = User.query.get(current_user.id)
-                    if not user:
-                        app.logger.error(f"Usuario no encontrado: ID {current_user.id}")
-                        flash('Error de autenticación. Por favor, inicie sesión nuevamente.')
-                        return redirect(url_for('login'))
-
-                    app.logger.debug(f"Converting latitude: {latitude} and longitude: {longitude} to float")
-
+                    # current_user ya fue validado por el user loader (user_cache)
                     try:
                         float_lat = float(latitude)
                         float_lon = float(longitude)
-                        app.logger.debug(f"Converted values - Lat: {float_lat}, Long: {float_lon}")
                     except ValueError as ve:
                         app.logger.error(f"Error converting coordinates to float: {str(ve)}")
                         flash('Error en el formato de las coordenadas. Por favor, intente de nuevo.')
@@ -135,15 +152,16 @@ def init_routes(app):
                         timestamp=datetime.combine(incident_date, incident_time)
                     )
 
-                    app.logger.debug(f"Created incident object: {incident.to_dict()}")
-
                     db.session.add(incident)
-                    app.logger.debug("Added incident to session, attempting commit")
                     db.session.commit()
                     app.logger.info("Incident saved successfully")
 
                     flash('¡Incidente reportado con éxito!')
                     send_notification(incident.incident_type, incident.timestamp.isoformat())
+                    record_incident(incident)
+                    incident_stream.record_incident(incident)
+                    live_features.record_incident(incident)
+                    hotspots.record_incident(incident)
                     return redirect(url_for('home'))
                 except ValueError as e:
                     db.session.rollback()
@@ -164,6 +182,64 @@ def init_routes(app):
             flash('Error al cargar la página. Por favor, intente de nuevo.')
             return redirect(url_for('home'))
 
+    @app.route('/api/incidents/bulk', methods=['POST'])
+    @login_required
+    def api_incidents_bulk():
+        """
+        Importación masiva de incidentes en NDJSON (application/x-ndjson) o CSV
+        (text/csv). Ver incident_ingest.py para el formato. Solo para los usuarios
+        de BULK_INGEST_USERS; el cuerpo, hasta BULK_INGEST_MAX_BYTES, se copia a
+        un archivo temporal desde el greenlet (E/S cooperativa) y los bloques se
+        leen de ahí en el threadpool (incident_ingest.ingest_chunks).
+        """
+        import shutil
+        import tempfile
+        from werkzeug.exceptions import RequestEntityTooLarge
+        from werkzeug.wsgi import LimitedStream
+        from incident_ingest import INGEST_CONFIG, ingest_chunks, read_chunks
+
+        if current_user.username not in app.config.get('BULK_INGEST_USERS', []):
+            app.logger.warning(f"Importación masiva denegada al usuario {current_user.id}")
+            return jsonify({'error': 'No autorizado para importar incidentes'}), 403
+
+        content_type = (request.mimetype or '').lower()
+        fmt = request.args.get('format') or ('csv' if content_type in ('text/csv', 'application/csv') else 'ndjson')
+        if fmt not in ('ndjson', 'csv'):
+            return jsonify({'error': f'Formato no soportado: {fmt}'}), 400
+
+        max_bytes = app.config.get('BULK_INGEST_MAX_BYTES')
+        if max_bytes and (request.content_length or 0) > max_bytes:
+            return jsonify({'error': f'El lote supera el máximo de {max_bytes} bytes'}), 413
+
+        summary = {}
+        stream = LimitedStream(request.stream, max_bytes, is_max=True) if max_bytes else request.stream
+        with tempfile.TemporaryFile() as body:
+            try:
+                shutil.copyfileobj(stream, body, INGEST_CONFIG['spool_block_bytes'])
+            except RequestEntityTooLarge:
+                return jsonify({'error': f'El lote supera el máximo de {max_bytes} bytes'}), 413
+            body.seek(0)
+            try:
+                ingest_chunks(read_chunks(body, fmt), current_user.id,
+                              dry_run=request.args.get('dry_run') == '1', summary=summary)
+            except ValueError as e:
+                app.logger.error(f"Lote de incidentes inválido después de {summary.get('inserted', 0)} "
+                                 f"insertados: {str(e)}")
+                # Los bloques anteriores al error ya se confirmaron
+                return jsonify({'error': 'Lote inválido', 'message': str(e),
+                                'inserted': summary.get('inserted', 0),
+                                'batches': summary.get('batches', 0)}), 400
+            except Exception as e:
+                app.logger.error(f"Error importando lote de incidentes: {str(e)}", exc_info=True)
+                return jsonify({'error': 'Error al importar el lote',
+                                'inserted': summary.get('inserted', 0),
+                                'batches': summary.get('batches', 0)}), 500
+
+        if not summary['read']:
+            return jsonify({'error': 'Lote vacío'}), 400
+        app.logger.info(f"Lote importado por {current_user.id}: {summary['inserted']}/{summary['read']} incidentes")
+        return jsonify(summary), 200
+
     @app.route('/logout')
     def logout():
         logout_user()
@@ -177,7 +253,7 @@ def init_routes(app):
         form = RegistrationForm()
         if form.validate_on_submit():
             user = User(username=form.username.data, email=form.email.data)
-            user.set_password(form.password.data)
+            run_cpu_bound(user.set_password, form.password.data)
             db.session.add(user)
             db.session.commit()
             flash('¡Felicidades, ahora estás registrado!')
@@ -199,6 +275,70 @@ def init_routes(app):
     def statistics():
         return render_template('statistics.html')
 
+    @app.route('/api/statistics/live')
+    @login_required
+    def api_live_statistics():
+        """
+        Top de estaciones, tipos y horas (histórico, última hora, día y semana) desde
+        incident_stream, sin consultas. Con ?station=&hour= (y opcionalmente
+        incident_type) agrega la frecuencia histórica estimada de esa combinación.
+        """
+        stream = incident_stream.get_incident_stream()
+        if stream is None:
+            return jsonify({'error': 'Estadísticas no disponibles'}), 503
+        result = stream.leaderboards(request.args.get('n', type=int))
+        station = request.args.get('station')
+        hour = request.args.get('hour', type=int)
+        if station and hour is not None:
+            incident_type = request.args.get('incident_type')
+            result['estimate'] = {'station': station, 'hour': hour, 'incident_type': incident_type,
+                                  'count': stream.estimate(station, hour, incident_type)}
+        return jsonify(result)
+
+    @app.route('/api/trip_risk')
+    @login_required
+    def api_trip_risk():
+        """
+        Camino de menor riesgo entre dos estaciones (?from=&to=&time=) sobre el
+        grafo troncal; time acepta ISO 8601, HH:MM o una hora (por defecto, ahora).
+        """
+        origin = request.args.get('from')
+        destination = request.args.get('to')
+        if not origin or not destination:
+            return jsonify({'error': 'Se requieren las estaciones de origen y destino'}), 400
+        try:
+            when = route_graph.parse_trip_time(request.args.get('time'))
+        except ValueError:
+            return jsonify({'error': 'Hora del viaje inválida'}), 400
+        try:
+            result = route_graph.trip_risk(origin, destination, when)
+        except Exception as e:
+            app.logger.error(f"Error calculando riesgo del viaje: {str(e)}", exc_info=True)
+            return jsonify({'error': 'Error al calcular la ruta'}), 500
+        if result is None:
+            return jsonify({'error': 'Estación desconocida o sin ruta entre ellas'}), 404
+        return jsonify(result)
+
+    @app.route('/api/heatmap/<layer>/<int:z>/<int:x>/<int:y>.png')
+    @login_required
+    def heatmap_tile(layer, z, x, y):
+        """
+        Tesela XYZ del mapa de calor precalculado ('incidents' o 'risk'); ?hour= o
+        ?weekday= eligen el corte de tiempo. No consulta la base de datos.
+        """
+        try:
+            tile = heatmaps.render_tile(layer, z, x, y, hour=request.args.get('hour', type=int),
+                                        weekday=request.args.get('weekday', type=int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            app.logger.error(f"Error generando tesela de mapa de calor: {str(e)}", exc_info=True)
+            return jsonify({'error': 'Error al generar la tesela'}), 500
+        if tile is None:
+            return jsonify({'error': 'Mapa de calor no disponible'}), 404
+        return app.response_class(tile, mimetype='image/png',
+                                  headers={'Cache-Control': 'private, max-age=300'})
+
     @app.route('/api/statistics')
     @login_required
     def api_statistics():
@@ -250,7 +390,7 @@ def init_routes(app):
     @login_required
     def model_insights():
         try:
-            from ml_models import get_model_insights
+            from prediction_service import get_model_insights
             insights = get_model_insights()
             return render_template('model_insights.html', insights=insights)
         except Exception as e:
@@ -278,39 +418,30 @@ def init_routes(app):
         """
         try:
             app.logger.info("Solicitud de predicciones API recibida")
-            from ml_models import get_cached_predictions
+            from prediction_service import get_cached_predictions
+            # Sin caché, get_cached_predictions espera a una única regeneración compartida
             predictions = get_cached_predictions()
 
             if not predictions:
-                app.logger.warning("No se encontraron predicciones en caché, generando nuevas")
-                from ml_models import generate_prediction_cache
-                predictions = generate_prediction_cache(hours_ahead=3)
-                if not predictions:
-                    app.logger.error("No se pudieron generar predicciones")
-                    return jsonify({
-                        'error': 'No se pudieron generar predicciones',
-                        'predictions': []
-                    }), 500
+                app.logger.error("No se pudieron generar predicciones")
+                return jsonify({
+                    'error': 'No se pudieron generar predicciones',
+                    'predictions': []
+                }), 500
 
-            with open('static/Estaciones_Troncales_de_TRANSMILENIO.geojson', 'r', encoding='utf-8') as f:
-                geojson_data = json.load(f)
-                station_to_troncal = {
-                    feature['properties']['nombre_estacion']: feature['properties'].get('troncal_estacion', 'N/A')
-                    for feature in geojson_data['features']
-                    if 'nombre_estacion' in feature['properties']
-                }
+            station_to_troncal = station_troncales()
 
             # Agregar información de troncal a cada predicción
             for prediction in predictions:
                 prediction['troncal'] = station_to_troncal.get(prediction['station'], 'N/A')
 
             app.logger.info(f"Retornando {len(predictions)} predicciones")
-            # Force prediction generation if empty
-            if not predictions:
-                app.logger.warning("Lista de predicciones vacía, forzando generación")
-                predictions = generate_prediction_cache(hours_ahead=3)
 
-            return jsonify(predictions)
+            # Las predicciones son deterministas: el cliente revalida con If-None-Match
+            response = jsonify(predictions)
+            response.add_etag()
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
 
         except Exception as e:
             app.logger.error(f"Error generando predicciones: {str(e)}", exc_info=True)
@@ -320,15 +451,84 @@ def init_routes(app):
                 'predictions': []
             }), 500
 
+    @app.route('/api/predictions/station')
+    @login_required
+    def api_station_prediction():
+        """
+        Predicción de riesgo para una estación y hora (?station=...&hour=...).
+        Incluye el nivel que respondió y su latencia (ver prediction_resolver).
+        """
+        station = request.args.get('station')
+        hour = request.args.get('hour', type=int)
+        if hour is None:
+            hour = bogota_now().hour
+        if not station or not 0 <= hour <= 23:
+            return jsonify({'error': 'Parámetros inválidos: station y hour (0-23)'}), 400
+
+        try:
+            from prediction_resolver import resolve_station_prediction
+            resolution = resolve_station_prediction(station, hour)
+            response = jsonify(dict(resolution.to_dict(), station=station, hour=hour))
+            response.headers['X-Prediction-Tier'] = resolution.tier
+            response.headers['X-Prediction-Latency-Ms'] = f"{resolution.latency_ms:.3f}"
+            return response
+        except Exception as e:
+            app.logger.error(f"Error resolviendo predicción de {station}: {str(e)}", exc_info=True)
+            return jsonify({'error': 'Error al generar la predicción'}), 500
+
+    @app.route('/api/metrics/pool')
+    @metrics_access_required
+    def api_pool_metrics():
+        """Estado del pool de conexiones: en uso, desborde, esperas y timeouts."""
+        try:
+            from database import pool_status, replica_router
+            return jsonify(dict(pool_status(), role=app.config.get('DB_ROLE'),
+                                replica=replica_router.status()))
+        except Exception as e:
+            app.logger.error(f"Error obteniendo métricas del pool: {str(e)}", exc_info=True)
+            return jsonify({'error': 'Error obteniendo métricas del pool'}), 500
+
+    @app.route('/metrics')
+    @metrics_access_required
+    def metrics():
+        """Métricas en formato de texto de Prometheus (ver instrumentation.py)."""
+        from instrumentation import render_metrics
+        return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    @app.route('/api/metrics/queries')
+    @metrics_access_required
+    def api_query_metrics():
+        """Sentencias SQL repetidas por solicitud (posibles N+1) detectadas por ruta."""
+        from instrumentation import n_plus_one_report
+        return jsonify(n_plus_one_report())
+
+    @app.route('/api/metrics/event_loop')
+    @metrics_access_required
+    def api_event_loop_metrics():
+        """Retraso del bucle de eventos de gevent y bloqueos recientes sobre el umbral."""
+        from offload import loop_monitor
+        return jsonify(loop_monitor.summary())
+
+    @app.route('/api/predictions/tiers')
+    @metrics_access_required
+    def api_prediction_tiers():
+        """Estadísticas por nivel de predicción: respuestas, timeouts, latencias y circuitos."""
+        from prediction_resolver import get_tier_stats
+        return jsonify(get_tier_stats())
+
     @app.route('/initialize_predictions')
+    @login_required
     def initialize_predictions():
         """
         Endpoint para forzar la generación inicial de predicciones.
+        Se une a una regeneración en curso y reutiliza un caché de menos de
+        PREDICTION_CACHE_CONFIG['min_regeneration_seconds'].
         """
         try:
             app.logger.info("Forzando generación inicial de predicciones")
-            from ml_models import generate_prediction_cache
-            predictions = generate_prediction_cache(hours_ahead=24)
+            from prediction_service import PREDICTION_CACHE_CONFIG, regenerate_predictions
+            predictions = regenerate_predictions(
+                hours_ahead=24, max_age=PREDICTION_CACHE_CONFIG['min_regeneration_seconds'])
             return jsonify({
                 'success': True,
                 'message': f'Generadas {len(predictions)} predicciones',
@@ -443,38 +643,41 @@ def init_routes(app):
             app.logger.info(f"- Estación: {station}")
             app.logger.info(f"- Tipo de incidente: {incident_type}")
 
-            query = Incident.query.order_by(Incident.timestamp.desc())
-
-            troncal_list = [t.strip() for t in troncal.split(',') if t.strip()]
-            station_list = [s.strip() for s in station.split(',') if s.strip()]
-            type_list = [t.strip() for t in incident_type.split(',') if t.strip()]
-
-            app.logger.info("Listas de filtros procesadas:")
-            app.logger.info(f"- Troncales: {troncal_list}")
-            app.logger.info(f"- Estaciones: {station_list}")
-            app.logger.info(f"- Tipos: {type_list}")
-
-            if troncal_list:
-                with open('static/Estaciones_Troncales_de_TRANSMILENIO.geojson', 'r', encoding='utf-8') as f:
-                    geojson_data = json.load(f)
-                    stations_for_troncal = [
-                        feature['properties']['nombre_estacion']
-                        for feature in geojson_data['features']
-                        if feature['properties'].get('troncal_estacion') in troncal_list
-                    ]
-                    app.logger.info(f"Estaciones encontradas para troncales: {stations_for_troncal}")
-                    query = query.filter(Incident.nearest_station.in_(stations_for_troncal))
-
-            if station_list:
-                app.logger.info(f"Filtrando por estaciones: {station_list}")
-                query = query.filter(Incident.nearest_station.in_(station_list))
-
-            if type_list:
-                app.logger.info(f"Filtrando por tipos: {type_list}")
-                query = query.filter(Incident.incident_type.in_(type_list))
-
-            incidents = query.limit(100).all()
+            # Feed de solo lectura: réplica si está disponible (ver database.read_session)
+            with read_session() as session:
+                query = session.query(Incident).order_by(Incident.timestamp.desc())
+
+                troncal_list = [t.strip() for t in troncal.split(',') if t.strip()]
+                station_list = [s.strip() for s in station.split(',') if s.strip()]
+                type_list = [t.strip() for t in incident_type.split(',') if t.strip()]
+
+                app.logger.info("Listas de filtros procesadas:")
+                app.logger.info(f"- Troncales: {troncal_list}")
+                app.logger.info(f"- Estaciones: {station_list}")
+                app.logger.info(f"- Tipos: {type_list}")
+
+                if troncal_list:
+                    with open('static/Estaciones_Troncales_de_TRANSMILENIO.geojson', 'r', encoding='utf-8') as f:
+                        geojson_data = json.load(f)
+                        stations_for_troncal = [
+                            feature['properties']['nombre_estacion']
+                            for feature in geojson_data['features']
+                            if feature['properties'].get('troncal_estacion') in troncal_list
+                        ]
+                        app.logger.info(f"Estaciones encontradas para troncales: {stations_for_troncal}")
+                        query = query.filter(Incident.nearest_station.in_(stations_for_troncal))
+
+                if station_list:
+                    app.logger.info(f"Filtrando por estaciones: {station_list}")
+                    query = query.filter(Incident.nearest_station.in_(station_list))
+
+                if type_list:
+                    app.logger.info(f"Filtrando por tipos: {type_list}")
+                    query = query.filter(Incident.incident_type.in_(type_list))
+
+                incidents = query.limit(100).all()
             app.logger.info(f"Total de incidentes encontrados: {len(incidents)}")
+            station_to_troncal = station_troncales()
 
             result = [{
                 'id': incident.id,
@@ -482,12 +685,7 @@ def init_routes(app):
                 'description': incident.description,
                 'nearest_station': incident.nearest_station,
                 'timestamp': incident.timestamp.isoformat(),
-                'troncal': next(
-                    (feature['properties'].get('troncal_estacion')
-                     for feature in json.load(open('static/Estaciones_Troncales_de_TRANSMILENIO.geojson', 'r', encoding='utf-8'))['features']
-                     if feature['properties'].get('nombre_estacion') == incident.nearest_station),
-                    'N/A'
-                )
+                'troncal': station_to_troncal.get(incident.nearest_station, 'N/A')
             } for incident in incidents]
 
             app.logger.info("Respuesta JSON generada exitosamente")
@@ -536,13 +734,35 @@ def init_routes(app):
             app.logger.error(f"Error al enviar notificación de prueba: {str(e)}")
             return jsonify({'error': str(e)}), 500
 
+    @socketio.on('subscribe_notifications')
+    def subscribe_notifications(data):
+        """Une el cliente a las salas de alertas de focos según su filtro de predictions.js."""
+        if not current_user.is_authenticated:
+            return {'success': False}
+        _leave_alert_rooms()
+        alert_rooms = hotspots.subscription_rooms((data or {}).get('filter'))
+        for room in alert_rooms:
+            join_room(room)
+        return {'success': True, 'rooms': len(alert_rooms)}
+
+    @socketio.on('unsubscribe_notifications')
+    def unsubscribe_notifications(data=None):
+        _leave_alert_rooms()
+        return {'success': True}
+
     return app
 
 
+def _leave_alert_rooms():
+    for room in rooms():
+        if room.startswith('alerts:'):
+            leave_room(room)
+
+
 def predict_station_risk(station, hour):
     try:
-        from ml_models import predict_station_risk as ml_predict_station_risk
-        return ml_predict_station_risk(station, hour)
+        from prediction_service import predict_station_risk as service_predict_station_risk
+        return service_predict_station_risk(station, hour)
     except Exception as e:
         logging.error(f"Error predicting risk for station {station}: {str(e)}")
         import random
@@ -551,8 +771,8 @@ def predict_station_risk(station, hour):
 
 def predict_incident_type(station, hour):
     try:
-        from ml_models import predict_incident_type as ml_predict_incident_type
-        return ml_predict_incident_type(station, hour)
+        from prediction_service import predict_incident_type as service_predict_incident_type
+        return service_predict_incident_type(station, hour)
     except Exception as e:
         logging.error(f"Error predicting incident type for station {station}: {str(e)}")
         incident_types = ['Hurto', 'Acoso', 'Accidente', 'Otro']
@@ -573,4 +793,9 @@ def get_all_stations():
 
 
 def get_route_information(route_id):
-    return {"route_id": route_id, "name": f"Ruta {route_id}"}
\ No newline at end of file
+    try:
+        route_info = route_graph.route_information(route_id)
+    except Exception as e:
+        logging.error(f"Error leyendo la ruta {route_id}: {str(e)}")
+        route_info = None
+    return route_info or {"route_id": route_id, "name": f"Ruta {route_id}"}
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+Cola de mensajes para Socket.IO entre procesos
+---------------------------------------------
+
+Con SOCKETIO_MESSAGE_QUEUE configurada, todos los workers web comparten la
+lista de clientes a través de la cola y cualquier proceso (programador de
+tareas, importación masiva) puede emitir a los navegadores con un emisor de
+solo escritura (emit_event), sin importar la aplicación Flask.
+
+URLs soportadas:
+- redis:// o rediss://   socketio.RedisManager (requiere redis)
+- sqlite:///ruta.db      SQLiteQueueManager: tabla compartida consultada por
+                         sondeo; sustituto local para pruebas y un solo host
+- amqp://, etc.          socketio.KombuManager (requiere kombu)
+
+Sin cola, emit_event usa el socketio de app.py (solo llega a los clientes
+conectados a ese mismo proceso).
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import socketio
+
+SOCKETIO_QUEUE_CONFIG = {
+    'channel': 'flask-socketio',     # Canal por defecto de Flask-SocketIO
+    'poll_interval_seconds': 0.05,   # Sondeo de la tabla en SQLiteQueueManager
+    'retention_seconds': 300,        # Mensajes más antiguos se eliminan al publicar
+    'cleanup_every': 100             # Publicaciones entre limpiezas
+}
+
+
+class SQLiteQueueManager(socketio.PubSubManager):
+    """
+    Pub/sub sobre una tabla SQLite compartida por los procesos de un mismo host.
+    Cada listener lee los mensajes con id mayor al último que procesó.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, url='sqlite:///socketio_queue.db', channel=SOCKETIO_QUEUE_CONFIG['channel'],
+                 write_only=False, logger=None, json=None, config=SOCKETIO_QUEUE_CONFIG):
+        self.path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+        self.config = config
+        self._published = 0
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS socketio_messages ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, '
+                         'created REAL NOT NULL, payload TEXT NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def _publish(self, data):
+        with closing(self._connect()) as conn:
+            conn.execute('INSERT INTO socketio_messages (channel, created, payload) VALUES (?, ?, ?)',
+                         (self.channel, time.time(), self.json.dumps(data)))
+            self._published += 1
+            if self._published % self.config['cleanup_every'] == 0:
+                conn.execute('DELETE FROM socketio_messages WHERE created < ?',
+                             (time.time() - self.config['retention_seconds'],))
+
+    def _listen(self):
+        with closing(self._connect()) as conn:
+            # Solo se entregan los mensajes publicados después de iniciar el listener
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_messages').fetchone()[0]
+            while True:
+                rows = conn.execute('SELECT id, payload FROM socketio_messages '
+                                    'WHERE id > ? AND channel = ? ORDER BY id',
+                                    (last_id, self.channel)).fetchall()
+                for message_id, payload in rows:
+                    last_id = message_id
+                    yield payload
+                time.sleep(self.config['poll_interval_seconds'])
+
+
+def create_client_manager(url, write_only=False, channel=SOCKETIO_QUEUE_CONFIG['channel']):
+    """
+    Client manager de Socket.IO para la URL de la cola.
+
+    Returns:
+        socketio.PubSubManager o None si no hay URL
+    """
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.RedisManager(url, channel=channel, write_only=write_only)
+    if url.startswith('sqlite:///'):
+        return SQLiteQueueManager(url, channel=channel, write_only=write_only)
+    return socketio.KombuManager(url, channel=channel, write_only=write_only)
+
+
+_emitter = None
+_emitter_lock = threading.Lock()
+_warned_local_emit = False
+
+
+def get_emitter():
+    """
+    Emisor de solo escritura hacia la cola configurada (uno por proceso).
+
+    Returns:
+        socketio.PubSubManager o None si no hay SOCKETIO_MESSAGE_QUEUE
+    """
+    global _emitter
+    if _emitter is None:
+        with _emitter_lock:
+            if _emitter is None:
+                _emitter = create_client_manager(os.environ.get('SOCKETIO_MESSAGE_QUEUE'), write_only=True)
+    return _emitter
+
+
+def emit_event(event, data, namespace='/', room=None):
+    """
+    Emite un evento a los navegadores desde cualquier proceso: por la cola si
+    está configurada; si no, con el socketio del proceso actual.
+    """
+    global _warned_local_emit
+    emitter = get_emitter()
+    if emitter is not None:
+        emitter.emit(event, data, namespace=namespace, room=room)
+        return
+
+    role = os.environ.get('DB_ROLE', 'web')
+    if role != 'web' and not _warned_local_emit:
+        _warned_local_emit = True
+        logging.warning(f"SOCKETIO_MESSAGE_QUEUE no configurada: '{event}' emitido desde el proceso "
+                        f"'{role}' no llega a los navegadores conectados al servidor web")
+    from app import socketio as app_socketio
+    app_socketio.emit(event, data, namespace=namespace, to=room)
@@ -15,6 +15,18 @@ function initMap() {
     L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
         attribution: '© OpenStreetMap contributors'
     }).addTo(map);
+
+    // Mapas de calor precalculados en el servidor (teselas PNG); los cortes
+    // horarios usan la hora de Bogotá, no la del navegador
+    const bogotaHour = Number(new Intl.DateTimeFormat('en-US', {
+        hour: 'numeric', hourCycle: 'h23', timeZone: 'America/Bogota'
+    }).format(new Date()));
+    const heatmapOptions = { opacity: 0.7, maxNativeZoom: 16, errorTileUrl: '' };
+    L.control.layers(null, {
+        'Densidad de incidentes': L.tileLayer('/api/heatmap/incidents/{z}/{x}/{y}.png', heatmapOptions),
+        'Riesgo predicho (hora actual)': L.tileLayer(
+            `/api/heatmap/risk/{z}/{x}/{y}.png?hour=${bogotaHour}`, heatmapOptions)
+    }).addTo(map);
 }
 
 async function loadMapData(filters = {}) {
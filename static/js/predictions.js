@@ -12,6 +12,10 @@ function initializeSocketHandlers() {
 
     socket.on('connect', function() {
         console.log('Conexión WebSocket establecida en predictions.js');
+        // Las salas de alertas se pierden al reconectar
+        if (localStorage.getItem('inAppNotificationsEnabled') === 'true') {
+            subscribeToAlerts();
+        }
         showInAppNotification({
             title: 'Conexión establecida',
             message: 'Conectado al servidor de predicciones en tiempo real',
@@ -37,6 +41,19 @@ function initializeSocketHandlers() {
         });
     });
 
+    socket.on('prediction_alert', function(alert) {
+        console.log('Alerta de foco recibida:', alert);
+        if (localStorage.getItem('inAppNotificationsEnabled') !== 'true') return;
+        const place = alert.station ? `Estación ${alert.station}` : `Troncal ${alert.troncal}`;
+        const detail = alert.observed !== undefined ?
+            ` (${alert.observed} reportes recientes, ${alert.expected} esperados)` : '';
+        showInAppNotification({
+            title: 'Alerta de seguridad',
+            message: `${place}: aumento de ${alert.incident_type}${detail}`,
+            type: 'warning'
+        });
+    });
+
     socket.on('predictions_updated', function(data) {
         console.log('Predicciones actualizadas recibidas:', data);
         if (data && data.predictions && Array.isArray(data.predictions)) {
@@ -382,14 +399,7 @@ function initializeNotifications() {
                 message: 'Recibirás alertas de predicciones en tiempo real',
                 type: 'success'
             });
-            socket.emit('subscribe_notifications', {
-                userId: getUserId(),
-                filter: {
-                    type: selectedFilter,
-                    troncales: selectedTroncales,
-                    estaciones: selectedEstaciones
-                }
-            });
+            subscribeToAlerts();
         } else {
             localStorage.setItem('inAppNotificationsEnabled', 'false');
             socket.emit('unsubscribe_notifications', { userId: getUserId() });
@@ -397,6 +407,18 @@ function initializeNotifications() {
     });
 }
 
+// Suscribirse a las alertas de focos con el filtro actual
+function subscribeToAlerts() {
+    socket.emit('subscribe_notifications', {
+        userId: getUserId(),
+        filter: {
+            type: selectedFilter,
+            troncales: selectedTroncales,
+            estaciones: selectedEstaciones
+        }
+    });
+}
+
 // Función para mostrar notificaciones in-app
 function showInAppNotification(notification) {
     const toastContainer = document.getElementById('toastContainer') || createToastContainer();
@@ -0,0 +1,44 @@
+"""
+Registro de estaciones troncales de TransMilenio.
+
+Lee el GeoJSON de estaciones una sola vez por proceso y asigna a cada estación
+un índice estable (el orden del archivo), usado por los modelos y tablas que
+trabajan con arreglos de NumPy indexados por estación.
+"""
+import json
+from functools import lru_cache
+
+STATIONS_GEOJSON = 'static/Estaciones_Troncales_de_TRANSMILENIO.geojson'
+
+
+@lru_cache(maxsize=1)
+def load_stations():
+    """
+    Returns:
+        tuple: Diccionarios con nombre, troncal, latitude y longitude de cada estación
+    """
+    with open(STATIONS_GEOJSON, 'r', encoding='utf-8') as f:
+        geojson_data = json.load(f)
+    return tuple({
+        'nombre': feature['properties']['nombre_estacion'],
+        'troncal': feature['properties'].get('troncal_estacion', 'N/A'),
+        'latitude': feature['geometry']['coordinates'][1],
+        'longitude': feature['geometry']['coordinates'][0]
+    } for feature in geojson_data['features']
+        if 'nombre_estacion' in feature['properties'])
+
+
+@lru_cache(maxsize=1)
+def station_index():
+    """Mapa nombre de estación -> índice en load_stations()."""
+    return {station['nombre']: i for i, station in enumerate(load_stations())}
+
+
+@lru_cache(maxsize=1)
+def station_troncales():
+    """Mapa nombre de estación -> troncal."""
+    return {station['nombre']: station['troncal'] for station in load_stations()}
+
+
+def station_names():
+    return [station['nombre'] for station in load_stations()]
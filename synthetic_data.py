@@ -0,0 +1,262 @@
+"""
+Generador de incidentes sintéticos para pruebas de carga y benchmarks
+--------------------------------------------------------------------
+
+Genera incidentes para las 149 estaciones del GeoJSON con distribuciones
+temporales y espaciales realistas, de forma vectorizada y reproducible por
+semilla (misma semilla y parámetros -> mismos datos):
+
+- Estaciones: pesos Gamma por estación y un factor por troncal (pocas
+  estaciones concentran la mayoría de incidentes)
+- Tiempo: perfil horario con picos de mañana y tarde, más incidentes en días
+  hábiles y una tendencia lineal opcional a lo largo del rango de fechas
+- Tipo de incidente: pesos por franja horaria (fallback_tables) perturbados
+  por estación con una Dirichlet
+- Coordenadas: dispersión normal de ~40 m alrededor de la estación
+
+Los datos se generan por bloques de SYNTHETIC_CONFIG['chunk_size'] filas
+(memoria acotada para cualquier cantidad de filas) y se escriben a la base de
+datos (COPY en PostgreSQL, executemany en otros motores), a CSV o a Parquet
+(requiere pyarrow).
+
+Uso (desde la raíz del proyecto):
+    python synthetic_data.py --rows 1000000 --start 2024-01-01 --end 2025-01-01 --output db
+    python synthetic_data.py --rows 100000000 --output parquet --path data/incidents.parquet
+    python synthetic_data.py --rows 100000 --start 2026-01-01 --end now --seed 7
+"""
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+from stations import load_stations
+
+SYNTHETIC_CONFIG = {
+    'rows': 1_000_000,
+    'chunk_size': 1_000_000,
+    'seed': 42,
+    'start': '2024-01-01',
+    'end': '2025-01-01',
+    'station_concentration': 0.7,   # Forma Gamma: menor -> más concentrado en pocas estaciones
+    'type_concentration': 50.0,     # Dirichlet: mayor -> tipos más parecidos a los pesos base
+    'trend': 0.2,                   # Crecimiento relativo entre el inicio y el fin del rango
+    'coordinate_jitter_deg': 0.0004
+}
+
+# Intensidad relativa por hora del día (picos 6-9 y 16-20, valle nocturno)
+HOURLY_PROFILE = np.array([
+    0.25, 0.15, 0.10, 0.10, 0.20, 0.55,   # 00-05
+    0.95, 1.00, 0.90, 0.70, 0.55, 0.55,   # 06-11
+    0.60, 0.60, 0.55, 0.65, 0.85, 1.00,   # 12-17
+    1.00, 0.90, 0.70, 0.50, 0.40, 0.30    # 18-23
+])
+WEEKDAY_PROFILE = np.array([1.1, 1.05, 1.05, 1.05, 1.15, 0.8, 0.6])
+
+
+class SyntheticIncidentModel:
+    """Distribuciones fijas por semilla: estaciones, franjas horarias y tipos."""
+
+    def __init__(self, start, end, seed=SYNTHETIC_CONFIG['seed'], config=SYNTHETIC_CONFIG):
+        from rollups import incident_types
+        from fallback_tables import heuristic_profile
+
+        self.config = config
+        self.seed = seed
+        self.start = np.datetime64(start, 'h')
+        self.n_hours = int((np.datetime64(end, 'h') - self.start).astype(np.int64))
+        if self.n_hours <= 0:
+            raise ValueError("El rango de fechas debe tener al menos una hora")
+
+        rng = np.random.default_rng([seed, 0])
+        stations = load_stations()
+        self.station_names = np.array([s['nombre'] for s in stations], dtype=object)
+        self.station_lat = np.array([s['latitude'] for s in stations])
+        self.station_lon = np.array([s['longitude'] for s in stations])
+        self.types = np.array(incident_types(), dtype=object)
+
+        troncales, troncal_idx = np.unique([s['troncal'] for s in stations], return_inverse=True)
+        troncal_factor = rng.lognormal(0.0, 0.4, len(troncales))[troncal_idx]
+        weights = rng.gamma(config['station_concentration'], 1.0, len(stations)) * troncal_factor
+        self.station_p = weights / weights.sum()
+
+        # Intensidad de cada hora del rango: perfil horario x día de la semana x tendencia
+        hours = self.start + np.arange(self.n_hours)
+        hour_of_day = (hours.astype(np.int64) % 24)
+        # 1970-01-01 fue jueves (weekday 3)
+        day_of_week = ((hours.astype('datetime64[D]').astype(np.int64) + 3) % 7)
+        trend = 1.0 + config['trend'] * np.linspace(0.0, 1.0, self.n_hours)
+        intensity = HOURLY_PROFILE[hour_of_day] * WEEKDAY_PROFILE[day_of_week] * trend
+        self.hour_p = intensity / intensity.sum()
+
+        # Distribución de tipos por (estación, hora del día)
+        _, type_weights = heuristic_profile(list(self.types))
+        type_weights = type_weights / type_weights.sum(axis=1, keepdims=True)
+        station_mix = rng.dirichlet(np.full(len(self.types), config['type_concentration'] / len(self.types)),
+                                    len(stations))
+        mix = type_weights[None, :, :] * station_mix[:, None, :]
+        mix /= mix.sum(axis=2, keepdims=True)
+        self.type_cdf = np.cumsum(mix, axis=2)
+        self.type_cdf[:, :, -1] = 1.0
+
+    def sample(self, n, chunk_index=0):
+        """
+        Genera `n` incidentes. Cada bloque usa su propio generador derivado de
+        (semilla, índice de bloque), así que el resultado no depende del orden.
+
+        Returns:
+            pandas.DataFrame: incident_type, description, latitude, longitude,
+                timestamp, nearest_station
+        """
+        import pandas as pd
+
+        rng = np.random.default_rng([self.seed, chunk_index + 1])
+        station_idx = rng.choice(len(self.station_p), size=n, p=self.station_p)
+        hour_idx = rng.choice(self.n_hours, size=n, p=self.hour_p)
+        seconds = rng.integers(0, 3600, size=n)
+        timestamps = (self.start + hour_idx.astype('timedelta64[h]')).astype('datetime64[s]') \
+            + seconds.astype('timedelta64[s]')
+        hour_of_day = (self.start.astype(np.int64) + hour_idx) % 24
+
+        u = rng.random(n)
+        type_idx = (self.type_cdf[station_idx, hour_of_day] < u[:, None]).sum(axis=1)
+        jitter = self.config['coordinate_jitter_deg']
+
+        return pd.DataFrame({
+            'incident_type': self.types[type_idx],
+            'description': None,
+            'latitude': self.station_lat[station_idx] + rng.normal(0.0, jitter, n),
+            'longitude': self.station_lon[station_idx] + rng.normal(0.0, jitter, n),
+            'timestamp': pd.to_datetime(timestamps),
+            'nearest_station': self.station_names[station_idx]
+        })
+
+    def chunks(self, rows, chunk_size=None):
+        chunk_size = chunk_size or self.config['chunk_size']
+        for chunk_index, offset in enumerate(range(0, rows, chunk_size)):
+            yield self.sample(min(chunk_size, rows - offset), chunk_index)
+
+
+def write_database(model, rows, chunk_size, user_id=None, replace=False):
+    """
+    Inserta los incidentes generados (COPY/executemany por bloque).
+    Debe llamarse dentro del contexto de la aplicación Flask.
+    """
+    from database import db
+    from incident_ingest import insert_batch
+    from models import Incident, User
+
+    if user_id is None:
+        user = User.query.order_by(User.id).first()
+        if user is None:
+            user = User(username="sample_user", email="sample@example.com")
+            user.set_password("sample_password")
+            db.session.add(user)
+            db.session.commit()
+        user_id = user.id
+    if replace:
+        logging.info("Eliminando incidentes existentes...")
+        Incident.query.delete()
+        db.session.commit()
+
+    inserted = 0
+    for chunk in model.chunks(rows, chunk_size):
+        chunk['user_id'] = user_id
+        inserted += insert_batch(chunk)
+        logging.info(f"Insertados {inserted}/{rows} incidentes")
+    return inserted
+
+
+def write_file(model, rows, chunk_size, path, fmt):
+    """Escribe los incidentes a CSV o Parquet por bloques."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    written = 0
+    writer = None
+    try:
+        for chunk in model.chunks(rows, chunk_size):
+            if fmt == 'csv':
+                chunk.to_csv(path, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+            else:
+                try:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                except ImportError:
+                    raise RuntimeError("La salida Parquet requiere pyarrow (pip install pyarrow)")
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema, compression='zstd')
+                writer.write_table(table)
+            written += len(chunk)
+            logging.info(f"Escritos {written}/{rows} incidentes en {path}")
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+
+def generate(rows=SYNTHETIC_CONFIG['rows'], start=SYNTHETIC_CONFIG['start'], end=SYNTHETIC_CONFIG['end'],
+             seed=SYNTHETIC_CONFIG['seed'], output='db', path=None, chunk_size=None,
+             user_id=None, replace=False):
+    """
+    Genera `rows` incidentes entre start y end y los escribe en `output`
+    ('db', 'csv' o 'parquet').
+
+    Returns:
+        dict: Filas escritas, duración y filas por segundo
+    """
+    model = SyntheticIncidentModel(start, end, seed)
+    chunk_size = chunk_size or SYNTHETIC_CONFIG['chunk_size']
+    started = time.perf_counter()
+    if output == 'db':
+        written = write_database(model, rows, chunk_size, user_id, replace)
+    elif output in ('csv', 'parquet'):
+        if not path:
+            raise ValueError(f"La salida {output} requiere --path")
+        written = write_file(model, rows, chunk_size, path, output)
+    else:
+        raise ValueError(f"Salida no soportada: {output}")
+    seconds = time.perf_counter() - started
+    return {
+        'rows': written,
+        'seed': seed,
+        'start': str(start),
+        'end': str(end),
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(written / seconds, 1) if seconds else None
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Generador de incidentes sintéticos")
+    parser.add_argument('--rows', type=int, default=SYNTHETIC_CONFIG['rows'])
+    parser.add_argument('--start', default=SYNTHETIC_CONFIG['start'])
+    parser.add_argument('--end', default=SYNTHETIC_CONFIG['end'],
+                        help="Fin del rango; 'now' usa la hora actual de Bogotá (los datos "
+                             "dependen entonces de la hora de ejecución, no solo de la semilla)")
+    parser.add_argument('--seed', type=int, default=SYNTHETIC_CONFIG['seed'])
+    parser.add_argument('--chunk-size', type=int, default=SYNTHETIC_CONFIG['chunk_size'])
+    parser.add_argument('--output', choices=['db', 'csv', 'parquet'], default='db')
+    parser.add_argument('--path', help="Archivo de salida para csv/parquet")
+    parser.add_argument('--user-id', type=int, default=None)
+    parser.add_argument('--replace', action='store_true',
+                        help="Eliminar los incidentes existentes antes de insertar")
+    args = parser.parse_args()
+    if args.end == 'now':
+        from bogota_clock import bogota_now
+        args.end = bogota_now().strftime('%Y-%m-%dT%H')
+
+    kwargs = dict(rows=args.rows, start=args.start, end=args.end, seed=args.seed, output=args.output,
+                  path=args.path, chunk_size=args.chunk_size, user_id=args.user_id, replace=args.replace)
+    if args.output == 'db':
+        os.environ.setdefault('DB_ROLE', 'scheduler')
+        from app import app
+        from database import create_tables
+        # Permite generar sobre una base nueva (p. ej. la de benchmarks)
+        create_tables(app)
+        with app.app_context():
+            result = generate(**kwargs)
+    else:
+        result = generate(**kwargs)
+    logging.info(f"Generación terminada: {result}")
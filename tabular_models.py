@@ -0,0 +1,322 @@
+"""
+Modelo Tabular (Gradient Boosting) para TransMilenio
+---------------------------------------------------
+
+Alternativa rápida al modelo RNN-LSTM:
+- Los incidentes se agregan en una grilla horaria (estaciones × horas)
+- Cada celda (estación, hora) se describe con variables de calendario y con
+  conteos rezagados al menos una semana (lag_168, lag_336, medias móviles),
+  de modo que un pronóstico de hasta 168 horas solo use datos ya observados
+- Un clasificador LightGBM estima la probabilidad de al menos un incidente
+
+El pronóstico de todas las estaciones para toda la semana se calcula con una
+sola llamada vectorizada a `predict`. pandas y LightGBM se importan al usarse.
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from bogota_clock import bogota_now
+from database import read_session
+from models import Incident
+from stations import load_stations, station_index
+
+GBM_CONFIG = {
+    'model_path': 'models/gbm_model.txt',
+    'metadata_path': 'models/gbm_model.json',
+    'history_hours': 168 * 5,      # Historia necesaria para las variables rezagadas
+    'validation_split': 0.2,
+    'num_boost_round': 200,
+    'early_stopping_rounds': 20,
+    'params': {
+        'objective': 'binary',
+        'metric': 'auc',
+        'learning_rate': 0.05,
+        'num_leaves': 31,
+        'min_data_in_leaf': 50,
+        'feature_fraction': 0.9,
+        'bagging_fraction': 0.8,
+        'bagging_freq': 1,
+        'verbose': -1
+    }
+}
+
+FEATURE_COLUMNS = [
+    'station_idx', 'hour', 'day_of_week', 'month',
+    'lag_168', 'lag_336', 'same_hour_mean_4w',
+    'rolling_mean_24', 'rolling_mean_168'
+]
+
+# Los rezagos más cortos son de una semana para poder pronosticar 168 horas
+MIN_LAG = 168
+_PAD = 168 * 4 + 24
+
+
+def load_incident_frame(since=None):
+    """
+    Lee únicamente las columnas necesarias de la tabla de incidentes.
+
+    Returns:
+        pandas.DataFrame: Columnas timestamp, nearest_station, incident_type
+    """
+    import pandas as pd
+
+    with read_session() as session:
+        query = session.query(Incident.timestamp, Incident.nearest_station, Incident.incident_type)
+        if since is not None:
+            query = query.filter(Incident.timestamp >= since)
+        rows = query.order_by(Incident.timestamp).all()
+    return pd.DataFrame(rows, columns=['timestamp', 'nearest_station', 'incident_type'])
+
+
+def build_hourly_counts(incidents, start, end):
+    """
+    Agrega incidentes en una grilla horaria [estaciones, horas] entre start y end.
+
+    Returns:
+        numpy.ndarray: Conteos float32 de forma (n_estaciones, n_horas)
+    """
+    import pandas as pd
+
+    index = station_index()
+    n_hours = int((end - start) / timedelta(hours=1)) + 1
+    counts = np.zeros((len(index), n_hours), dtype=np.float32)
+    if incidents.empty:
+        return counts
+
+    station_idx = incidents['nearest_station'].map(index)
+    hour_idx = ((incidents['timestamp'].dt.floor('h') - start) / pd.Timedelta(hours=1))
+    valid = station_idx.notna() & (hour_idx >= 0) & (hour_idx < n_hours)
+    np.add.at(counts,
+              (station_idx[valid].astype(np.int64).values, hour_idx[valid].astype(np.int64).values),
+              1)
+    return counts
+
+
+def build_features(counts, start, target_hours):
+    """
+    Construye la matriz de variables para todas las estaciones y horas objetivo.
+
+    Args:
+        counts (numpy.ndarray): Grilla (n_estaciones, n_horas) desde `start`
+        start (datetime): Hora correspondiente a la columna 0
+        target_hours (numpy.ndarray): Índices de hora (pueden exceder la grilla
+            hasta en MIN_LAG horas para pronósticos)
+
+    Returns:
+        numpy.ndarray: Matriz (n_estaciones * n_objetivos, n_variables) ordenada
+            por estación y luego por hora
+    """
+    import pandas as pd
+
+    n_stations = counts.shape[0]
+    target_hours = np.asarray(target_hours, dtype=np.int64)
+
+    # Rellenar con ceros a la izquierda para rezagos anteriores a la historia
+    padded = np.concatenate([np.zeros((n_stations, _PAD), dtype=np.float32), counts], axis=1)
+    cumulative = np.concatenate([np.zeros((n_stations, 1), dtype=np.float64),
+                                 np.cumsum(padded, axis=1, dtype=np.float64)], axis=1)
+    t = target_hours + _PAD
+
+    def window_mean(end_offset, length):
+        end_idx = t - end_offset + 1
+        return ((cumulative[:, end_idx] - cumulative[:, end_idx - length]) / length).astype(np.float32)
+
+    lag_168 = padded[:, t - 168]
+    lag_336 = padded[:, t - 336]
+    same_hour_mean = (lag_168 + lag_336 + padded[:, t - 504] + padded[:, t - 672]) / 4
+    rolling_24 = window_mean(MIN_LAG, 24)
+    rolling_168 = window_mean(MIN_LAG, 168)
+
+    times = pd.DatetimeIndex([start + timedelta(hours=int(h)) for h in target_hours])
+    calendar = np.stack([times.hour, times.dayofweek, times.month], axis=1).astype(np.float32)
+    n_targets = len(target_hours)
+
+    features = np.empty((n_stations, n_targets, len(FEATURE_COLUMNS)), dtype=np.float32)
+    features[:, :, 0] = np.arange(n_stations, dtype=np.float32)[:, None]
+    features[:, :, 1:4] = calendar[None, :, :]
+    features[:, :, 4] = lag_168
+    features[:, :, 5] = lag_336
+    features[:, :, 6] = same_hour_mean
+    features[:, :, 7] = rolling_24
+    features[:, :, 8] = rolling_168
+    return features.reshape(n_stations * n_targets, len(FEATURE_COLUMNS))
+
+
+def build_training_set(incidents):
+    """
+    Returns:
+        tuple: (X, y, start, target_hours) con una fila por (estación, hora) de la historia
+    """
+    start = incidents['timestamp'].min().floor('h').to_pydatetime()
+    end = incidents['timestamp'].max().floor('h').to_pydatetime()
+    counts = build_hourly_counts(incidents, start, end)
+
+    # Las primeras MIN_LAG horas no tienen rezagos observados
+    target_hours = np.arange(min(MIN_LAG, counts.shape[1] - 1), counts.shape[1])
+    X = build_features(counts, start, target_hours)
+    y = (counts[:, target_hours] > 0).astype(np.float32).reshape(-1)
+    return X, y, start, target_hours
+
+
+def _time_ordered_split(X, y, n_targets, validation_split):
+    """Separa validación por tiempo: las últimas horas de cada estación."""
+    split_hour = int(n_targets * (1 - validation_split))
+    hours = np.tile(np.arange(n_targets), len(X) // n_targets)
+    train = hours < split_hour
+    return X[train], y[train], X[~train], y[~train]
+
+
+def train_gbm_model():
+    """
+    Entrena el modelo LightGBM con la historia completa de incidentes.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Returns:
+        dict: Metadatos del modelo (métricas, tiempos), o None si falla
+    """
+    try:
+        import lightgbm as lgb
+        from sklearn.metrics import roc_auc_score
+
+        incidents = load_incident_frame()
+        if incidents.empty:
+            logging.error("No incidents available to train the GBM model")
+            return None
+
+        start_time = time.perf_counter()
+        X, y, start, target_hours = build_training_set(incidents)
+        X_train, y_train, X_val, y_val = _time_ordered_split(
+            X, y, len(target_hours), GBM_CONFIG['validation_split'])
+        logging.info(f"GBM training data: X_train={X_train.shape}, X_val={X_val.shape}, "
+                     f"positive rate={y.mean():.4f}")
+
+        train_set = lgb.Dataset(X_train, y_train, feature_name=FEATURE_COLUMNS,
+                                categorical_feature=['station_idx'])
+        val_set = lgb.Dataset(X_val, y_val, reference=train_set)
+        booster = lgb.train(
+            GBM_CONFIG['params'], train_set,
+            num_boost_round=GBM_CONFIG['num_boost_round'],
+            valid_sets=[val_set],
+            callbacks=[lgb.early_stopping(GBM_CONFIG['early_stopping_rounds'], verbose=False)]
+        )
+        train_seconds = time.perf_counter() - start_time
+
+        try:
+            val_auc = float(roc_auc_score(y_val, booster.predict(X_val)))
+        except ValueError:
+            val_auc = None
+
+        os.makedirs(os.path.dirname(GBM_CONFIG['model_path']), exist_ok=True)
+        booster.save_model(GBM_CONFIG['model_path'])
+
+        metadata = {
+            'model_version': 'gbm',
+            'trained_at': datetime.now().isoformat(),
+            'history_start': start.isoformat(),
+            'training_rows': int(len(X_train)),
+            'best_iteration': int(booster.best_iteration or booster.current_iteration()),
+            'train_seconds': round(train_seconds, 3),
+            'val_auc': val_auc,
+            'feature_columns': FEATURE_COLUMNS,
+            'stations': [station['nombre'] for station in load_stations()]
+        }
+        with open(GBM_CONFIG['metadata_path'], 'w') as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False)
+
+        logging.info(f"GBM model trained in {train_seconds:.2f}s - validation AUC: {val_auc}")
+        return metadata
+
+    except Exception as e:
+        logging.error(f"Error training GBM model: {str(e)}", exc_info=True)
+        return None
+
+
+_booster_cache = {}
+
+
+def load_gbm_model():
+    """
+    Carga el modelo LightGBM guardado (una vez por proceso y por versión del archivo).
+
+    Returns:
+        lightgbm.Booster o None si no hay modelo entrenado
+    """
+    path = GBM_CONFIG['model_path']
+    if not os.path.exists(path):
+        return None
+
+    mtime = os.path.getmtime(path)
+    cached = _booster_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    import lightgbm as lgb
+    booster = lgb.Booster(model_file=path)
+    _booster_cache[path] = (mtime, booster)
+    return booster
+
+
+def gbm_model_available():
+    return os.path.exists(GBM_CONFIG['model_path'])
+
+
+def predict_week_ahead(hours_ahead=168, now=None):
+    """
+    Pronostica el riesgo de todas las estaciones para las próximas horas
+    con una sola llamada vectorizada al modelo.
+    Debe llamarse dentro del contexto de la aplicación Flask.
+
+    Args:
+        hours_ahead (int): Horas a pronosticar (máximo 168)
+        now (datetime): Origen del pronóstico (hora local de Bogotá, sin zona)
+
+    Returns:
+        tuple: (lista de datetimes objetivo, matriz de riesgo (n_estaciones, hours_ahead),
+            tipos más probables por estación), o None si no hay modelo
+    """
+    booster = load_gbm_model()
+    if booster is None:
+        return None
+
+    hours_ahead = min(hours_ahead, MIN_LAG)
+    if now is None:
+        now = bogota_now()
+    origin = now.replace(minute=0, second=0, microsecond=0)
+    start = origin - timedelta(hours=GBM_CONFIG['history_hours'])
+
+    incidents = load_incident_frame(since=start)
+    counts = build_hourly_counts(incidents, start, origin)
+
+    # La última columna de la grilla es la hora actual (origin)
+    target_hours = np.arange(counts.shape[1] - 1, counts.shape[1] - 1 + hours_ahead)
+    X = build_features(counts, start, target_hours)
+    risk = booster.predict(X).reshape(counts.shape[0], hours_ahead)
+
+    times = [origin + timedelta(hours=h) for h in range(hours_ahead)]
+    return times, risk, most_common_types(incidents)
+
+
+def most_common_types(incidents):
+    """
+    Tipo de incidente más frecuente por estación (o el más frecuente global
+    para estaciones sin historia).
+
+    Returns:
+        list: Un tipo de incidente por estación, en el orden de load_stations()
+    """
+    from prediction_service import VALID_INCIDENT_TYPES
+
+    default_type = VALID_INCIDENT_TYPES[0]
+    if incidents.empty:
+        return [default_type] * len(load_stations())
+
+    default_type = incidents['incident_type'].mode().iat[0]
+    by_station = (incidents.groupby('nearest_station')['incident_type']
+                  .agg(lambda types: types.mode().iat[0]))
+    return [by_station.get(name, default_type) for name in station_index()]
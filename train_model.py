@@ -8,22 +8,30 @@ import sys
 import logging
 from dotenv import load_dotenv
 from flask import Flask
+from config import Config, engine_options
 from database import db, init_db
 import ml_models
+import prediction_service
 import json
 from datetime import datetime
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(f'training_log_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log')
-    ]
-)
 logger = logging.getLogger(__name__)
 
+def configure_logging():
+    """
+    Configura el logging del entrenamiento.
+    Se llama solo desde __main__ para que los procesos trabajadores de la
+    validación cruzada (que reimportan este módulo) no creen su propio log.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler(f'training_log_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log')
+        ]
+    )
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -31,6 +39,9 @@ load_dotenv()
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options('training', app.config['SQLALCHEMY_DATABASE_URI'])
+app.config['SQLALCHEMY_BINDS'] = Config.SQLALCHEMY_BINDS
+app.config['REPLICA_MAX_LAG_SECONDS'] = Config.REPLICA_MAX_LAG_SECONDS
 init_db(app)
 
 def ensure_model_directory():
@@ -89,12 +100,7 @@ def validate_model():
             logger.info("Validación cruzada completada con éxito")
             logger.info(f"Precisión promedio: {metrics['accuracy']:.4f} ± {metrics['std_accuracy']:.4f}")
             logger.info(f"AUC promedio: {metrics['auc']:.4f} ± {metrics['std_auc']:.4f}")
-            
-            # Guardar métricas de validación
-            with open('models/validation_metrics.json', 'w') as f:
-                json.dump(metrics, f, indent=2)
-            logger.info("Métricas de validación guardadas")
-            
+            # cross_validate_model guarda las métricas por partición en models/validation_metrics.json
             return True
         else:
             logger.error("La validación cruzada falló")
@@ -104,7 +110,7 @@ def generate_new_predictions():
     """Genera nuevas predicciones usando el modelo entrenado"""
     with app.app_context():
         logger.info("Generando nuevas predicciones con el modelo entrenado...")
-        predictions = ml_models.generate_prediction_cache(hours_ahead=48)
+        predictions = prediction_service.regenerate_predictions(hours_ahead=48)
         
         if predictions:
             logger.info(f"Se generaron {len(predictions)} predicciones exitosamente")
@@ -114,6 +120,7 @@ def generate_new_predictions():
             return False
 
 if __name__ == "__main__":
+    configure_logging()
     logger.info("=== INICIANDO PROCESO DE ENTRENAMIENTO DEL MODELO ===")
     
     # Paso 1: Entrenar y guardar el modelo
@@ -0,0 +1,146 @@
+"""
+Caché del user loader de Flask-Login
+-----------------------------------
+
+load_user se ejecuta en cada solicitud autenticada (incluido el sondeo de
+predictions.js cada minuto por cliente). En lugar de consultar la tabla users
+cada vez, se guarda una copia ligera del usuario (CachedUser: id, username y
+email, sin la sesión de SQLAlchemy ni el hash de la contraseña) en un caché
+LRU con TTL y tamaño máximo por proceso.
+
+- Las actualizaciones y eliminaciones de User en este proceso invalidan la
+  entrada (eventos de SQLAlchemy); en otros workers el TTL acota cuánto
+  puede durar una copia desactualizada.
+- Aciertos y fallos se cuentan en cache_requests_total{cache="user_loader"};
+  tamaño, expiraciones y desalojos en user_cache_stats() y /metrics.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from instrumentation import record_cache
+
+USER_CACHE_CONFIG = {
+    'max_size': int(os.environ.get('USER_CACHE_SIZE', 10000)),
+    'ttl_seconds': float(os.environ.get('USER_CACHE_TTL_SECONDS', 300))
+}
+
+
+class CachedUser(UserMixin):
+    """Copia de solo lectura de un User para current_user."""
+
+    __slots__ = ('id', 'username', 'email')
+
+    def __init__(self, id, username, email):
+        self.id = id
+        self.username = username
+        self.email = email
+
+    @classmethod
+    def from_model(cls, user):
+        return cls(user.id, user.username, user.email)
+
+    def __repr__(self):
+        return f"<User {self.username}>"
+
+
+class TTLCache:
+    """LRU con tiempo de vida por entrada; seguro entre hilos y greenlets."""
+
+    def __init__(self, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+user_cache = TTLCache(USER_CACHE_CONFIG['max_size'], USER_CACHE_CONFIG['ttl_seconds'])
+
+
+def load_cached_user(user_id):
+    """
+    User loader de Flask-Login con caché.
+
+    Returns:
+        CachedUser o None si el usuario no existe
+    """
+    from database import db
+    from models import User
+
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    cached = user_cache.get(user_id)
+    record_cache('user_loader', cached is not None)
+    if cached is not None:
+        return cached
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    snapshot = CachedUser.from_model(user)
+    user_cache.set(user_id, snapshot)
+    return snapshot
+
+
+def user_cache_stats():
+    return {
+        'size': len(user_cache),
+        'max_size': user_cache.max_size,
+        'ttl_seconds': user_cache.ttl_seconds,
+        'expirations': user_cache.expirations,
+        'evictions': user_cache.evictions
+    }
+
+
+def _invalidate_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+
+def register_user_cache_events():
+    """Invalida la copia en caché cuando un User se actualiza o elimina en este proceso."""
+    from models import User
+
+    for name in ('after_update', 'after_delete'):
+        if not event.contains(User, name, _invalidate_user):
+            event.listen(User, name, _invalidate_user)
@@ -4,7 +4,6 @@ import logging
 from datetime import datetime
 from models import Notification
 from database import db
-from pywebpush import webpush
 from contextlib import contextmanager
 import os
 
@@ -36,6 +35,8 @@ def send_push_notification(incident_type, timestamp, nearest_station, device_tok
         # Si hay token de dispositivo, enviar push notification
         if device_token:
             try:
+                # pywebpush (y cryptography) solo se cargan al enviar una notificación
+                from pywebpush import webpush
                 webpush(
                     subscription_info=json.loads(device_token),
                     data=json.dumps(notification_data),